@@ -0,0 +1,266 @@
+import argparse
+import calendar
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from money_rider import Ledger, RangeIndex, make_day, open_store, range_analytics
+
+APP_PATH = Path(__file__).with_name("money-rider (3).py")
+EXPENSE_LABELS = ("Gas", "Oil change", "Parking", "Toll", "Food", "Phone load", "Motor rent")
+
+
+def synthetic_day_totals(day_count, seed=0):
+    # Amounts in centavos, like the ledger stores them
+    rng = random.Random(seed)
+    start = date(2000, 1, 1)
+    return [
+        ((start + timedelta(days=offset)).isoformat(),
+         rng.randint(20000, 200000),
+         rng.randint(5000, 80000))
+        for offset in range(day_count)
+    ]
+
+
+def synthetic_financial_data(years, entries_per_day, users, seed=0):
+    # Same shape as financial_data: {"YYYY-MM-DD": {"income", "expenses", "entries", "expense_entries"}}
+    rng = random.Random(seed)
+    customers = [f"Customer {number}" for number in range(1, 200 * users + 1)]
+    start = date(2020, 1, 1)
+    days = {}
+    for offset in range(int(365 * years)):
+        date_str = (start + timedelta(days=offset)).isoformat()
+        entries = [(rng.choice(customers), rng.randint(2000, 25000)) for _ in range(entries_per_day)]
+        expense_entries = [
+            (rng.choice(EXPENSE_LABELS), rng.randint(1000, 30000))
+            for _ in range(max(1, entries_per_day // 5))
+        ]
+        days[date_str] = make_day(entries, expense_entries)
+    accounts = {f"rider{number}": "password" for number in range(1, users + 1)}
+    return accounts, days
+
+
+def random_ranges(rows, count, seed=1):
+    rng = random.Random(seed)
+    ranges = []
+    for _ in range(count):
+        a, b = sorted((rng.randrange(len(rows)), rng.randrange(len(rows))))
+        ranges.append((rows[a][0], rows[b][0]))
+    return ranges
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def timed(fn, repeat=1):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return result, summarize(samples)
+
+
+def loaded_days_bytes(backend, data_path):
+    # Memory held by a fresh store's copy of every day; labels already in the shared table are not counted again
+    tracemalloc.start()
+    try:
+        store = open_store(backend, data_path)
+        try:
+            days = store.load_days("0000-00-00", "9999-12-31")
+            # Read while days is alive: the lazy backends keep no copy of their own once it is dropped
+            loaded_bytes = tracemalloc.get_traced_memory()[0]
+            del days
+        finally:
+            store.close()
+        return loaded_bytes
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_range_index(sizes=(100, 1000, 10000, 100000), queries=1000):
+    results = []
+    for size in sizes:
+        rows = synthetic_day_totals(size)
+        ranges = random_ranges(rows, queries)
+
+        started = time.perf_counter()
+        index = RangeIndex(rows)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for start_date_str, end_date_str in ranges:
+            index.totals(start_date_str, end_date_str)
+        query_us = (time.perf_counter() - started) / queries * 1e6
+
+        # The scan calculate_range used to do, on a handful of queries
+        days = {date_str: {"income": income, "expenses": expenses} for date_str, income, expenses in rows}
+        scan_queries = ranges[:20]
+        started = time.perf_counter()
+        for start_date_str, end_date_str in scan_queries:
+            total_income = total_expenses = 0
+            for date_str in sorted(days.keys()):
+                if start_date_str <= date_str <= end_date_str:
+                    total_income += days[date_str]["income"]
+                    total_expenses += days[date_str]["expenses"]
+        scan_us = (time.perf_counter() - started) / len(scan_queries) * 1e6
+
+        results.append({"days": size, "build_ms": build_ms, "query_us": query_us, "scan_us": scan_us})
+    return results
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location("money_rider_app", APP_PATH)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    return app
+
+
+def benchmark_calendar_widgets(ledger, months):
+    # Builds the real calendar frame once and times month flips; needs a display
+    app = load_app()
+    app.ledger = ledger
+    app.root = app.tk.Tk()
+    try:
+        (frame, refresh), build = timed(lambda: app.calendar_screen(app.root))
+        frame.pack(fill=app.tk.BOTH, expand=True)
+        refresh()
+        app.root.update()
+        # cal_frame -> header_frame -> month combobox
+        month_combo = frame.winfo_children()[0].winfo_children()[0].winfo_children()[0]
+
+        def flip(month_key):
+            month_combo.set(calendar.month_name[int(month_key[5:])])
+            month_combo.event_generate("<<ComboboxSelected>>")
+            app.root.update_idletasks()
+
+        samples = []
+        for month_key in months:
+            started = time.perf_counter()
+            flip(month_key)
+            samples.append(time.perf_counter() - started)
+        return {"build": build, "month_flip": summarize(samples)}
+    finally:
+        app.root.destroy()
+
+
+def benchmark_backend(backend, accounts, days, args):
+    rng = random.Random(2)
+    with tempfile.TemporaryDirectory(prefix=f"money_rider_{backend}_") as temp_dir:
+        data_path = Path(temp_dir) / "money_rider_data.json"
+        results = {}
+
+        ledger = Ledger(backend, data_path)
+        for username, password in accounts.items():
+            ledger.add_account(username, password)
+        _, results["bulk_write"] = timed(lambda: ledger.save_days_now(days))
+        _, results["persist_state"] = timed(ledger.persist)
+        ledger.close()
+
+        ledger, results["load_persisted_state"] = timed(lambda: Ledger(backend, data_path))
+        _, results["range_index_build"] = timed(ledger.get_range_index)
+        results["loaded_days_bytes"] = loaded_days_bytes(backend, data_path)
+
+        date_keys = sorted(days)
+        ranges = random_ranges([(date_str,) for date_str in date_keys], args.range_queries)
+        samples = []
+        for start_date_str, end_date_str in ranges:
+            started = time.perf_counter()
+            ledger.range_totals(start_date_str, end_date_str)
+            samples.append(time.perf_counter() - started)
+        results["calculate_range"] = summarize(samples)
+        _, results["range_analytics"] = timed(lambda: range_analytics(ledger, date_keys[0], date_keys[-1]), repeat=5)
+
+        months = sorted({date_str[:7] for date_str in date_keys})
+        samples = []
+        for month_key in rng.sample(months, min(len(months), args.calendar_months)):
+            year, month = int(month_key[:4]), int(month_key[5:])
+            started = time.perf_counter()
+            calendar.monthcalendar(year, month)
+            ledger.month_dates(year, month)
+            samples.append(time.perf_counter() - started)
+        results["calendar_month_logic"] = summarize(samples)
+
+        edited = rng.sample(date_keys, min(len(date_keys), args.saves))
+        samples = []
+        for date_str in edited:
+            payload = days[date_str]
+            started = time.perf_counter()
+            ledger.save_day(date_str, payload["entries"], payload["expense_entries"])
+            samples.append(time.perf_counter() - started)
+        results["save_data"] = summarize(samples)
+        _, results["save_data_flush"] = timed(ledger.writer.flush)
+
+        if args.gui:
+            if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"):
+                results["calendar_widgets"] = benchmark_calendar_widgets(ledger, rng.sample(months, min(len(months), 24)))
+            else:
+                results["calendar_widgets"] = "skipped: no display"
+
+        ledger.close()
+        results["disk_bytes"] = sum(
+            path.stat().st_size for path in Path(temp_dir).rglob("*") if path.is_file()
+        )
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Money Rider on synthetic multi-year ledgers")
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--entries-per-day", type=int, default=20)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--backends", default="json,sqlite,sharded,binary,snapshots", help="comma separated backends to time")
+    parser.add_argument("--range-queries", type=int, default=500)
+    parser.add_argument("--calendar-months", type=int, default=24)
+    parser.add_argument("--saves", type=int, default=50)
+    parser.add_argument("--gui", action="store_true", help="also time real calendar widgets (needs a display)")
+    parser.add_argument("--skip-range-scaling", action="store_true")
+    parser.add_argument("--output", type=Path, default=None, help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    accounts, days = synthetic_financial_data(args.years, args.entries_per_day, args.users)
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "years": args.years,
+            "entries_per_day": args.entries_per_day,
+            "users": args.users,
+            "days": len(days),
+        },
+        "backends": {},
+    }
+    for backend in args.backends.split(","):
+        report["backends"][backend] = benchmark_backend(backend.strip(), accounts, days, args)
+    if not args.skip_range_scaling:
+        report["range_index_scaling"] = benchmark_range_index()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,88 +1,339 @@
 import tkinter as tk
-from tkinter import messagebox, simpledialog, ttk
-from datetime import datetime
-from pathlib import Path
-import json
+from tkinter import filedialog, messagebox, simpledialog, ttk
+from datetime import date, datetime
+import atexit
 import calendar
+import queue
+import sys
+import threading
+from collections import deque
+from itertools import islice
 
-# Global variables
-accounts = {}
-current_entries = []
-undo_stack = []
-redo_stack = []
-current_expenses = []
-undo_expense_stack = []
-redo_expense_stack = []
-financial_data = {}  # Dictionary to store financial data by date (format: "YYYY-MM-DD")
+from money_rider import (RECURRENCE_UNITS, Ledger, RecurrenceRule, daily_totals, entry_total, export_rows,
+                         iter_entries, make_day, month_bounds, pesos, profiled, profiler, range_analytics,
+                         read_accounts, to_centavos)
+from money_rider_sync import SYNC_SERVER, sync_ledger
+
+# Global variables; deques so adding or removing the newest row is O(1)
+current_entries = deque()
+current_expenses = deque()
 
 
 def format_row(label, amount):
+    # amount is in centavos
     try:
-        numeric_amount = float(amount)
+        numeric_amount = pesos(int(amount))
     except (TypeError, ValueError):
         numeric_amount = 0.0
     return f"{label.ljust(30)}{numeric_amount:10.2f}"
 
-# Persistence paths
-DATA_PATH = Path(__file__).with_name("money_rider_data.json")
 
+class VirtualList:
+    # Listbox over a list of (label, amount) rows that only formats the rows in view;
+    # the scrollbar is driven by hand so it still spans the whole list
+    def __init__(self, parent, rows, height=10, **listbox_options):
+        self.rows = rows
+        self.first = 0
+        self.visible = height
+        self.selected = None  # Index into rows, kept across scrolling
+
+        self.frame = tk.Frame(parent, bg=parent.cget("bg"))
+        self.scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox = tk.Listbox(self.frame, height=height, exportselection=False, **listbox_options)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.listbox.bind("<<ListboxSelect>>", self.on_select)
+        self.listbox.bind("<Configure>", self.on_resize)
+        self.listbox.bind("<MouseWheel>", lambda event: self.scroll(-1 if event.delta > 0 else 1))
+        self.listbox.bind("<Button-4>", lambda event: self.scroll(-1))
+        self.listbox.bind("<Button-5>", lambda event: self.scroll(1))
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def set_rows(self, rows):
+        self.rows = rows
+        self.first = 0
+        self.selected = None
+        self.render()
+
+    def selected_index(self):
+        if self.selected is not None and self.selected < len(self.rows):
+            return self.selected
+        return None
+
+    def render(self):
+        self.first = max(0, min(self.first, len(self.rows) - self.visible))
+        window = list(islice(self.rows, self.first, self.first + self.visible))
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *[format_row(row[0], row[1]) for row in window])
+        selected = self.selected_index()
+        if selected is not None and self.first <= selected < self.first + len(window):
+            self.listbox.selection_set(selected - self.first)
+        if self.rows:
+            self.scrollbar.set(self.first / len(self.rows), (self.first + len(window)) / len(self.rows))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll(self, rows):
+        self.first += rows
+        self.render()
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.first = int(float(amount) * len(self.rows))
+            self.render()
+        elif unit == "pages":
+            self.scroll(int(amount) * self.visible)
+        else:
+            self.scroll(int(amount))
+
+    def on_select(self, event):
+        selection = self.listbox.curselection()
+        self.selected = self.first + selection[0] if selection else None
+
+    def on_resize(self, event):
+        bbox = self.listbox.bbox(0)
+        if bbox and bbox[3] > 0:
+            visible = max(1, event.height // bbox[3])
+            if visible != self.visible:
+                self.visible = visible
+                self.render()
 
-def load_persisted_state():
-    global accounts, financial_data
-    if not DATA_PATH.exists():
+
+def edit_selected(parent, entry_list, history, label_prompt, amount_prompt):
+    index = entry_list.selected_index()
+    if index is None:
+        messagebox.showinfo("Edit", "Select a row to edit first.")
+        return
+    label, amount = entry_list.rows[index]
+    label = simpledialog.askstring("Edit", label_prompt, initialvalue=label, parent=parent)
+    if not label:
+        return
+    amount = simpledialog.askstring("Edit", amount_prompt, initialvalue=f"{pesos(amount):.2f}", parent=parent)
+    if amount is None:
         return
     try:
-        with DATA_PATH.open("r", encoding="utf-8") as data_file:
-            raw = json.load(data_file)
-    except (json.JSONDecodeError, OSError):
+        amount_val = to_centavos(amount)
+    except ValueError:
+        messagebox.showerror("Error", f"{amount_prompt} must be a number")
         return
+    history.edit(entry_list.rows, index, (label, amount_val))
+    entry_list.render()
+
+
+def delete_selected(entry_list, history):
+    index = entry_list.selected_index()
+    if index is not None:
+        history.delete(entry_list.rows, index)
+        entry_list.selected = None
+        entry_list.render()
+
+
+def step_history(entry_list, step):
+    # step is history.undo or history.redo
+    step(entry_list.rows)
+    entry_list.selected = None
+    entry_list.render()
+
+# Persistence
+PERSISTENCE_POLL_MS = 250  # How often the window checks the writer for failures
+SEARCH_RESULT_LIMIT = 1000  # Newest matches listed by the search window
+SYNC_POLL_MS = 100  # How often the window checks whether a sync has finished
+LOAD_POLL_MS = 50  # How often the splash screen checks on the loading thread
+
+ledger = None
+loading_done = False  # Set on the Tk thread once the ledger is open and, when built at startup, its month totals
+after_loading = None  # Run once loading_done is set, e.g. opening the calendar for a login made meanwhile
+splash_widgets = {}  # Progress bar, status label and buttons of the splash screen
+known_accounts = {}  # From the accounts file, for logins made before the ledger is open
+queued_accounts = []  # (username, password) created before the ledger was open, added once it is
+
+
+@profiled("load_persisted_state")
+def load_persisted_state(progress=None):
+    global ledger
+    if ledger is not None:
+        shutdown_persistence()
+    ledger = Ledger(progress=progress)
+
+
+def check_login(username, password):
+    if ledger is None:
+        return username in known_accounts and known_accounts[username] == password
+    return ledger.check_login(username, password)
+
+
+def add_account(username, password):
+    if ledger is None:
+        known_accounts[username] = password
+        queued_accounts.append((username, password))
+    else:
+        ledger.add_account(username, password)
+
+
+def shutdown_persistence():
+    # Registered with atexit so queued saves reach disk when the last window closes
+    if ledger is not None:
+        ledger.close()
+
+
+def show_conflicts(dates):
+    # Another window saved these days first; its version is what the ledger holds now
+    messagebox.showwarning(
+        "Saved in another window",
+        f"Another Money Rider window saved {', '.join(dates)} first. Its version was kept "
+        "and is shown now; enter your changes again if they are still needed.",
+    )
+    refresh_days(dates)
+
+
+def refresh_days(dates):
+    # Redraws the current screen after the ledger reloaded dates from the store
+    if current_page is None:
+        return
+    if current_page.name in ("income", "expenses"):
+        day, year, month = current_page.args
+        date_str = f"{year}-{month:02d}-{day:02d}"
+        data = ledger.get_day(date_str) if date_str in dates else None
+        if data is not None:
+            current_entries.clear()
+            current_entries.extend(data["entries"])
+            current_expenses.clear()
+            current_expenses.extend(data["expense_entries"])
+    show_screen(current_page.name, current_page.render_fn, current_page.args)
+
+
+def start_sync(window):
+    # The sync talks to the server on its own thread; the ledger is only reloaded back on the Tk thread
+    address = simpledialog.askstring("Sync", "Sync server (HOST:PORT):", initialvalue=SYNC_SERVER, parent=window)
+    if not address:
+        return
+    results = queue.Queue()
+
+    def run():
+        try:
+            results.put(sync_ledger(ledger, address.strip()))
+        except Exception as exc:  # A malformed response must still reach poll, or it would wait forever
+            results.put(exc)
+
+    def poll():
+        try:
+            result = results.get_nowait()
+        except queue.Empty:
+            window.after(SYNC_POLL_MS, poll)
+            return
+        if isinstance(result, Exception):
+            messagebox.showerror("Sync", f"Sync failed: {result}")
+            return
+        try:
+            dates = sorted(set(result["pulled"]) | set(result["conflicts"]))
+            ledger.reload_days(dates)
+        except Exception as exc:
+            messagebox.showerror("Sync", f"Sync failed: {exc}")
+            return
+        message = f"Sent {len(result['pushed'])} days, received {len(result['pulled'])}."
+        if result["conflicts"]:
+            message += (f"\n\n{', '.join(result['conflicts'])} also changed on another device; its version was "
+                        f"kept and yours saved to {ledger.data_path.with_suffix('.conflicts.jsonl').name}.")
+        messagebox.showinfo("Sync", message)
+        if dates:
+            refresh_days(dates)
+
+    threading.Thread(target=run, daemon=True).start()
+    window.after(SYNC_POLL_MS, poll)
+
+
+def watch_persistence(window):
+    # Writer failures and save conflicts are reported from the Tk thread rather than from the I/O thread
+    def poll():
+        if ledger is not None:
+            try:
+                while True:
+                    messagebox.showerror("Error", ledger.writer.errors.get_nowait())
+            except queue.Empty:
+                pass
+            dates = ledger.take_conflicts()
+            if dates:
+                show_conflicts(dates)
+        window.after(PERSISTENCE_POLL_MS, poll)
+
+    window.after(PERSISTENCE_POLL_MS, poll)
+
+
+def start_loading(window):
+    # The history is read on a worker thread once the splash screen is up. Login and Create Account
+    # work as soon as the accounts file is read; the calendar waits until the ledger is open, and on
+    # backends that hold everything in memory until the month totals are built too.
+    messages = queue.Queue()  # (fraction done, status text, stage or None)
+
+    def run():
+        global known_accounts
+        try:
+            accounts = read_accounts()
+            if accounts is not None:
+                known_accounts = accounts
+                messages.put((0.0, "Reading days", "accounts"))
+            load_persisted_state(lambda done, total: messages.put(
+                (0.8 * done / total, f"Reading days {done:,} of {total:,}", None)))
+            messages.put((0.8, "Adding up months", "ledger"))
+            # Lazy backends answer the calendar a month at a time instead of scanning the history here
+            if ledger.store.loads_everything:
+                ledger.build_totals()
+            messages.put((1.0, "", "ready"))
+        except Exception as exc:  # Anything left unreported here would keep the splash screen waiting forever
+            messages.put((0.0, f"Failed to load data: {exc}", "error"))
+
+    def poll():
+        global loading_done, after_loading
+        try:
+            while True:
+                fraction, text, stage = messages.get_nowait()
+                if splash_widgets:
+                    splash_widgets["progress"].config(value=fraction * 100)
+                    splash_widgets["status"].config(text=text)
+                if stage in ("accounts", "ledger"):
+                    for button in splash_widgets.get("buttons", ()):
+                        button.config(state=tk.NORMAL)
+                if stage == "ledger":
+                    while queued_accounts:
+                        ledger.add_account(*queued_accounts.pop(0))
+                elif stage == "ready":
+                    loading_done = True
+                    if splash_widgets:
+                        splash_widgets["progress"].pack_forget()
+                    if after_loading is not None:
+                        window.config(cursor="")
+                        after_loading, callback = None, after_loading
+                        callback()
+                    return
+                elif stage == "error":
+                    messagebox.showerror("Error", text)
+                    return
+        except queue.Empty:
+            pass
+        window.after(LOAD_POLL_MS, poll)
+
+    threading.Thread(target=run, daemon=True).start()
+    window.after(LOAD_POLL_MS, poll)
 
-    accounts = raw.get("accounts", {})
-
-    raw_financial = raw.get("financial_data", {})
-    financial_data.clear()
-    for date_str, payload in raw_financial.items():
-        entries = [
-            (item[0], float(item[1]))
-            for item in payload.get("entries", [])
-            if isinstance(item, (list, tuple)) and len(item) == 2
-        ]
-        expense_entries = [
-            (item[0], float(item[1]))
-            for item in payload.get("expense_entries", [])
-            if isinstance(item, (list, tuple)) and len(item) == 2
-        ]
-        financial_data[date_str] = {
-            "income": float(payload.get("income", 0)),
-            "expenses": float(payload.get("expenses", 0)),
-            "entries": entries,
-            "expense_entries": expense_entries,
-        }
-
-
-def persist_state():
-    serializable_data = {
-        "accounts": accounts,
-        "financial_data": {
-            date_str: {
-                "income": payload.get("income", 0),
-                "expenses": payload.get("expenses", 0),
-                "entries": [[entry[0], float(entry[1])] for entry in payload.get("entries", [])],
-                "expense_entries": [
-                    [entry[0], float(entry[1])] for entry in payload.get("expense_entries", [])
-                ],
-            }
-            for date_str, payload in financial_data.items()
-        },
-    }
-    try:
-        with DATA_PATH.open("w", encoding="utf-8") as data_file:
-            json.dump(serializable_data, data_file, indent=2)
-    except OSError:
-        messagebox.showerror("Error", "Failed to save data to disk.")
 
+def when_loaded(callback):
+    # Runs callback now, or as soon as the background load finishes
+    global after_loading
+    if loading_done:
+        callback()
+    else:
+        after_loading = callback
+        root.config(cursor="watch")
+
+
+# `--profile TRACE_JSON` (or MONEY_RIDER_PROFILE) records spans from startup on
+if __name__ == "__main__" and "--profile" in sys.argv[1:-1]:
+    profiler.enable(sys.argv[sys.argv.index("--profile") + 1])
 
-load_persisted_state()
+atexit.register(shutdown_persistence)
 
 
 class PageNode:
@@ -94,7 +345,26 @@ class PageNode:
         self.next = None
 
 
+PAGE_HISTORY_LIMIT = 50  # Older pages are dropped so a long session keeps a bounded history
+
+root = None
 current_page = None
+screens = {}  # Screen name -> (frame, refresh); each screen is built once and then reused
+visible_screen = None
+
+
+def show_screen(name, render_fn, args):
+    global visible_screen
+    if name not in screens:
+        screens[name] = render_fn(root)
+    frame, refresh = screens[name]
+    # Refresh first so a failing screen leaves the current one showing instead of a blank window
+    refresh(*args)
+    if visible_screen is not None and visible_screen is not frame:
+        visible_screen.pack_forget()
+    if visible_screen is not frame:
+        frame.pack(fill=tk.BOTH, expand=True)
+        visible_screen = frame
 
 
 def navigate_to(name, render_fn, *args):
@@ -104,46 +374,63 @@ def navigate_to(name, render_fn, *args):
         current_page.next = node
         node.prev = current_page
     current_page = node
-    render_fn(*args)
+
+    oldest = node
+    for _ in range(PAGE_HISTORY_LIMIT):
+        if oldest.prev is None:
+            break
+        oldest = oldest.prev
+    if oldest.prev is not None:
+        oldest.prev.next = None
+        oldest.prev = None
+
+    with profiler.span(f"navigate_to:{name}"):
+        show_screen(name, render_fn, args)
 
 
-def go_back(window):
+def go_back():
     global current_page
     if current_page and current_page.prev:
         prev_node = current_page.prev
         prev_node.next = None
         current_page = prev_node
-        window.destroy()
-        prev_node.render_fn(*prev_node.args)
+        with profiler.span(f"go_back:{prev_node.name}"):
+            show_screen(prev_node.name, prev_node.render_fn, prev_node.args)
     else:
-        window.destroy()
+        root.destroy()
 
 # Splash Screen
-def splash_screen():
-    splash = tk.Tk()
-    splash.title("Money Rider")
-    splash.geometry("570x700")
-    splash.configure(bg="#1C1C1C")  # Dark background for rider theme
+def splash_screen(parent):
+    splash = tk.Frame(parent, bg="#1C1C1C")  # Dark background for rider theme
 
     title = tk.Label(splash, text="Money Rider 🚵", font=("Bubblegum Sans", 36, "bold"), bg="#1C1C1C", fg="white")
     title.pack(pady=50)
 
-    login_btn = tk.Button(splash, text="Login", font=("Bubblegum Sans", 18), bg="#404040", fg="white",
-                          command=lambda: [splash.destroy(), navigate_to("login", login_screen)])
+    # Both stay disabled until start_loading has read the accounts
+    state = tk.NORMAL if loading_done else tk.DISABLED
+    login_btn = tk.Button(splash, text="Login", font=("Bubblegum Sans", 18), bg="#404040", fg="white", state=state,
+                          command=lambda: navigate_to("login", login_screen))
     login_btn.pack(pady=10)
 
     create_account_btn = tk.Button(splash, text="Create Account", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
-                                   command=lambda: [splash.destroy(), navigate_to("create_account", create_account_screen)])
+                                   state=state, command=lambda: navigate_to("create_account", create_account_screen))
     create_account_btn.pack()
 
-    splash.mainloop()
+    progress = ttk.Progressbar(splash, length=300, maximum=100, mode="determinate")
+    status = tk.Label(splash, text="Loading…", bg="#1C1C1C", fg="white", font=("Bubblegum Sans", 12))
+    if not loading_done:
+        progress.pack(pady=(30, 5))
+        status.pack()
+    splash_widgets.update(progress=progress, status=status, buttons=(login_btn, create_account_btn))
+
+    def refresh():
+        root.title("Money Rider")
+
+    return splash, refresh
 
 # Create Account Screen
-def create_account_screen():
-    create = tk.Tk()
-    create.title("Create Account")
-    create.geometry("570x700")
-    create.configure(bg="#1C1C1C")
+def create_account_screen(parent):
+    create = tk.Frame(parent, bg="#1C1C1C")
 
     tk.Label(create, text="Create Username", bg="#1C1C1C", fg="white", font=("Bubblegum Sans", 14)).pack(pady=5)
     username_entry = tk.Entry(create, font=("Bubblegum Sans", 14))
@@ -157,23 +444,26 @@ def create_account_screen():
         username = username_entry.get()
         password = password_entry.get()
         if username and password:
-            accounts[username] = password
-            persist_state()
+            add_account(username, password)
             messagebox.showinfo("Success", "Account Created!")
-            go_back(create)
+            go_back()
         else:
             messagebox.showerror("Error", "Fill all fields")
 
     tk.Button(create, text="Create", font=("Bubblegum Sans", 14), bg="#404040", fg="white", command=create_account).pack(pady=20)
     tk.Button(create, text="Back", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
-              command=lambda: go_back(create)).pack(pady=10)
+              command=go_back).pack(pady=10)
+
+    def refresh():
+        root.title("Create Account")
+        username_entry.delete(0, tk.END)
+        password_entry.delete(0, tk.END)
+
+    return create, refresh
 
 # Login Screen
-def login_screen():
-    login = tk.Tk()
-    login.title("Login")
-    login.geometry("570x700")
-    login.configure(bg="#1C1C1C")
+def login_screen(parent):
+    login = tk.Frame(parent, bg="#1C1C1C")
 
     tk.Label(login, text="Username", bg="#1C1C1C", fg="white", font=("Bubblegum Sans", 14)).pack(pady=5)
     username_entry = tk.Entry(login, font=("Bubblegum Sans", 14))
@@ -186,27 +476,43 @@ def login_screen():
     def validate_login():
         username = username_entry.get()
         password = password_entry.get()
-        if username in accounts and accounts[username] == password:
-            login.destroy()
-            navigate_to("calendar", calendar_screen)
+        if check_login(username, password):
+            when_loaded(lambda: navigate_to("calendar", calendar_screen))
         else:
             messagebox.showerror("Error", "Wrong Username or Password!")
 
     tk.Button(login, text="Login", font=("Bubblegum Sans", 14), bg="#404040", fg="white", command=validate_login).pack(pady=20)
     tk.Button(login, text="Back", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
-              command=lambda: go_back(login)).pack(pady=10)
+              command=go_back).pack(pady=10)
+
+    def refresh():
+        root.title("Login")
+        username_entry.delete(0, tk.END)
+        password_entry.delete(0, tk.END)
+
+    return login, refresh
+
+# Year heatmap: one square per day, weeks as columns and weekdays as rows, one block of rows per year
+HEATMAP_CELL = 12  # Pixels per day square, gap included
+HEATMAP_LEFT = 44  # Room for the year labels
+HEATMAP_TOP = 20  # Room for the first year's month labels
+HEATMAP_BLOCK = 7 * HEATMAP_CELL + 24  # Height of one year, with the month labels of the next
+HEATMAP_YEARS = (1, 2, 3, 5)  # Year spans offered by the heatmap
+HEATMAP_EMPTY = "#2C2C2C"  # Days with nothing saved
+HEATMAP_EVEN = "#606060"  # Days that broke even
+HEATMAP_GAINS = ("#1B5E20", "#2E7D32", "#43A047", "#81C784")  # Net gain, smallest to largest
+HEATMAP_LOSSES = ("#7F1D1D", "#B71C1C", "#E53935", "#EF9A9A")  # Net loss, smallest to largest
+
 
 # Calendar Screen
-def calendar_screen():
-    cal = tk.Tk()
-    cal.title("Money Rider - Calendar")
-    cal.geometry("570x700")
-    cal.configure(bg="#1C1C1C")
+def calendar_screen(parent):
+    cal = tk.Frame(parent, bg="#1C1C1C")
 
     current_date = datetime.now()
     current_year = current_date.year
     current_month = current_date.month
 
+    @profiled("show_saved_data")
     def show_saved_data(date_str, day):
         # Create a popup window to display saved data
         popup = tk.Toplevel(cal)
@@ -224,8 +530,11 @@ def calendar_screen():
         tk.Label(main_frame, text=date_str, bg="#1C1C1C", fg="#4CAF50", 
                 font=("Bubblegum Sans", 14)).pack(pady=5)
         
-        # Get the saved data
-        data = financial_data[date_str]
+        # Get the saved data; recurring entries are not saved with the day, only expanded for it
+        data = ledger.get_day(date_str) or make_day([], [], 0)
+        recurring = list(ledger.iter_recurring(date_str, date_str))
+        _, income, expenses = ledger.with_recurring([(date_str, data['income'], data['expenses'])],
+                                                    date_str, date_str)[0]
         
         # Summary frame
         summary_frame = tk.Frame(main_frame, bg="#2C2C2C", bd=2, relief=tk.RIDGE)
@@ -237,7 +546,7 @@ def calendar_screen():
         
         tk.Label(income_frame, text="Total Income:", bg="#2C2C2C", fg="white",
                 font=("Bubblegum Sans", 14)).pack(side=tk.LEFT)
-        tk.Label(income_frame, text=f"₱{data['income']:,.2f}", bg="#2C2C2C", fg="#4CAF50",
+        tk.Label(income_frame, text=f"₱{pesos(income):,.2f}", bg="#2C2C2C", fg="#4CAF50",
                 font=("Bubblegum Sans", 14, "bold")).pack(side=tk.RIGHT)
         
         # Expenses summary
@@ -246,17 +555,17 @@ def calendar_screen():
         
         tk.Label(expenses_frame, text="Total Expenses:", bg="#2C2C2C", fg="white",
                 font=("Bubblegum Sans", 14)).pack(side=tk.LEFT)
-        tk.Label(expenses_frame, text=f"₱{data['expenses']:,.2f}", bg="#2C2C2C", fg="#F44336",
+        tk.Label(expenses_frame, text=f"₱{pesos(expenses):,.2f}", bg="#2C2C2C", fg="#F44336",
                 font=("Bubblegum Sans", 14, "bold")).pack(side=tk.RIGHT)
         
         # Net total
         net_frame = tk.Frame(summary_frame, bg="#2C2C2C")
         net_frame.pack(fill=tk.X, padx=10, pady=10)
         
-        net_total = data['income'] - data['expenses']
+        net_total = income - expenses
         tk.Label(net_frame, text="Net Total:", bg="#2C2C2C", fg="white",
                 font=("Bubblegum Sans", 16)).pack(side=tk.LEFT)
-        tk.Label(net_frame, text=f"₱{net_total:,.2f}", bg="#2C2C2C", 
+        tk.Label(net_frame, text=f"₱{pesos(net_total):,.2f}", bg="#2C2C2C", 
                 fg="#4CAF50" if net_total >= 0 else "#F44336",
                 font=("Bubblegum Sans", 16, "bold")).pack(side=tk.RIGHT)
         
@@ -273,12 +582,10 @@ def calendar_screen():
         notebook.add(income_tab, text="Income Details")
         
         if data['entries']:
-            income_listbox = tk.Listbox(income_tab, bg="#404040", fg="white", 
+            income_list = VirtualList(income_tab, data['entries'], bg="#404040", fg="white",
                                       font=("Courier New", 12), width=50)
-            income_listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-            
-            for entry in data['entries']:
-                income_listbox.insert(tk.END, format_row(entry[0], entry[1]))
+            income_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+            income_list.render()
         else:
             tk.Label(income_tab, text="No income data", bg="#1C1C1C", fg="white",
                    font=("Bubblegum Sans", 14)).pack(pady=20)
@@ -288,15 +595,23 @@ def calendar_screen():
         notebook.add(expense_tab, text="Expense Details")
         
         if data['expense_entries']:
-            expense_listbox = tk.Listbox(expense_tab, bg="#404040", fg="white", 
+            expense_list = VirtualList(expense_tab, data['expense_entries'], bg="#404040", fg="white",
                                        font=("Courier New", 12), width=50)
-            expense_listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-            
-            for expense in data['expense_entries']:
-                expense_listbox.insert(tk.END, format_row(expense[0], expense[1]))
+            expense_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+            expense_list.render()
         else:
             tk.Label(expense_tab, text="No expense data", bg="#1C1C1C", fg="white",
                    font=("Bubblegum Sans", 14)).pack(pady=20)
+
+        if recurring:
+            recurring_tab = tk.Frame(notebook, bg="#1C1C1C")
+            notebook.add(recurring_tab, text="Recurring")
+            rows = [(f"{label} ({'income' if kind == 'income' else 'expense'})", amount)
+                    for _, kind, label, amount in recurring]
+            recurring_list = VirtualList(recurring_tab, rows, bg="#404040", fg="white",
+                                         font=("Courier New", 12), width=50)
+            recurring_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+            recurring_list.render()
         
         # Button frame
         button_frame = tk.Frame(main_frame, bg="#1C1C1C")
@@ -308,8 +623,7 @@ def calendar_screen():
             current_entries.extend(data['entries'])
             current_expenses.extend(data['expense_entries'])
             popup.destroy()
-            cal.destroy()
-            navigate_to("income", income_screen, day, current_year, current_month)
+            navigate_to("income", income_screen, day, int(date_str[:4]), int(date_str[5:7]))
 
         edit_btn = tk.Button(button_frame, text="View/Edit", font=("Bubblegum Sans", 12),
                             bg="#404040", fg="white", width=12,
@@ -322,13 +636,292 @@ def calendar_screen():
                              command=popup.destroy)
         close_btn.pack(side=tk.LEFT, padx=5)
 
+    def show_year_summary():
+        rollups = ledger.year_rollups(current_year)
+        popup = tk.Toplevel(cal)
+        popup.title(f"Year Summary - {current_year}")
+        popup.geometry("560x560")
+        popup.configure(bg="#1C1C1C")
+
+        tk.Label(popup, text=f"{current_year} Summary", bg="#1C1C1C", fg="white",
+                 font=("Bubblegum Sans", 20, "bold")).pack(pady=10)
+
+        table = tk.Frame(popup, bg="#2C2C2C", bd=2, relief=tk.RIDGE)
+        table.pack(padx=10, pady=10)
+        for col, heading in enumerate(("Month", "Days", "Income", "Expenses", "Net")):
+            tk.Label(table, text=heading, bg="#2C2C2C", fg="white",
+                     font=("Bubblegum Sans", 12, "bold")).grid(row=0, column=col, padx=8, pady=4)
+
+        rows = [(calendar.month_name[month], rollups.month(current_year, month)) for month in range(1, 13)]
+        rows.append(("Year", rollups.year(current_year)))
+        for row, (name, totals) in enumerate(rows, start=1):
+            values = (name, totals["days"], f"₱{pesos(totals['income']):,.2f}",
+                      f"₱{pesos(totals['expenses']):,.2f}", f"₱{pesos(totals['net']):,.2f}")
+            for col, value in enumerate(values):
+                tk.Label(table, text=value, bg="#2C2C2C",
+                         fg="#F44336" if col == 4 and totals["net"] < 0 else "white",
+                         font=("Bubblegum Sans", 12, "bold" if name == "Year" else "normal")).grid(
+                    row=row, column=col, padx=8, sticky="e" if col else "w")
+
+        year_totals = rollups.year(current_year)
+        for label, day in (("Best day", year_totals["max_day"]), ("Worst day", year_totals["min_day"])):
+            if day is not None:
+                tk.Label(popup, text=f"{label}: {day[0]}  (₱{pesos(day[1]):,.2f})", bg="#1C1C1C", fg="white",
+                         font=("Bubblegum Sans", 12)).pack()
+
+        tk.Button(popup, text="Close", font=("Bubblegum Sans", 12), bg="#404040", fg="white", width=12,
+                  command=popup.destroy).pack(pady=10)
+
+    def open_search():
+        popup = tk.Toplevel(cal)
+        popup.title("Search Entries")
+        popup.geometry("560x500")
+        popup.configure(bg="#1C1C1C")
+
+        tk.Label(popup, text="Customer or expense (any word start)", bg="#1C1C1C", fg="white",
+                 font=("Bubblegum Sans", 14)).pack(pady=10)
+        query_var = tk.StringVar()
+        query_entry = tk.Entry(popup, textvariable=query_var, font=("Bubblegum Sans", 14))
+        query_entry.pack(pady=5)
+        status_label = tk.Label(popup, text="", bg="#1C1C1C", fg="#4CAF50", font=("Bubblegum Sans", 12))
+        status_label.pack(pady=5)
+
+        # Expenses are listed as negative amounts
+        result_list = VirtualList(popup, [], height=15, bg="#404040", fg="white",
+                                  font=("Courier New", 12), width=50)
+        result_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        def run_search(event=None):
+            rows = [
+                (f"{date_str} {label}", amount if kind == "income" else -amount)
+                for date_str, kind, label, amount in ledger.search(query_var.get(), SEARCH_RESULT_LIMIT)
+            ]
+            result_list.set_rows(rows)
+            more = "+" if len(rows) == SEARCH_RESULT_LIMIT else ""
+            status_label.config(text=f"{len(rows)}{more} matching entries, newest first")
+
+        query_entry.bind("<Return>", run_search)
+        tk.Button(popup, text="Search", font=("Bubblegum Sans", 12), bg="#404040", fg="white",
+                  command=run_search).pack(pady=5)
+        query_entry.focus_set()
+
+    def show_recurring():
+        # Fixed entries such as fuel allowance or motorbike rent, entered once instead of on every day
+        popup = tk.Toplevel(cal)
+        popup.title("Recurring Entries")
+        popup.geometry("560x560")
+        popup.configure(bg="#1C1C1C")
+
+        tk.Label(popup, text="Recurring Entries", bg="#1C1C1C", fg="white",
+                 font=("Bubblegum Sans", 20, "bold")).pack(pady=10)
+        rule_list = tk.Listbox(popup, bg="#404040", fg="white", font=("Courier New", 11), width=60, height=10)
+        rule_list.pack(padx=10, pady=5)
+
+        def describe(rule):
+            unit = rule.every if rule.interval == 1 else f"{rule.interval} {rule.every}s"
+            until = f" to {rule.end}" if rule.end else ""
+            return (f"{'+' if rule.kind == 'income' else '-'}₱{pesos(rule.amount):,.2f} {rule.label}, "
+                    f"every {unit} from {rule.start}{until}")
+
+        shown_rules = []
+
+        def fill_list():
+            rule_list.delete(0, tk.END)
+            shown_rules[:] = ledger.get_rules()
+            for rule in shown_rules:
+                rule_list.insert(tk.END, describe(rule))
+
+        def remove_selected():
+            selection = rule_list.curselection()
+            if not selection:
+                return
+            try:
+                ledger.remove_rule(shown_rules[selection[0]])
+            except OSError:
+                messagebox.showerror("Error", "Failed to save data to disk.", parent=popup)
+            fill_list()
+            update_calendar_grid()
+
+        tk.Button(popup, text="Remove", font=("Bubblegum Sans", 12), bg="#404040", fg="white", width=12,
+                  command=remove_selected).pack(pady=5)
+
+        form = tk.Frame(popup, bg="#2C2C2C", bd=2, relief=tk.RIDGE)
+        form.pack(padx=10, pady=10)
+        kind_var = tk.StringVar(value="Expense")
+        every_var = tk.StringVar(value="month")
+        fields = {}
+        for row, (text, key) in enumerate((("Label", "label"), ("Amount", "amount"), ("Every", "interval"),
+                                           ("Start (YYYY-MM-DD)", "start"), ("End (optional)", "end"))):
+            tk.Label(form, text=text, bg="#2C2C2C", fg="white", font=("Bubblegum Sans", 12)).grid(
+                row=row, column=0, sticky="w", padx=8, pady=2)
+            fields[key] = tk.Entry(form, font=("Bubblegum Sans", 12), width=16)
+            fields[key].grid(row=row, column=1, padx=8, pady=2)
+        fields["interval"].insert(0, "1")
+        fields["start"].insert(0, date.today().isoformat())
+        ttk.Combobox(form, textvariable=every_var, values=RECURRENCE_UNITS, state="readonly", width=8,
+                     font=("Bubblegum Sans", 12)).grid(row=2, column=2, padx=8)
+        ttk.Combobox(form, textvariable=kind_var, values=("Income", "Expense"), state="readonly", width=8,
+                     font=("Bubblegum Sans", 12)).grid(row=0, column=2, padx=8)
+
+        def add_rule():
+            label = fields["label"].get().strip()
+            if not label:
+                messagebox.showerror("Error", "Fill all fields", parent=popup)
+                return
+            try:
+                rule = RecurrenceRule("income" if kind_var.get() == "Income" else "expenses", label,
+                                      to_centavos(fields["amount"].get()), fields["start"].get().strip(),
+                                      every_var.get(), int(fields["interval"].get()), fields["end"].get().strip())
+            except ValueError:
+                messagebox.showerror("Error", "Invalid amount, interval or date", parent=popup)
+                return
+            try:
+                ledger.add_rule(rule)
+            except OSError:
+                messagebox.showerror("Error", "Failed to save data to disk.", parent=popup)
+            for key in ("label", "amount", "end"):
+                fields[key].delete(0, tk.END)
+            fill_list()
+            update_calendar_grid()
+
+        tk.Button(form, text="Add", font=("Bubblegum Sans", 12), bg="#404040", fg="white", width=10,
+                  command=add_rule).grid(row=5, column=0, columnspan=3, pady=8)
+        tk.Button(popup, text="Close", font=("Bubblegum Sans", 12), bg="#404040", fg="white", width=12,
+                  command=popup.destroy).pack(pady=5)
+        fill_list()
+
+    def show_heatmap():
+        # Squares are drawn straight onto one canvas; hover and clicks are mapped back to days by position
+        popup = tk.Toplevel(cal)
+        popup.title("Heatmap")
+        popup.configure(bg="#1C1C1C")
+
+        controls = tk.Frame(popup, bg="#1C1C1C")
+        controls.pack(pady=10)
+        first_year_var = tk.StringVar(value=str(current_year))
+        years_var = tk.StringVar(value=str(HEATMAP_YEARS[0]))
+        for text, variable, values in (("From", first_year_var, list(range(2020, 2031))),
+                                       ("Years", years_var, HEATMAP_YEARS)):
+            tk.Label(controls, text=text, bg="#1C1C1C", fg="white", font=("Bubblegum Sans", 12)).pack(side=tk.LEFT)
+            combo = ttk.Combobox(controls, textvariable=variable, values=values, state="readonly", width=6,
+                                 font=("Bubblegum Sans", 12), justify="center")
+            combo.pack(side=tk.LEFT, padx=(5, 15))
+            combo.bind("<<ComboboxSelected>>", lambda e: draw())
+
+        canvas = tk.Canvas(popup, bg="#1C1C1C", highlightthickness=0)
+        canvas.pack(padx=10)
+        tk.Label(popup, text="Green: net gain · Red: net loss · Click a day to open it", bg="#1C1C1C", fg="white",
+                 font=("Bubblegum Sans", 11)).pack(pady=5)
+        tk.Button(popup, text="Close", font=("Bubblegum Sans", 12), bg="#404040", fg="white", width=12,
+                  command=popup.destroy).pack(pady=10)
+        shown = {}  # "first" and "years" drawn, and their daily_totals
+        tooltip = {}
+
+        @profiled("draw_heatmap")
+        def draw():
+            first_year = int(first_year_var.get())
+            years = int(years_var.get())
+            totals = daily_totals(ledger, f"{first_year}-01-01", f"{first_year + years - 1}-12-31")
+            shown.update(first=first_year, years=years, totals=totals)
+            income, expenses, logged = totals["income"], totals["expenses"], totals["logged"]
+            peak = max((abs(income[i] - expenses[i]) for i in range(totals["days"]) if logged[i]), default=0) or 1
+
+            canvas.delete("all")
+            canvas.config(width=HEATMAP_LEFT + 54 * HEATMAP_CELL, height=HEATMAP_TOP + years * HEATMAP_BLOCK)
+            i = 0
+            for year in range(first_year, first_year + years):
+                top = HEATMAP_TOP + (year - first_year) * HEATMAP_BLOCK
+                lead = date(year, 1, 1).weekday()
+                canvas.create_text(4, top + 3.5 * HEATMAP_CELL, text=str(year), anchor="w", fill="white",
+                                   font=("Bubblegum Sans", 11, "bold"))
+                for month in range(1, 13):
+                    column = (date(year, month, 1).timetuple().tm_yday - 1 + lead) // 7
+                    canvas.create_text(HEATMAP_LEFT + column * HEATMAP_CELL, top - 2, text=calendar.month_abbr[month],
+                                       anchor="sw", fill="white", font=("Bubblegum Sans", 9))
+                for offset in range(366 if calendar.isleap(year) else 365):
+                    column, row = divmod(offset + lead, 7)
+                    if not logged[i]:
+                        color = HEATMAP_EMPTY
+                    elif income[i] == expenses[i]:
+                        color = HEATMAP_EVEN
+                    else:
+                        net = income[i] - expenses[i]
+                        level = min(3, abs(net) * 4 // peak)
+                        color = HEATMAP_GAINS[level] if net > 0 else HEATMAP_LOSSES[level]
+                    x = HEATMAP_LEFT + column * HEATMAP_CELL
+                    y = top + row * HEATMAP_CELL
+                    canvas.create_rectangle(x, y, x + HEATMAP_CELL - 2, y + HEATMAP_CELL - 2, fill=color, width=0)
+                    i += 1
+            tooltip["box"] = canvas.create_rectangle(0, 0, 0, 0, fill="#000000", outline="#808080", state="hidden")
+            tooltip["text"] = canvas.create_text(0, 0, anchor="nw", fill="white", font=("Courier New", 10),
+                                                 state="hidden")
+
+        def day_at(x, y):
+            # (date, position in the drawn totals) of the square under x, y, or None between squares
+            if not shown or x < HEATMAP_LEFT or y < HEATMAP_TOP:
+                return None
+            year_index, y_in_block = divmod(y - HEATMAP_TOP, HEATMAP_BLOCK)
+            column, x_in_cell = divmod(x - HEATMAP_LEFT, HEATMAP_CELL)
+            row, y_in_cell = divmod(y_in_block, HEATMAP_CELL)
+            if year_index >= shown["years"] or row >= 7 or max(x_in_cell, y_in_cell) >= HEATMAP_CELL - 2:
+                return None
+            first_day = date(shown["first"] + year_index, 1, 1)
+            offset = column * 7 + row - first_day.weekday()
+            if not 0 <= offset < (366 if calendar.isleap(first_day.year) else 365):
+                return None
+            day = date.fromordinal(first_day.toordinal() + offset)
+            return day.isoformat(), day.toordinal() - date(shown["first"], 1, 1).toordinal()
+
+        def hover(event):
+            found = day_at(event.x, event.y)
+            if found is None:
+                hide_tooltip()
+                return
+            date_str, i = found
+            totals = shown["totals"]
+            if totals["logged"][i]:
+                income, expenses = totals["income"][i], totals["expenses"][i]
+                text = (f"{date_str}\nIncome   ₱{pesos(income):>10,.2f}\nExpenses ₱{pesos(expenses):>10,.2f}"
+                        f"\nNet      ₱{pesos(income - expenses):>10,.2f}")
+            else:
+                text = f"{date_str}\nNo data"
+            canvas.itemconfig(tooltip["text"], text=text, state="normal")
+            canvas.coords(tooltip["text"], event.x + 12, event.y + 12)
+            left, top, right, bottom = canvas.bbox(tooltip["text"])
+            # Flipped to the other side of the pointer near the right and bottom edges
+            dx = left - right - 24 if right > int(canvas.cget("width")) else 0
+            dy = top - bottom - 24 if bottom > int(canvas.cget("height")) else 0
+            canvas.move(tooltip["text"], dx, dy)
+            canvas.coords(tooltip["box"], left + dx - 4, top + dy - 2, right + dx + 4, bottom + dy + 2)
+            canvas.itemconfig(tooltip["box"], state="normal")
+            canvas.tag_raise(tooltip["box"])
+            canvas.tag_raise(tooltip["text"])
+
+        def hide_tooltip(event=None):
+            canvas.itemconfig(tooltip["box"], state="hidden")
+            canvas.itemconfig(tooltip["text"], state="hidden")
+
+        def open_day(event):
+            found = day_at(event.x, event.y)
+            if found is None:
+                return
+            date_str, i = found
+            if shown["totals"]["logged"][i]:
+                show_saved_data(date_str, int(date_str[8:]))
+            else:
+                reset_stacks()
+                popup.destroy()
+                navigate_to("income", income_screen, int(date_str[8:]), int(date_str[:4]), int(date_str[5:7]))
+
+        canvas.bind("<Motion>", hover)
+        canvas.bind("<Leave>", hide_tooltip)
+        canvas.bind("<Button-1>", open_day)
+        draw()
+
     def reset_stacks():
+        # Undo history is kept per day by the ledger, so only the edit buffers are cleared
         current_entries.clear()
         current_expenses.clear()
-        undo_stack.clear()
-        redo_stack.clear()
-        undo_expense_stack.clear()
-        redo_expense_stack.clear()
 
     def go_to_income(day):
         global current_entries, current_expenses
@@ -336,25 +929,24 @@ def calendar_screen():
         # Save current date for later reference
         selected_date = f"{current_year}-{current_month:02d}-{day:02d}"
 
-        # Check if we have data for this date
-        if selected_date in financial_data:
+        # Check if we have data for this date, saved or recurring
+        if ledger.get_day(selected_date) is not None or any(ledger.iter_recurring(selected_date, selected_date)):
             # Show the saved data in a popup window
             show_saved_data(selected_date, day)
         else:
             reset_stacks()
-            cal.destroy()
             navigate_to("income", income_screen, day, current_year, current_month)
 
     month_var = tk.StringVar(value=calendar.month_name[current_month])
     year_var = tk.StringVar(value=str(current_year))
 
-    def create_calendar_grid():
-        for widget in cal.winfo_children():
-            widget.destroy()
-
-        month_var.set(calendar.month_name[current_month])
-        year_var.set(str(current_year))
+    day_buttons = []
+    cell_days = [0] * 42  # Day of the month shown in each grid cell, 0 for blank cells
+    range_combos = {}
+    summary_labels = {}
 
+    @profiled("create_calendar_grid")
+    def create_calendar_grid():
         cal_frame = tk.Frame(cal, bg="#1C1C1C")
         cal_frame.pack(fill=tk.BOTH, expand=True)
 
@@ -378,6 +970,22 @@ def calendar_screen():
         year_menu.grid(row=0, column=1, padx=10, pady=10)
         year_menu.bind("<<ComboboxSelected>>", lambda e: change_year())
 
+        tk.Button(header_frame, text="Search", font=("Bubblegum Sans", 12), bg="#404040", fg="white",
+                  command=open_search).grid(row=0, column=2, padx=10, pady=10)
+        tk.Button(header_frame, text="Sync", font=("Bubblegum Sans", 12), bg="#404040", fg="white",
+                  command=lambda: start_sync(cal)).grid(row=0, column=3, padx=10, pady=10)
+
+        # Month totals, read from the ledger's rollups rather than the saved days
+        month_summary = tk.Label(header_frame, text="", bg="#1C1C1C", fg="white", font=("Bubblegum Sans", 12))
+        month_summary.grid(row=1, column=0, columnspan=2)
+        summary_labels["month"] = month_summary
+        tk.Button(header_frame, text="Year", font=("Bubblegum Sans", 12), bg="#404040", fg="white",
+                  command=show_year_summary).grid(row=1, column=2, padx=10)
+        tk.Button(header_frame, text="Heatmap", font=("Bubblegum Sans", 12), bg="#404040", fg="white",
+                  command=show_heatmap).grid(row=1, column=3, padx=10)
+        tk.Button(header_frame, text="Recurring", font=("Bubblegum Sans", 12), bg="#404040", fg="white",
+                  command=show_recurring).grid(row=2, column=2, columnspan=2, pady=5)
+
         # Days of week header
         days_frame = tk.Frame(cal_frame, bg="#1C1C1C")
         days_frame.pack()
@@ -387,30 +995,14 @@ def calendar_screen():
             tk.Label(days_frame, text=day, bg="#1C1C1C", fg="white", 
                     font=("Bubblegum Sans", 12)).grid(row=0, column=col, padx=5, pady=5)
 
-        # Calendar days grid
-        month_cal = calendar.monthcalendar(current_year, current_month)
-        for row, week in enumerate(month_cal):
-            for col, day in enumerate(week):
-                if day == 0:
-                    # Empty space for days not in the month
-                    tk.Label(days_frame, text="", bg="#1C1C1C", width=5, height=2).grid(row=row+1, column=col, padx=2, pady=2)
-                    continue
-                
-                date_str = f"{current_year}-{current_month:02d}-{day:02d}"
-                day_button = tk.Button(days_frame, text=str(day), bg="#E0E0E0", fg="black",
+        # Calendar days grid: six weeks of buttons, reconfigured by update_calendar_grid on month changes
+        for row in range(6):
+            for col in range(7):
+                day_button = tk.Button(days_frame, text="", bg="#E0E0E0", fg="black",
                                      font=("Bubblegum Sans", 14), width=5, height=2,
-                                     command=lambda d=day: go_to_income(d))
+                                     command=lambda cell=len(day_buttons): go_to_income(cell_days[cell]))
                 day_button.grid(row=row + 1, column=col, padx=2, pady=2)
-                
-                # Highlight current day
-                if (day == current_date.day and 
-                    current_month == current_date.month and 
-                    current_year == current_date.year):
-                    day_button.config(bg="#4CAF50", fg="white")
-                
-                # Highlight days with saved data
-                if date_str in financial_data:
-                    day_button.config(bg="#2196F3", fg="white")
+                day_buttons.append(day_button)
 
         # Date range calculation section
         range_frame = tk.Frame(cal_frame, bg="#1C1C1C")
@@ -430,12 +1022,10 @@ def calendar_screen():
         start_month = ttk.Combobox(range_frame, values=list(calendar.month_name[1:]), width=10, 
                                  font=("Bubblegum Sans", 12))
         start_month.grid(row=1, column=2, sticky="w")
-        start_month.set(calendar.month_name[current_month])
         
         start_year = ttk.Combobox(range_frame, values=list(range(2020, 2031)), width=5, 
                                 font=("Bubblegum Sans", 12))
         start_year.grid(row=1, column=3, sticky="w")
-        start_year.set(str(current_year))
 
         # End date
         tk.Label(range_frame, text="To:", bg="#1C1C1C", fg="white", 
@@ -448,14 +1038,14 @@ def calendar_screen():
         end_month = ttk.Combobox(range_frame, values=list(calendar.month_name[1:]), width=10, 
                                font=("Bubblegum Sans", 12))
         end_month.grid(row=2, column=2, sticky="w")
-        end_month.set(calendar.month_name[current_month])
         
         end_year = ttk.Combobox(range_frame, values=list(range(2020, 2031)), width=5, 
                               font=("Bubblegum Sans", 12))
         end_year.grid(row=2, column=3, sticky="w")
-        end_year.set(str(current_year))
+        range_combos.update(months=(start_month, end_month), years=(start_year, end_year))
 
         # Calculate button
+        @profiled("calculate_range")
         def calculate_range():
             try:
                 # Get start date components
@@ -468,9 +1058,9 @@ def calendar_screen():
                 end_m = list(calendar.month_name).index(end_month.get())
                 end_y = int(end_year.get())
                 
-                # Create date strings for comparison
-                start_date_str = f"{start_y}-{start_m:02d}-{start_d:02d}"
-                end_date_str = f"{end_y}-{end_m:02d}-{end_d:02d}"
+                # Building the dates rejects days the month doesn't have, like February 31
+                start_date_str = date(start_y, start_m, start_d).isoformat()
+                end_date_str = date(end_y, end_m, end_d).isoformat()
                 
                 # Validate date range
                 if start_date_str > end_date_str:
@@ -478,16 +1068,7 @@ def calendar_screen():
                     return
                 
                 # Calculate totals
-                total_income = 0
-                total_expenses = 0
-                days_with_data = 0
-                
-                for date_str in sorted(financial_data.keys()):
-                    if start_date_str <= date_str <= end_date_str:
-                        data = financial_data[date_str]
-                        total_income += data["income"]
-                        total_expenses += data["expenses"]
-                        days_with_data += 1
+                total_income, total_expenses, days_with_data = ledger.range_totals(start_date_str, end_date_str)
                 
                 net_total = total_income - total_expenses
                 
@@ -503,15 +1084,37 @@ def calendar_screen():
                 tk.Label(result_window, text=f"Days with data: {days_with_data}", 
                         bg="#1C1C1C", fg="white", font=("Bubblegum Sans", 12)).pack(pady=5)
                 
-                tk.Label(result_window, text=f"Total Income: ₱{total_income:,.2f}", 
+                tk.Label(result_window, text=f"Total Income: ₱{pesos(total_income):,.2f}", 
                         bg="#1C1C1C", fg="#4CAF50", font=("Bubblegum Sans", 12)).pack(pady=5)
                 
-                tk.Label(result_window, text=f"Total Expenses: ₱{total_expenses:,.2f}", 
+                tk.Label(result_window, text=f"Total Expenses: ₱{pesos(total_expenses):,.2f}", 
                         bg="#1C1C1C", fg="#F44336", font=("Bubblegum Sans", 12)).pack(pady=5)
                 
-                tk.Label(result_window, text=f"Net Total: ₱{net_total:,.2f}", 
+                tk.Label(result_window, text=f"Net Total: ₱{pesos(net_total):,.2f}", 
                         bg="#1C1C1C", fg="#4CAF50" if net_total >= 0 else "#F44336", 
                         font=("Bubblegum Sans", 14, "bold")).pack(pady=10)
+
+                def export_range():
+                    path = filedialog.asksaveasfilename(
+                        parent=result_window, defaultextension=".csv",
+                        initialfile=f"money_rider_{start_date_str}_{end_date_str}.csv",
+                        filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl"),
+                                   ("Compressed CSV", "*.csv.gz"), ("Compressed JSON Lines", "*.jsonl.gz")])
+                    if not path:
+                        return
+                    try:
+                        count = export_rows(iter_entries(ledger, start_date_str, end_date_str), path)
+                    except OSError:
+                        messagebox.showerror("Error", "Failed to export data.", parent=result_window)
+                        return
+                    messagebox.showinfo("Export", f"Exported {count} entries.", parent=result_window)
+
+                tk.Button(result_window, text="Export...", font=("Bubblegum Sans", 12),
+                          bg="#404040", fg="white", command=export_range).pack(pady=5)
+                tk.Button(result_window, text="Analytics", font=("Bubblegum Sans", 12), bg="#404040", fg="white",
+                          command=lambda: [result_window.destroy(),
+                                           navigate_to("analytics", analytics_screen, start_date_str, end_date_str)]
+                          ).pack(pady=5)
                 
             except ValueError:
                 messagebox.showerror("Error", "Invalid date selection")
@@ -525,7 +1128,50 @@ def calendar_screen():
         nav_frame.pack(pady=10)
 
         tk.Button(nav_frame, text="Back", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
-                 command=lambda: go_back(cal)).pack(side=tk.LEFT, padx=10)
+                 command=go_back).pack(side=tk.LEFT, padx=10)
+
+    @profiled("update_calendar_grid")
+    def update_calendar_grid():
+        month_var.set(calendar.month_name[current_month])
+        year_var.set(str(current_year))
+        for combo in range_combos["months"]:
+            combo.set(calendar.month_name[current_month])
+        for combo in range_combos["years"]:
+            combo.set(str(current_year))
+
+        totals = ledger.month_totals(current_year, current_month)
+        summary_labels["month"].config(
+            text=f"Income ₱{pesos(totals['income']):,.2f}   Expenses ₱{pesos(totals['expenses']):,.2f}   "
+                 f"Net ₱{pesos(totals['net']):,.2f}   ({totals['days']} days)")
+        month_start, month_end = month_bounds(current_year, current_month)
+
+        today = datetime.now()
+        dates_with_data = ledger.month_dates(current_year, current_month)
+        recurring_dates = {occurrence[0] for occurrence in ledger.iter_recurring(month_start, month_end)}
+        month_cal = calendar.monthcalendar(current_year, current_month)
+        for cell, day_button in enumerate(day_buttons):
+            week = cell // 7
+            day = month_cal[week][cell % 7] if week < len(month_cal) else 0
+            cell_days[cell] = day
+            if day == 0:
+                # Empty space for days not in the month
+                day_button.grid_remove()
+                continue
+
+            date_str = f"{current_year}-{current_month:02d}-{day:02d}"
+            if date_str in dates_with_data:
+                # Highlight days with saved data
+                colors = ("#2196F3", "white")
+            elif (day == today.day and current_month == today.month and current_year == today.year):
+                # Highlight current day
+                colors = ("#4CAF50", "white")
+            elif date_str in recurring_dates:
+                # Only recurring entries on this day
+                colors = ("#BBDEFB", "black")
+            else:
+                colors = ("#E0E0E0", "black")
+            day_button.config(text=str(day), bg=colors[0], fg=colors[1])
+            day_button.grid()
 
     def change_month():
         nonlocal current_month
@@ -537,7 +1183,7 @@ def calendar_screen():
         if new_month == 0:
             return
         current_month = new_month
-        create_calendar_grid()
+        update_calendar_grid()
 
     def change_year():
         nonlocal current_year
@@ -545,27 +1191,30 @@ def calendar_screen():
             current_year = int(year_var.get())
         except ValueError:
             return
-        create_calendar_grid()
+        update_calendar_grid()
 
     create_calendar_grid()
-    cal.mainloop()
+
+    def refresh():
+        root.title("Money Rider - Calendar")
+        update_calendar_grid()
+
+    return cal, refresh
 
 # Income Screen
-def income_screen(day, year, month):
-    inc = tk.Tk()
-    inc.title("Income")
-    inc.geometry("570x700")
-    inc.configure(bg="#1C1C1C")
+def income_screen(parent):
+    inc = tk.Frame(parent, bg="#1C1C1C")
 
     name_var = tk.StringVar()
     income_var = tk.StringVar()
 
-    # Store the current date
-    current_date_str = f"{year}-{month:02d}-{day:02d}"
+    # The date being edited, set by refresh each time the screen is shown
+    current_date_str = ""
+    current_args = ()
+    history = None
     
     # Display the current date
-    date_label = tk.Label(inc, text=f"Date: {year}-{month:02d}-{day:02d}", 
-                         bg="#1C1C1C", fg="white", font=("Bubblegum Sans", 14))
+    date_label = tk.Label(inc, bg="#1C1C1C", fg="white", font=("Bubblegum Sans", 14))
     date_label.pack(pady=10)
 
     tk.Label(inc, text="Customer Name", bg="#1C1C1C", fg="white", font=("Bubblegum Sans", 14)).pack(pady=5)
@@ -589,14 +1238,10 @@ def income_screen(day, year, month):
     tk.Label(header_frame, text="Income".rjust(10), bg="#1C1C1C", fg="white", 
              font=("Bubblegum Sans", 14)).grid(row=0, column=1, padx=5)
 
-    # Create a listbox with monospace font for alignment
-    listbox = tk.Listbox(display_frame, width=45, font=("Courier New", 14), 
-                        bg="#404040", fg="white", justify=tk.LEFT)
-    listbox.pack()
-
-    # Populate listbox with existing entries
-    for entry in current_entries:
-        listbox.insert(tk.END, format_row(entry[0], entry[1]))
+    # Monospace font for alignment; only the rows in view are formatted
+    entry_list = VirtualList(display_frame, current_entries, width=45, font=("Courier New", 14),
+                             bg="#404040", fg="white", justify=tk.LEFT)
+    entry_list.pack()
 
     def enter_income():
         name = name_var.get()
@@ -606,68 +1251,69 @@ def income_screen(day, year, month):
             return
         
         try:
-            income_val = float(income)
+            income_val = to_centavos(income)
         except ValueError:
             messagebox.showerror("Error", "Income must be a number")
             return
             
-        entry = (name, income_val)
-        current_entries.insert(0, entry)
-        undo_stack.append(entry)
-        # Format with fixed width columns
-        listbox.insert(0, format_row(name, income_val))
+        history.add(current_entries, (name, income_val))
+        entry_list.set_rows(current_entries)
         name_var.set("")
         income_var.set("")
 
-    def undo():
-        if listbox.curselection():
-            index = listbox.curselection()[0]
-            redo_stack.append(current_entries.pop(index))
-            listbox.delete(index)
-        elif current_entries:
-            redo_stack.append(current_entries.pop(0))
-            listbox.delete(0)
-
-    def redo():
-        if redo_stack:
-            entry = redo_stack.pop()
-            current_entries.insert(0, entry)
-            listbox.insert(0, format_row(entry[0], entry[1]))
-
     button_row = tk.Frame(inc, bg="#1C1C1C")
     button_row.pack(pady=10)
 
     tk.Button(button_row, text="Enter", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
               command=enter_income, width=10).pack(side=tk.LEFT, padx=5)
     tk.Button(button_row, text="Undo", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
-              command=undo, width=10).pack(side=tk.LEFT, padx=5)
+              command=lambda: step_history(entry_list, history.undo), width=10).pack(side=tk.LEFT, padx=5)
     tk.Button(button_row, text="Redo", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
-              command=redo, width=10).pack(side=tk.LEFT, padx=5)
+              command=lambda: step_history(entry_list, history.redo), width=10).pack(side=tk.LEFT, padx=5)
     tk.Button(button_row, text="Expenses", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
-              command=lambda:[save_data(current_date_str), inc.destroy(), navigate_to("expenses", expenses_screen, day, year, month)],
+              command=lambda:[save_data(current_date_str), navigate_to("expenses", expenses_screen, *current_args)],
               width=12).pack(side=tk.LEFT, padx=5)
 
+    edit_row = tk.Frame(inc, bg="#1C1C1C")
+    edit_row.pack()
+
+    tk.Button(edit_row, text="Edit", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
+              command=lambda: edit_selected(inc, entry_list, history, "Customer Name", "Income"),
+              width=10).pack(side=tk.LEFT, padx=5)
+    tk.Button(edit_row, text="Delete", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
+              command=lambda: delete_selected(entry_list, history), width=10).pack(side=tk.LEFT, padx=5)
+
     tk.Button(inc, text="Back", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
-              command=lambda: go_back(inc)).pack(pady=10)
+              command=go_back).pack(pady=10)
+
+    def refresh(day, year, month):
+        nonlocal current_date_str, current_args, history
+        root.title("Income")
+        current_date_str = f"{year}-{month:02d}-{day:02d}"
+        current_args = (day, year, month)
+        history = ledger.command_log(current_date_str, "income")
+        date_label.config(text=f"Date: {current_date_str}")
+        name_var.set("")
+        income_var.set("")
+
+        entry_list.set_rows(current_entries)
 
-    inc.mainloop()
+    return inc, refresh
 
 # Expenses Screen
-def expenses_screen(day, year, month):
-    exp = tk.Tk()
-    exp.title("Expenses")
-    exp.geometry("570x700")
-    exp.configure(bg="#1C1C1C")
+def expenses_screen(parent):
+    exp = tk.Frame(parent, bg="#1C1C1C")
 
     expense_var = tk.StringVar()
     amount_var = tk.StringVar()
 
-    # Store the current date
-    current_date_str = f"{year}-{month:02d}-{day:02d}"
+    # The date being edited, set by refresh each time the screen is shown
+    current_date_str = ""
+    current_args = ()
+    history = None
     
     # Display the current date
-    date_label = tk.Label(exp, text=f"Date: {year}-{month:02d}-{day:02d}", 
-                         bg="#1C1C1C", fg="white", font=("Bubblegum Sans", 14))
+    date_label = tk.Label(exp, bg="#1C1C1C", fg="white", font=("Bubblegum Sans", 14))
     date_label.pack(pady=10)
 
     def add_option():
@@ -692,16 +1338,13 @@ def expenses_screen(day, year, month):
                 return
             
             try:
-                amount_val = float(amount)
+                amount_val = to_centavos(amount)
             except ValueError:
                 messagebox.showerror("Error", "Amount must be a number")
                 return
                 
-            entry = (expense, amount_val)
-            current_expenses.insert(0, entry)
-            undo_expense_stack.append(entry)
-            # Format with fixed width columns
-            listbox.insert(0, format_row(expense, amount_val))
+            history.add(current_expenses, (expense, amount_val))
+            expense_list.set_rows(current_expenses)
             expense_var.set("")
             amount_var.set("")
             popup.destroy()
@@ -721,61 +1364,51 @@ def expenses_screen(day, year, month):
     tk.Label(header_frame, text="Amount".rjust(10), bg="#1C1C1C", fg="white", 
              font=("Bubblegum Sans", 14)).grid(row=0, column=1, padx=5)
 
-    # Create a listbox with monospace font for alignment
-    listbox = tk.Listbox(display_frame, width=45, font=("Courier New", 14), 
-                        bg="#404040", fg="white", justify=tk.LEFT)
-    listbox.pack()
-
-    # Populate listbox with existing expenses
-    for expense in current_expenses:
-        listbox.insert(tk.END, format_row(expense[0], expense[1]))
-
-    def undo():
-        if listbox.curselection():
-            index = listbox.curselection()[0]
-            redo_expense_stack.append(current_expenses.pop(index))
-            listbox.delete(index)
-        elif current_expenses:
-            redo_expense_stack.append(current_expenses.pop(0))
-            listbox.delete(0)
-
-    def redo():
-        if redo_expense_stack:
-            entry = redo_expense_stack.pop()
-            current_expenses.insert(0, entry)
-            listbox.insert(0, format_row(entry[0], entry[1]))
+    # Monospace font for alignment; only the rows in view are formatted
+    expense_list = VirtualList(display_frame, current_expenses, width=45, font=("Courier New", 14),
+                               bg="#404040", fg="white", justify=tk.LEFT)
+    expense_list.pack()
 
     tk.Button(exp, text="Add Option", font=("Bubblegum Sans", 14), bg="#404040", fg="white", command=add_option).pack(pady=5)
-    tk.Button(exp, text="Undo", font=("Bubblegum Sans", 14), bg="#404040", fg="white", command=undo).pack(pady=5)
-    tk.Button(exp, text="Redo", font=("Bubblegum Sans", 14), bg="#404040", fg="white", command=redo).pack(pady=5)
+
+    edit_row = tk.Frame(exp, bg="#1C1C1C")
+    edit_row.pack(pady=5)
+
+    tk.Button(edit_row, text="Undo", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
+              command=lambda: step_history(expense_list, history.undo)).pack(side=tk.LEFT, padx=5)
+    tk.Button(edit_row, text="Redo", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
+              command=lambda: step_history(expense_list, history.redo)).pack(side=tk.LEFT, padx=5)
+    tk.Button(edit_row, text="Edit", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
+              command=lambda: edit_selected(exp, expense_list, history, "Expense", "Amount")).pack(side=tk.LEFT, padx=5)
+    tk.Button(edit_row, text="Delete", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
+              command=lambda: delete_selected(expense_list, history)).pack(side=tk.LEFT, padx=5)
 
     tk.Button(exp, text="Back", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
-              command=lambda: go_back(exp)).pack(pady=5)
+              command=go_back).pack(pady=5)
 
     tk.Button(exp, text="Show Totals", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
-              command=lambda:[save_data(current_date_str), exp.destroy(), navigate_to("total", total_screen, day, year, month)]).pack(pady=20)
+              command=lambda:[save_data(current_date_str), navigate_to("total", total_screen, *current_args)]).pack(pady=20)
+
+    def refresh(day, year, month):
+        nonlocal current_date_str, current_args, history
+        root.title("Expenses")
+        current_date_str = f"{year}-{month:02d}-{day:02d}"
+        current_args = (day, year, month)
+        history = ledger.command_log(current_date_str, "expenses")
+        date_label.config(text=f"Date: {current_date_str}")
 
-    exp.mainloop()
+        expense_list.set_rows(current_expenses)
+
+    return exp, refresh
 
 # Save data for the current date
+@profiled("save_data")
 def save_data(date_str):
-    total_income = sum(float(entry[1]) for entry in current_entries)
-    total_expenses = sum(float(expense[1]) for expense in current_expenses)
-    
-    financial_data[date_str] = {
-        "income": total_income,
-        "expenses": total_expenses,
-        "entries": current_entries.copy(),
-        "expense_entries": current_expenses.copy()
-    }
-    persist_state()
+    ledger.save_day(date_str, current_entries, current_expenses)
 
 # Total Screen
-def total_screen(day, year, month):
-    total = tk.Tk()
-    total.title("Total")
-    total.geometry("570x700")
-    total.configure(bg="#1C1C1C")
+def total_screen(parent):
+    total = tk.Frame(parent, bg="#1C1C1C")
 
     # Main frame
     main_frame = tk.Frame(total, bg="#1C1C1C")
@@ -786,54 +1419,8 @@ def total_screen(day, year, month):
             font=("Bubblegum Sans", 24, "bold")).pack(pady=20)
 
     # Date display
-    date_str = f"{year}-{month:02d}-{day:02d}"
-    tk.Label(main_frame, text=f"Date: {date_str}", bg="#1C1C1C", fg="white", 
-            font=("Bubblegum Sans", 14)).pack()
-
-    # Summary frame
-    summary_frame = tk.Frame(main_frame, bg="#2C2C2C", bd=2, relief=tk.RIDGE)
-    summary_frame.pack(fill=tk.X, padx=20, pady=10)
-
-    # Income section
-    income_frame = tk.Frame(summary_frame, bg="#2C2C2C")
-    income_frame.pack(fill=tk.X, padx=10, pady=10)
-
-    total_income = sum(float(i[1]) for i in current_entries)
-    tk.Label(income_frame, text="Total Income:", bg="#2C2C2C", fg="white", 
-            font=("Bubblegum Sans", 16)).pack(side=tk.LEFT, padx=10)
-    tk.Label(income_frame, text=f"₱{total_income:,.2f}", bg="#2C2C2C", fg="#4CAF50", 
-            font=("Bubblegum Sans", 16, "bold")).pack(side=tk.RIGHT, padx=10)
-
-    # Expenses section
-    expenses_frame = tk.Frame(summary_frame, bg="#2C2C2C")
-    expenses_frame.pack(fill=tk.X, padx=10, pady=10)
-
-    total_expenses = sum(float(e[1]) for e in current_expenses)
-    tk.Label(expenses_frame, text="Total Expenses:", bg="#2C2C2C", fg="white", 
-            font=("Bubblegum Sans", 16)).pack(side=tk.LEFT, padx=10)
-    tk.Label(expenses_frame, text=f"₱{total_expenses:,.2f}", bg="#2C2C2C", fg="#F44336", 
-            font=("Bubblegum Sans", 16, "bold")).pack(side=tk.RIGHT, padx=10)
-
-
-# Total Screen
-def total_screen(day, year, month):
-    total = tk.Tk()
-    total.title("Total")
-    total.geometry("570x700")
-    total.configure(bg="#1C1C1C")
-
-    # Main frame
-    main_frame = tk.Frame(total, bg="#1C1C1C")
-    main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
-
-    # Tit
-    tk.Label(main_frame, text="Financial Summary", bg="#1C1C1C", fg="white", 
-            font=("Bubblegum Sans", 24, "bold")).pack(pady=20)
-
-    # Date display
-    date_str = f"{year}-{month:02d}-{day:02d}"
-    tk.Label(main_frame, text=f"Date: {date_str}", bg="#1C1C1C", fg="white", 
-            font=("Bubblegum Sans", 14)).pack()
+    date_label = tk.Label(main_frame, bg="#1C1C1C", fg="white", font=("Bubblegum Sans", 14))
+    date_label.pack()
 
     # Summary frame
     summary_frame = tk.Frame(main_frame, bg="#2C2C2C", bd=2, relief=tk.RIDGE)
@@ -843,32 +1430,28 @@ def total_screen(day, year, month):
     income_frame = tk.Frame(summary_frame, bg="#2C2C2C")
     income_frame.pack(fill=tk.X, padx=10, pady=10)
 
-    total_income = sum(float(i[1]) for i in current_entries)
     tk.Label(income_frame, text="Total Income:", bg="#2C2C2C", fg="white", 
             font=("Bubblegum Sans", 16)).pack(side=tk.LEFT, padx=10)
-    tk.Label(income_frame, text=f"₱{total_income:,.2f}", bg="#2C2C2C", fg="#4CAF50", 
-            font=("Bubblegum Sans", 16, "bold")).pack(side=tk.RIGHT, padx=10)
+    income_label = tk.Label(income_frame, bg="#2C2C2C", fg="#4CAF50", font=("Bubblegum Sans", 16, "bold"))
+    income_label.pack(side=tk.RIGHT, padx=10)
 
     # Expenses section
     expenses_frame = tk.Frame(summary_frame, bg="#2C2C2C")
     expenses_frame.pack(fill=tk.X, padx=10, pady=10)
 
-    total_expenses = sum(float(e[1]) for e in current_expenses)
     tk.Label(expenses_frame, text="Total Expenses:", bg="#2C2C2C", fg="white", 
             font=("Bubblegum Sans", 16)).pack(side=tk.LEFT, padx=10)
-    tk.Label(expenses_frame, text=f"₱{total_expenses:,.2f}", bg="#2C2C2C", fg="#F44336", 
-            font=("Bubblegum Sans", 16, "bold")).pack(side=tk.RIGHT, padx=10)
+    expenses_label = tk.Label(expenses_frame, bg="#2C2C2C", fg="#F44336", font=("Bubblegum Sans", 16, "bold"))
+    expenses_label.pack(side=tk.RIGHT, padx=10)
 
     # Net total section
     net_frame = tk.Frame(summary_frame, bg="#2C2C2C")
     net_frame.pack(fill=tk.X, padx=10, pady=20)
 
-    day_total = total_income - total_expenses
     tk.Label(net_frame, text="Net Total:", bg="#2C2C2C", fg="white", 
             font=("Bubblegum Sans", 18)).pack(side=tk.LEFT, padx=10)
-    tk.Label(net_frame, text=f"₱{day_total:,.2f}", bg="#2C2C2C", 
-            fg="#4CAF50" if day_total >= 0 else "#F44336", 
-            font=("Bubblegum Sans", 18, "bold")).pack(side=tk.RIGHT, padx=10)
+    net_label = tk.Label(net_frame, bg="#2C2C2C", font=("Bubblegum Sans", 18, "bold"))
+    net_label.pack(side=tk.RIGHT, padx=10)
 
     # Navigation buttons
     button_frame = tk.Frame(main_frame, bg="#1C1C1C")
@@ -876,14 +1459,109 @@ def total_screen(day, year, month):
 
     back_btn = tk.Button(button_frame, text="Back", font=("Bubblegum Sans", 14), 
                         bg="#404040", fg="white", width=10,
-                        command=lambda: go_back(total))
+                        command=go_back)
     back_btn.pack(side=tk.LEFT, padx=10)
 
     end_btn = tk.Button(button_frame, text="End", font=("Bubblegum Sans", 14), 
                        bg="#404040", fg="white", width=10,
-                       command=lambda:[total.destroy(), navigate_to("calendar", calendar_screen)])
+                       command=lambda: navigate_to("calendar", calendar_screen))
     end_btn.pack(side=tk.LEFT, padx=10)
 
-    total.mainloop()
-
-navigate_to("splash", splash_screen)
+    def refresh(day, year, month):
+        root.title("Total")
+        date_label.config(text=f"Date: {year}-{month:02d}-{day:02d}")
+
+        total_income = entry_total(current_entries)
+        total_expenses = entry_total(current_expenses)
+        day_total = total_income - total_expenses
+        income_label.config(text=f"₱{pesos(total_income):,.2f}")
+        expenses_label.config(text=f"₱{pesos(total_expenses):,.2f}")
+        net_label.config(text=f"₱{pesos(day_total):,.2f}", fg="#4CAF50" if day_total >= 0 else "#F44336")
+
+    return total, refresh
+
+# Analytics Screen
+CHART_COLORS = {"net": "#606060", 7: "#2196F3", 30: "#FF9800"}  # Daily net and the 7/30-day moving averages
+
+
+def analytics_screen(parent):
+    frame = tk.Frame(parent, bg="#1C1C1C")
+
+    tk.Label(frame, text="Analytics", bg="#1C1C1C", fg="white",
+             font=("Bubblegum Sans", 24, "bold")).pack(pady=10)
+    range_label = tk.Label(frame, bg="#1C1C1C", fg="white", font=("Bubblegum Sans", 14))
+    range_label.pack()
+
+    # Daily net with moving averages; redrawn by refresh
+    chart = tk.Canvas(frame, width=520, height=220, bg="#2C2C2C", highlightthickness=0)
+    chart.pack(pady=10)
+
+    legend = tk.Frame(frame, bg="#1C1C1C")
+    legend.pack()
+    for key, text in (("net", "Daily net"), (7, "7-day average"), (30, "30-day average")):
+        tk.Label(legend, text=f"■ {text}", bg="#1C1C1C", fg=CHART_COLORS[key],
+                 font=("Bubblegum Sans", 11)).pack(side=tk.LEFT, padx=8)
+
+    stats_frame = tk.Frame(frame, bg="#2C2C2C", bd=2, relief=tk.RIDGE)
+    stats_frame.pack(fill=tk.X, padx=20, pady=10)
+    stat_labels = {}
+    for row, key in enumerate(("days", "total", "trend", "best", "worst")):
+        stat_labels[key] = tk.Label(stats_frame, bg="#2C2C2C", fg="white", font=("Bubblegum Sans", 12))
+        stat_labels[key].grid(row=row, column=0, columnspan=7, sticky="w", padx=10)
+
+    # Mean net per weekday over days with data
+    weekday_labels = []
+    for col in range(7):
+        tk.Label(stats_frame, text=calendar.day_abbr[col], bg="#2C2C2C", fg="white",
+                 font=("Bubblegum Sans", 11, "bold")).grid(row=5, column=col, padx=4, pady=(8, 0))
+        weekday_labels.append(tk.Label(stats_frame, bg="#2C2C2C", fg="white", font=("Courier New", 10)))
+        weekday_labels[col].grid(row=6, column=col, padx=4, pady=(0, 8))
+
+    tk.Button(frame, text="Back", font=("Bubblegum Sans", 14), bg="#404040", fg="white",
+              width=10, command=go_back).pack(pady=10)
+
+    def draw_chart(stats):
+        chart.delete("all")
+        series = {"net": stats["net"], **stats["moving_averages"]}
+        low = min(0, *(min(values) for values in series.values()))
+        high = max(0, *(max(values) for values in series.values()))
+        span = (high - low) or 1
+        width, height, pad = 520, 220, 10
+        step = (width - 2 * pad) / max(len(stats["net"]) - 1, 1)
+
+        def y(value):
+            return height - pad - (value - low) / span * (height - 2 * pad)
+
+        chart.create_line(pad, y(0), width - pad, y(0), fill="#808080", dash=(2, 2))
+        for key, values in series.items():
+            if len(values) == 1:
+                values = values * 2
+            points = [coord for i, value in enumerate(values) for coord in (pad + i * step, y(value))]
+            chart.create_line(*points, fill=CHART_COLORS[key], width=1 if key == "net" else 2)
+
+    def refresh(start_date_str, end_date_str):
+        root.title("Analytics")
+        range_label.config(text=f"{start_date_str} to {end_date_str}")
+        stats = range_analytics(ledger, start_date_str, end_date_str)
+        draw_chart(stats)
+
+        stat_labels["days"].config(text=f"Days: {stats['days']} ({stats['days_with_data']} with data)")
+        stat_labels["total"].config(text=f"Net Total: ₱{pesos(stats['total_net']):,.2f}")
+        stat_labels["trend"].config(text=f"Trend: ₱{pesos(stats['trend_per_day']):+,.2f} per day")
+        for key, label in (("best", "Best day"), ("worst", "Worst day")):
+            day = stats[f"{key}_day"]
+            stat_labels[key].config(text=f"{label}: {day[0]}  (₱{pesos(day[1]):,.2f})" if day else f"{label}: -")
+        for label, mean in zip(weekday_labels, stats["weekday_means"]):
+            label.config(text=f"{pesos(mean):,.0f}")
+
+    return frame, refresh
+
+if __name__ == "__main__":
+    root = tk.Tk()
+    root.geometry("570x700")
+    root.configure(bg="#1C1C1C")
+    watch_persistence(root)
+    navigate_to("splash", splash_screen)
+    # Idle callbacks run after the first frame is drawn, so the window never waits on the data
+    root.after_idle(start_loading, root)
+    root.mainloop()
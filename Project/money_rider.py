@@ -0,0 +1,2474 @@
+import argparse
+import atexit
+import bisect
+import calendar
+import contextlib
+import csv
+import functools
+import gzip
+import heapq
+import json
+import mmap
+import os
+import queue
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import accumulate
+from pathlib import Path
+
+try:
+    import numpy
+except ImportError:  # Optional; array("q") loops are used instead
+    numpy = None
+
+try:
+    import fcntl
+except ImportError:  # Windows locks through msvcrt instead
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+# Persistence paths
+DATA_PATH = Path(os.environ.get("MONEY_RIDER_DATA", Path(__file__).with_name("money_rider_data.json")))
+SQLITE_PATH = DATA_PATH.with_suffix(".sqlite3")
+SHARD_DIR = DATA_PATH.with_suffix("")
+BINARY_PATH = DATA_PATH.with_suffix(".mrb")
+SNAPSHOT_DIR = DATA_PATH.with_suffix(".snapshots")
+JOURNAL_COMPACT_BYTES = 1024 * 1024  # Rewrite the snapshot once the journal grows past this
+SHARD_CACHE_MONTHS = 12  # Recently viewed months kept in memory by the sharded backend
+SNAPSHOT_CHAIN_LIMIT = 64  # Deltas written after a base snapshot before the next save writes a new base
+SNAPSHOT_KEEP = 4  # Base snapshots kept, with their deltas, for point-in-time restore
+WRITE_COALESCE_SECONDS = 0.05  # Saves arriving within this window share one disk write
+IMPORT_BATCH_ROWS = 50000  # Imported rows buffered in memory before a batch is committed
+LOAD_PROGRESS_DAYS = 500  # Days parsed between progress reports while a store loads
+EXPORT_FIELDS = ("date", "type", "label", "amount")
+MAX_CENTAVOS = 2 ** 63 // 2  # Amounts stay below this so int64 columns and their sums have headroom
+PROFILE_WINDOW = 1000  # Recent durations per span name kept for percentile stats
+PROFILE_MAX_EVENTS = 200000  # Trace events kept for the Chrome trace dump
+UNDO_HISTORY_LIMIT = int(os.environ.get("MONEY_RIDER_UNDO_LIMIT", 200))  # Undo and redo steps kept per day and list
+MOVING_AVERAGE_WINDOWS = (7, 30)  # Trailing windows, in calendar days, reported by range_analytics
+UNDO_HISTORY_DAYS = 90  # Most recently edited days whose undo history is kept on disk
+RECURRENCE_UNITS = ("day", "week", "month")  # What a recurring entry's interval counts
+
+# Storage backend: "json" (snapshot + journal), "sqlite", "sharded" (one file per month),
+# "binary" (memory-mapped day table + journal) or "snapshots" (gzip base snapshots + delta files)
+STORAGE_BACKEND = os.environ.get("MONEY_RIDER_STORAGE", "json")
+
+
+class Profiler:
+    # Opt-in wall-clock spans; dumped as a Chrome trace (chrome://tracing, Perfetto) on exit
+    def __init__(self):
+        self.enabled = False
+        self.trace_path = None
+        self.origin = time.perf_counter()
+        self.events = deque(maxlen=PROFILE_MAX_EVENTS)
+        self.durations = {}  # Span name -> deque of recent durations in seconds
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def enable(self, trace_path=None):
+        if not self.enabled:
+            atexit.register(self.dump)
+        self.enabled = True
+        self.trace_path = Path(trace_path) if trace_path else None
+
+    def record(self, name, started, duration):
+        with self.lock:
+            self.events.append((name, started, duration, threading.get_ident()))
+            if name not in self.durations:
+                self.durations[name] = deque(maxlen=PROFILE_WINDOW)
+                self.counts[name] = 0
+            self.durations[name].append(duration)
+            self.counts[name] += 1
+
+    @contextlib.contextmanager
+    def _span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started, time.perf_counter() - started)
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return self._span(name)
+
+    def stats(self):
+        summary = {}
+        with self.lock:
+            windows = {name: sorted(window) for name, window in self.durations.items()}
+            counts = dict(self.counts)
+        for name, window in windows.items():
+            summary[name] = {
+                "count": counts[name],
+                "p50_ms": window[len(window) // 2] * 1000,
+                "p90_ms": window[min(len(window) - 1, int(len(window) * 0.9))] * 1000,
+                "p99_ms": window[min(len(window) - 1, int(len(window) * 0.99))] * 1000,
+                "max_ms": window[-1] * 1000,
+            }
+        return summary
+
+    def dump(self, trace_path=None):
+        trace_path = trace_path or self.trace_path
+        if trace_path is None:
+            return None
+        pid = os.getpid()
+        with self.lock:
+            events = list(self.events)
+        trace = {
+            "traceEvents": [
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": (started - self.origin) * 1e6,
+                    "dur": duration * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                }
+                for name, started, duration, tid in events
+            ],
+            "displayTimeUnit": "ms",
+            "otherData": {"stats": self.stats()},
+        }
+        with Path(trace_path).open("w", encoding="utf-8") as trace_file:
+            json.dump(trace, trace_file)
+        return trace_path
+
+
+NULL_SPAN = contextlib.nullcontext()
+profiler = Profiler()
+if os.environ.get("MONEY_RIDER_PROFILE"):
+    profiler.enable(os.environ["MONEY_RIDER_PROFILE"])
+
+
+def profiled(name):
+    # Wraps a function in a span; when profiling is off the cost is one attribute check
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return fn(*args, **kwargs)
+            with profiler._span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+# Amounts are integer centavos everywhere below; pesos() is only for display and export
+def to_centavos(amount):
+    # Typed text and float pesos both round half up to the nearest centavo
+    try:
+        value = (Decimal(str(amount).strip()) * 100).to_integral_value(ROUND_HALF_UP)
+    except ArithmeticError:  # InvalidOperation for text, Overflow for huge exponents
+        raise ValueError(f"not an amount: {amount!r}") from None
+    # NaN, Infinity and amounts too large to add up are rejected rather than stored
+    if not value.is_finite() or abs(value) >= MAX_CENTAVOS:
+        raise ValueError(f"not an amount: {amount!r}")
+    return int(value)
+
+
+def stored_centavos(amount):
+    # Data written before the switch to centavos holds float pesos; those are migrated as they load
+    return amount if isinstance(amount, int) else to_centavos(amount)
+
+
+def pesos(centavos):
+    return centavos / 100
+
+
+# Every label in memory is one shared string, however many days repeat it
+label_table = {}
+
+
+def intern_label(label):
+    return label_table.setdefault(label, label)
+
+
+def parse_entries(items, labels=None):
+    # Labels are written either in full or, with a label table, as an index into it
+    return [
+        (intern_label(labels[item[0]] if labels is not None and isinstance(item[0], int) else item[0]),
+         stored_centavos(item[1]))
+        for item in items
+        if isinstance(item, (list, tuple)) and len(item) == 2
+    ]
+
+
+def parse_day(payload, labels=None):
+    return {
+        "income": stored_centavos(payload.get("income", 0)),
+        "expenses": stored_centavos(payload.get("expenses", 0)),
+        "entries": parse_entries(payload.get("entries", []), labels),
+        "expense_entries": parse_entries(payload.get("expense_entries", []), labels),
+        "version": payload.get("version", 0),
+    }
+
+
+def parse_days(raw_days, labels=None, days=None, progress=None):
+    # Parses a stored {date: day} mapping into days; progress(done, total) hears about it as it goes
+    days = {} if days is None else days
+    total = len(raw_days)
+    for done, (date_str, payload) in enumerate(raw_days.items(), 1):
+        days[date_str] = parse_day(payload, labels)
+        if progress is not None and (done % LOAD_PROGRESS_DAYS == 0 or done == total):
+            progress(done, total)
+    return days
+
+
+def serialize_day(payload, label_ids=None):
+    if label_ids is None:
+        encode = lambda label: label
+    else:
+        encode = lambda label: label_ids.setdefault(label, len(label_ids))
+    return {
+        "income": payload.get("income", 0),
+        "expenses": payload.get("expenses", 0),
+        "entries": [[encode(entry[0]), entry[1]] for entry in payload.get("entries", [])],
+        "expense_entries": [[encode(entry[0]), entry[1]] for entry in payload.get("expense_entries", [])],
+        "version": payload.get("version", 0),
+    }
+
+
+def serialize_days(days):
+    # (label table, {date: day}) with entry labels replaced by their index in the table
+    label_ids = {}
+    encoded = {date_str: serialize_day(payload, label_ids) for date_str, payload in sorted(days.items())}
+    return list(label_ids), encoded
+
+
+def running_sums(values):
+    # [0, v0, v0 + v1, ...] as an array("q"), summed by NumPy when it is installed
+    sums = array("q", [0])
+    if numpy is not None and len(values):
+        sums.frombytes(numpy.cumsum(numpy.asarray(values, dtype=numpy.int64)).tobytes())
+    else:
+        sums.extend(accumulate(values))
+    return sums
+
+
+def add_from(column, start, delta):
+    # Adds delta to column[start:] in place; NumPy works on a view of the array's own buffer
+    if not delta or start >= len(column):
+        return
+    if numpy is not None:
+        view = numpy.frombuffer(column, dtype=numpy.int64)
+        view[start:] += delta
+        del view
+    else:
+        column[start:] = array("q", [value + delta for value in column[start:]])
+
+
+@profiled("write_json_atomic")
+def write_json_atomic(path, data, compress=False):
+    # Write to a temp file first so a crash never leaves a half-written file
+    temp_path = path.with_name(path.name + ".tmp")
+    text = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    with temp_path.open("wb") as data_file:
+        data_file.write(gzip.compress(text, mtime=0) if compress else text)
+        data_file.flush()
+        os.fsync(data_file.fileno())
+    os.replace(temp_path, path)
+
+
+class FileLock:
+    # Exclusive lock on a file shared by every process using the same data; re-entrant within a thread
+    def __init__(self, path):
+        self.path = Path(path)
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.lock_file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            try:
+                self.lock_file = self.path.open("a+b")
+                if fcntl is not None:
+                    fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+                elif msvcrt is not None:
+                    self.lock_file.seek(0)
+                    msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            except OSError:
+                if self.lock_file is not None:
+                    self.lock_file.close()
+                    self.lock_file = None
+                self.thread_lock.release()
+                raise
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self.lock_file.seek(0)
+                msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            self.lock_file.close()
+            self.lock_file = None
+        self.thread_lock.release()
+
+
+def file_identity(path):
+    # Changes whenever the file is replaced or rewritten; None when it is missing
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_dev, stat.st_mtime_ns, stat.st_size
+
+
+def read_journal(path, offset=0):
+    # JSON-lines records from byte offset on, and the offset just past the last line read
+    records = []
+    try:
+        with open(path, "rb") as journal_file:
+            journal_file.seek(offset)
+            for line in journal_file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn last line from an interrupted append
+                    continue
+            return records, journal_file.tell()
+    except OSError:
+        return records, 0
+
+
+def check_versions(days, bases, stored_version):
+    # Splits a save into the days still at the version they were edited from and the dates that are not.
+    # bases maps date -> that version; it defaults to one below the new payload's own version.
+    accepted = {}
+    conflicts = []
+    for date_str, payload in days.items():
+        base = bases[date_str] if bases and date_str in bases else payload.get("version", 0) - 1
+        if stored_version(date_str) == base:
+            accepted[date_str] = payload
+        else:
+            conflicts.append(date_str)
+    return accepted, conflicts
+
+
+def month_bounds(year, month):
+    last_day = calendar.monthrange(year, month)[1]
+    return f"{year}-{month:02d}-01", f"{year}-{month:02d}-{last_day:02d}"
+
+
+class Store:
+    # What every backend shares; each answers load_days and save_days its own way
+    def day_totals(self, start_date_str, end_date_str):
+        return [
+            (date_str, payload["income"], payload["expenses"])
+            for date_str, payload in sorted(self.load_days(start_date_str, end_date_str).items())
+        ]
+
+    def day_versions(self, start_date_str, end_date_str):
+        return {date_str: payload["version"] for date_str, payload in self.load_days(start_date_str, end_date_str).items()}
+
+    def save_day(self, date_str, payload):
+        return self.save_days({date_str: payload})
+
+    def stored_version(self, date_str):
+        payload = self.load_day(date_str)
+        return payload["version"] if payload is not None else 0
+
+
+class MemoryStore(Store):
+    # The whole history lives in self.days and self.accounts. Subclasses provide sync, which catches up with
+    # other processes under the file lock, and write_account and write_days, which put a change on disk.
+    loads_everything = True
+
+    def load_accounts(self):
+        return dict(self.accounts)
+
+    def save_account(self, username, password):
+        with self.file_lock:
+            self.sync()
+            with self.lock:
+                self.accounts[username] = password
+            self.write_account(username, password)
+
+    def load_day(self, date_str):
+        return self.days.get(date_str)
+
+    def load_days(self, start_date_str, end_date_str):
+        with self.lock:
+            items = list(self.days.items())
+        return {
+            date_str: payload
+            for date_str, payload in items
+            if start_date_str <= date_str <= end_date_str
+        }
+
+    def save_days(self, days, bases=None):
+        # Returns the dates not written because another process saved them first
+        with self.file_lock:
+            self.sync()
+            days, conflicts = check_versions(days, bases, self.stored_version)
+            if days:
+                with self.lock:
+                    self.days.update(days)
+                self.write_days(days)
+        return conflicts
+
+
+class JsonStore(MemoryStore):
+    # The whole history lives in memory; disk holds a compact snapshot plus an append-only journal.
+    # Other processes may share the files: every write first catches up with theirs under a file lock.
+
+    def __init__(self, data_path, progress=None):
+        self.data_path = Path(data_path)
+        self.journal_path = self.data_path.with_name(self.data_path.stem + ".journal")
+        self.file_lock = FileLock(self.data_path.with_name(self.data_path.stem + ".lock"))
+        self.accounts = {}
+        self.days = {}
+        self.lock = threading.Lock()  # Guards self.days against the persistence writer thread
+        self.compaction_thread = None
+        self.snapshot_identity = None
+        self.journal_offset = 0  # Journal bytes already applied to self.days
+        with self.file_lock:
+            self.load(progress)
+
+    @profiled("json_store.load")
+    def load(self, progress=None):
+        accounts = {}
+        days = {}
+        self.snapshot_identity = file_identity(self.data_path)
+        if self.data_path.exists():
+            try:
+                with self.data_path.open("r", encoding="utf-8") as data_file:
+                    raw = json.load(data_file)
+            except (json.JSONDecodeError, OSError):
+                raw = {}
+
+            accounts = raw.get("accounts", {})
+            days = parse_days(raw.get("financial_data", {}), raw.get("labels"), progress=progress)
+        with self.lock:
+            self.accounts = accounts
+            self.days = days
+
+        records, self.journal_offset = read_journal(self.journal_path)
+        self.apply_records(records)
+
+    def apply_records(self, records):
+        with self.lock:
+            for record in records:
+                if "date" in record:
+                    self.days[record["date"]] = parse_day(record.get("day", {}))
+                elif "account" in record:
+                    self.accounts[record["account"]] = record.get("password", "")
+
+    def sync(self):
+        # Called under the file lock: picks up whatever other processes wrote since we last looked
+        if file_identity(self.data_path) != self.snapshot_identity:
+            self.load()
+            return
+        records, offset = read_journal(self.journal_path, self.journal_offset)
+        if offset < self.journal_offset:
+            self.load()
+            return
+        self.apply_records(records)
+        self.journal_offset = offset
+
+    def build_snapshot(self, accounts_copy, days):
+        labels, financial_data = serialize_days(days)
+        return {"accounts": accounts_copy, "labels": labels, "financial_data": financial_data}
+
+    def write_snapshot(self, snapshot):
+        write_json_atomic(self.data_path, snapshot)
+
+    def write_full(self):
+        with self.file_lock:
+            self.sync()
+            with self.lock:
+                accounts_copy = dict(self.accounts)
+                days_copy = dict(self.days)
+            self.write_snapshot(self.build_snapshot(accounts_copy, days_copy))
+            self.journal_path.unlink(missing_ok=True)
+            self.snapshot_identity = file_identity(self.data_path)
+            self.journal_offset = 0
+
+    @profiled("json_store.append_journal")
+    def append_journal(self, records):
+        # Called under the file lock, right after sync, so the journal ends where we last read it
+        with self.journal_path.open("a", encoding="utf-8") as journal_file:
+            journal_file.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
+        self.journal_offset = self.journal_path.stat().st_size
+        if self.journal_offset > JOURNAL_COMPACT_BYTES:
+            self.start_compaction()
+
+    def start_compaction(self):
+        if self.compaction_thread is not None and self.compaction_thread.is_alive():
+            return
+
+        def compact():
+            try:
+                self.write_full()
+            except OSError:
+                # The journal is kept and compacted again on a later save
+                pass
+
+        self.compaction_thread = threading.Thread(target=compact, name="journal-compaction")
+        self.compaction_thread.start()
+
+    def write_account(self, username, password):
+        self.append_journal([{"account": username, "password": password}])
+
+    def write_days(self, days):
+        self.append_journal([{"date": date_str, "day": serialize_day(payload)} for date_str, payload in days.items()])
+
+    def close(self):
+        if self.compaction_thread is not None:
+            self.compaction_thread.join()
+
+
+class SQLiteStore(Store):
+    # Days and entries live in SQLite; callers fetch only the dates they display
+    loads_everything = False
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS accounts (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS days (
+            date TEXT PRIMARY KEY,
+            income INTEGER NOT NULL,
+            expenses INTEGER NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS labels (
+            id INTEGER PRIMARY KEY,
+            label TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS entries (
+            date TEXT NOT NULL REFERENCES days(date) ON DELETE CASCADE,
+            kind TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            label_id INTEGER NOT NULL REFERENCES labels(id),
+            amount INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_days_date ON days(date);
+        CREATE INDEX IF NOT EXISTS idx_entries_date ON entries(date, kind, position);
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        # One connection per thread; WAL lets the UI read while the writer thread commits
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        self.label_ids = {}  # label -> labels.id for labels known to be committed
+        # SQLite locks its own tables; this guards the ledger's side files next to the database
+        self.file_lock = FileLock(self.db_path.with_name(self.db_path.name + ".lock"))
+        self.conn.executescript(self.SCHEMA)
+
+    @property
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.execute("PRAGMA journal_mode = WAL")
+            self.local.conn = conn
+            with self.connections_lock:
+                self.connections.append(conn)
+        return conn
+
+    def load_accounts(self):
+        return dict(self.conn.execute("SELECT username, password FROM accounts"))
+
+    def save_account(self, username, password):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO accounts (username, password) VALUES (?, ?)",
+                (username, password),
+            )
+
+    @profiled("sqlite_store.load_days")
+    def load_days(self, start_date_str, end_date_str):
+        days = {}
+        for date_str, income, expenses, version in self.conn.execute(
+            "SELECT date, income, expenses, version FROM days WHERE date BETWEEN ? AND ? ORDER BY date",
+            (start_date_str, end_date_str),
+        ):
+            days[date_str] = {
+                "income": income, "expenses": expenses, "entries": [], "expense_entries": [], "version": version,
+            }
+        for date_str, kind, label, amount in self.conn.execute(
+            "SELECT date, kind, label, amount FROM entries JOIN labels ON labels.id = entries.label_id "
+            "WHERE date BETWEEN ? AND ? ORDER BY date, kind, position",
+            (start_date_str, end_date_str),
+        ):
+            days[date_str][kind].append((intern_label(label), amount))
+        return days
+
+    def load_day(self, date_str):
+        return self.load_days(date_str, date_str).get(date_str)
+
+    def day_totals(self, start_date_str, end_date_str):
+        return self.conn.execute(
+            "SELECT date, income, expenses FROM days WHERE date BETWEEN ? AND ? ORDER BY date",
+            (start_date_str, end_date_str),
+        ).fetchall()
+
+    def day_versions(self, start_date_str, end_date_str):
+        return dict(self.conn.execute(
+            "SELECT date, version FROM days WHERE date BETWEEN ? AND ?", (start_date_str, end_date_str)
+        ))
+
+    def label_id(self, label, new_ids):
+        # New labels go to new_ids and are only cached once their transaction commits
+        label_id = self.label_ids.get(label) or new_ids.get(label)
+        if label_id is None:
+            self.conn.execute("INSERT OR IGNORE INTO labels (label) VALUES (?)", (label,))
+            label_id = self.conn.execute("SELECT id FROM labels WHERE label = ?", (label,)).fetchone()[0]
+            new_ids[label] = label_id
+        return label_id
+
+    def write_day(self, date_str, payload, new_ids):
+        self.conn.execute("DELETE FROM entries WHERE date = ?", (date_str,))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO days (date, income, expenses, version) VALUES (?, ?, ?, ?)",
+            (date_str, payload["income"], payload["expenses"], payload.get("version", 0)),
+        )
+        self.conn.executemany(
+            "INSERT INTO entries (date, kind, position, label_id, amount) VALUES (?, ?, ?, ?, ?)",
+            [
+                (date_str, kind, position, self.label_id(entry[0], new_ids), entry[1])
+                for kind in ("entries", "expense_entries")
+                for position, entry in enumerate(payload.get(kind, []))
+            ],
+        )
+
+    def stored_version(self, date_str):
+        row = self.conn.execute("SELECT version FROM days WHERE date = ?", (date_str,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def save_days(self, days, bases=None):
+        # BEGIN IMMEDIATE takes the write lock before the versions are read, so no other process can save
+        # between the check and the write. Returns the dates another process saved first.
+        new_ids = {}
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            days, conflicts = check_versions(days, bases, self.stored_version)
+            for date_str, payload in days.items():
+                self.write_day(date_str, payload, new_ids)
+        self.label_ids.update(new_ids)
+        return conflicts
+
+    def close(self):
+        with self.connections_lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+        self.local = threading.local()
+
+
+class ShardedStore(Store):
+    # One JSON file per month; only shards that are viewed or written get parsed
+    loads_everything = False
+
+    def __init__(self, shard_dir):
+        self.shard_dir = Path(shard_dir)
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        self.accounts_path = self.shard_dir / "accounts.json"
+        self.file_lock = FileLock(self.shard_dir / ".lock")  # Shared with other processes writing the shards
+        self.shards = OrderedDict()  # LRU of month key ("YYYY-MM") -> {date: day}
+        self.lock = threading.RLock()  # Guards the LRU against the persistence writer thread
+
+    def shard_path(self, month_key):
+        return self.shard_dir / f"{month_key}.json"
+
+    def month_keys(self, start_date_str, end_date_str):
+        start_key = start_date_str[:7]
+        end_key = end_date_str[:7]
+        return sorted(
+            path.stem
+            for path in self.shard_dir.glob("[0-9][0-9][0-9][0-9]-[0-9][0-9].json")
+            if start_key <= path.stem <= end_key
+        )
+
+    @profiled("sharded_store.read_shard")
+    def read_shard(self, month_key):
+        try:
+            with self.shard_path(month_key).open("r", encoding="utf-8") as shard_file:
+                raw = json.load(shard_file)
+        except (json.JSONDecodeError, OSError):
+            return {}
+        labels = raw.get("labels")
+        return {date_str: parse_day(payload, labels) for date_str, payload in raw.get("days", {}).items()}
+
+    def get_shard(self, month_key, cache=True):
+        with self.lock:
+            if month_key in self.shards:
+                self.shards.move_to_end(month_key)
+                return self.shards[month_key]
+            days = self.read_shard(month_key)
+            if cache:
+                self.shards[month_key] = days
+                if len(self.shards) > SHARD_CACHE_MONTHS:
+                    self.shards.popitem(last=False)
+            return days
+
+    def write_shard(self, month_key, days):
+        labels, encoded = serialize_days(days)
+        write_json_atomic(self.shard_path(month_key), {"labels": labels, "days": encoded})
+
+    def load_accounts(self):
+        try:
+            with self.accounts_path.open("r", encoding="utf-8") as accounts_file:
+                return json.load(accounts_file)
+        except (json.JSONDecodeError, OSError):
+            return {}
+
+    def save_account(self, username, password):
+        with self.file_lock:
+            accounts_copy = self.load_accounts()
+            accounts_copy[username] = password
+            write_json_atomic(self.accounts_path, accounts_copy)
+
+    def load_day(self, date_str):
+        return self.get_shard(date_str[:7]).get(date_str)
+
+    def load_days(self, start_date_str, end_date_str):
+        keys = self.month_keys(start_date_str, end_date_str)
+        days = {}
+        for month_key in keys:
+            # Wide ranges are read straight through so they do not evict the viewed months
+            for date_str, payload in self.get_shard(month_key, cache=len(keys) == 1).items():
+                if start_date_str <= date_str <= end_date_str:
+                    days[date_str] = payload
+        return days
+
+    def save_days(self, days, bases=None):
+        # Each month is re-read under the file lock, so days other processes saved are merged, not overwritten.
+        # Returns the dates another process saved first.
+        by_month = {}
+        for date_str, payload in days.items():
+            by_month.setdefault(date_str[:7], {})[date_str] = payload
+        conflicts = []
+        with self.file_lock:
+            for month_key, month_days in by_month.items():
+                shard = self.read_shard(month_key)
+                month_days, month_conflicts = check_versions(
+                    month_days, bases,
+                    lambda date_str: shard[date_str]["version"] if date_str in shard else 0,
+                )
+                conflicts.extend(month_conflicts)
+                if month_days:
+                    shard.update(month_days)
+                    self.write_shard(month_key, shard)
+                with self.lock:
+                    if month_key in self.shards:
+                        self.shards[month_key] = shard
+        return conflicts
+
+    def close(self):
+        with self.lock:
+            self.shards.clear()
+
+
+# Binary ledger layout, little-endian, sections back to back:
+#   header | dates: uint32 ordinals, sorted | day records | entry records
+#   | string offsets: uint32 * (strings + 1) | UTF-8 string heap | accounts as JSON
+BINARY_MAGIC = b"MRLEDGR2"
+BINARY_HEADER = struct.Struct("<8sQQQ")  # magic, days, entries, strings
+# income, expenses, income entry start/count, expense entry start/count, version
+BINARY_DAY = struct.Struct("<qqIIIIQ")
+BINARY_ENTRY = struct.Struct("<Iq")  # label string id, amount
+
+
+def write_binary_ledger(path, accounts, days):
+    # days yields (date, day) in date order; labels are stored once in the string heap
+    dates = array("I")
+    day_records = bytearray()
+    entry_records = bytearray()
+    strings = {}
+    entry_count = 0
+    for date_str, payload in days:
+        dates.append(date.fromisoformat(date_str).toordinal())
+        starts = []
+        for field in ("entries", "expense_entries"):
+            starts.append(entry_count)
+            for label, amount in payload[field]:
+                entry_records += BINARY_ENTRY.pack(strings.setdefault(label, len(strings)), amount)
+                entry_count += 1
+        day_records += BINARY_DAY.pack(payload["income"], payload["expenses"], starts[0], starts[1] - starts[0],
+                                       starts[1], entry_count - starts[1], payload.get("version", 0))
+    heap = bytearray()
+    offsets = array("I", [0])
+    for label in strings:
+        heap += label.encode("utf-8")
+        offsets.append(len(heap))
+    if sys.byteorder == "big":
+        dates.byteswap()
+        offsets.byteswap()
+
+    path = Path(path)
+    temp_path = path.with_name(path.name + ".tmp")
+    with temp_path.open("wb") as binary_file:
+        binary_file.write(BINARY_HEADER.pack(BINARY_MAGIC, len(dates), entry_count, len(strings)))
+        for section in (dates.tobytes(), day_records, entry_records, offsets.tobytes(), heap):
+            binary_file.write(section)
+        binary_file.write(json.dumps(accounts, separators=(",", ":")).encode("utf-8"))
+        binary_file.flush()
+        os.fsync(binary_file.fileno())
+    os.replace(temp_path, path)
+    return len(dates)
+
+
+class BinaryStore(Store):
+    # A memory-mapped binary snapshot; days are decoded only when read. Saves go to a JSON-lines
+    # journal kept in memory as an overlay until it is folded into a new snapshot. Writes catch up
+    # with other processes' journal records, or their new snapshot, under a file lock.
+    loads_everything = False
+
+    def __init__(self, binary_path):
+        self.binary_path = Path(binary_path)
+        self.journal_path = self.binary_path.with_name(self.binary_path.name + ".journal")
+        self.file_lock = FileLock(self.binary_path.with_name(self.binary_path.name + ".lock"))
+        self.lock = threading.RLock()  # Guards the map and overlay against the persistence writer thread
+        self.binary_file = None
+        self.map = None
+        self.views = []
+        self.overlay = {}  # Days saved since the snapshot was written
+        self.accounts = {}
+        self.snapshot_identity = None
+        self.journal_offset = 0  # Journal bytes already applied to the overlay
+        with self.file_lock:
+            self.open_snapshot()
+            self.replay_journal()
+
+    def open_snapshot(self):
+        self.dates = ()
+        self.day_count = 0
+        self.snapshot_identity = file_identity(self.binary_path)
+        if not self.binary_path.exists():
+            self.accounts = {}
+            return
+        self.binary_file = self.binary_path.open("rb")
+        self.map = mmap.mmap(self.binary_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.day_count, entry_count, string_count = BINARY_HEADER.unpack_from(self.map, 0)
+        if magic != BINARY_MAGIC:
+            raise ValueError(f"{self.binary_path} is not a Money Rider binary ledger")
+        dates_offset = BINARY_HEADER.size
+        self.days_offset = dates_offset + 4 * self.day_count
+        self.entries_offset = self.days_offset + BINARY_DAY.size * self.day_count
+        offsets_offset = self.entries_offset + BINARY_ENTRY.size * entry_count
+        self.heap_offset = offsets_offset + 4 * (string_count + 1)
+        self.dates = self.uint32_column(dates_offset, self.day_count)
+        self.string_offsets = self.uint32_column(offsets_offset, string_count + 1)
+        accounts_offset = self.heap_offset + self.string_offsets[string_count]
+        self.accounts = json.loads(self.map[accounts_offset:].decode("utf-8") or "{}")
+
+    def uint32_column(self, offset, count):
+        # Zero-copy on little-endian machines; byte-swapped into a copy elsewhere
+        view = memoryview(self.map)[offset:offset + 4 * count]
+        self.views.append(view)
+        if sys.byteorder == "big":
+            column = array("I", view)
+            column.byteswap()
+            return column
+        return view.cast("I")
+
+    def close_snapshot(self):
+        for view in self.views:
+            view.release()
+        self.views = []
+        self.dates = ()
+        self.string_offsets = ()
+        if self.map is not None:
+            self.map.close()
+            self.binary_file.close()
+        self.map = None
+        self.binary_file = None
+
+    def replay_journal(self):
+        records, self.journal_offset = read_journal(self.journal_path, self.journal_offset)
+        for record in records:
+            if "date" in record:
+                self.overlay[record["date"]] = parse_day(record.get("day", {}))
+            elif "account" in record:
+                self.accounts[record["account"]] = record.get("password", "")
+
+    def sync(self):
+        # Called under the file lock: picks up other processes' saves, or the snapshot one of them compacted
+        with self.lock:
+            if file_identity(self.binary_path) != self.snapshot_identity:
+                self.close_snapshot()
+                self.overlay = {}
+                self.journal_offset = 0
+                self.open_snapshot()
+            self.replay_journal()
+
+    def bounds(self, start_date_str, end_date_str):
+        # Dates are compared as ISO strings, like every other store, so loose bounds such as "9999-12-31" work
+        key = lambda ordinal: date.fromordinal(ordinal).isoformat()
+        return (
+            bisect.bisect_left(self.dates, start_date_str, key=key),
+            bisect.bisect_right(self.dates, end_date_str, key=key),
+        )
+
+    def label(self, string_id):
+        start, end = self.string_offsets[string_id], self.string_offsets[string_id + 1]
+        return intern_label(self.map[self.heap_offset + start:self.heap_offset + end].decode("utf-8"))
+
+    def decode_entries(self, start, count):
+        offset = self.entries_offset + BINARY_ENTRY.size * start
+        return [
+            (self.label(string_id), amount)
+            for string_id, amount in BINARY_ENTRY.iter_unpack(self.map[offset:offset + BINARY_ENTRY.size * count])
+        ]
+
+    def day_record(self, pos):
+        return BINARY_DAY.unpack_from(self.map, self.days_offset + BINARY_DAY.size * pos)
+
+    def decode_day(self, pos):
+        income, expenses, income_start, income_count, expense_start, expense_count, version = self.day_record(pos)
+        return {
+            "income": income,
+            "expenses": expenses,
+            "entries": self.decode_entries(income_start, income_count),
+            "expense_entries": self.decode_entries(expense_start, expense_count),
+            "version": version,
+        }
+
+    def load_accounts(self):
+        with self.lock:
+            return dict(self.accounts)
+
+    def save_account(self, username, password):
+        with self.file_lock:
+            self.sync()
+            with self.lock:
+                self.accounts[username] = password
+            self.append_journal([{"account": username, "password": password}])
+
+    @profiled("binary_store.load_days")
+    def load_days(self, start_date_str, end_date_str):
+        with self.lock:
+            lo, hi = self.bounds(start_date_str, end_date_str)
+            days = {date.fromordinal(self.dates[pos]).isoformat(): self.decode_day(pos) for pos in range(lo, hi)}
+            days.update(
+                (date_str, payload) for date_str, payload in self.overlay.items()
+                if start_date_str <= date_str <= end_date_str
+            )
+        return days
+
+    def load_day(self, date_str):
+        return self.load_days(date_str, date_str).get(date_str)
+
+    def day_totals(self, start_date_str, end_date_str):
+        # Only the fixed-width day records are read; entries and labels stay untouched
+        with self.lock:
+            lo, hi = self.bounds(start_date_str, end_date_str)
+            size = BINARY_DAY.size
+            records = BINARY_DAY.iter_unpack(
+                self.map[self.days_offset + size * lo:self.days_offset + size * hi]
+            ) if hi > lo else ()
+            totals = {
+                date.fromordinal(ordinal).isoformat(): (record[0], record[1])
+                for ordinal, record in zip(self.dates[lo:hi], records)
+            }
+            totals.update(
+                (date_str, (payload["income"], payload["expenses"])) for date_str, payload in self.overlay.items()
+                if start_date_str <= date_str <= end_date_str
+            )
+        return [(date_str, income, expenses) for date_str, (income, expenses) in sorted(totals.items())]
+
+    def day_versions(self, start_date_str, end_date_str):
+        with self.lock:
+            lo, hi = self.bounds(start_date_str, end_date_str)
+            size = BINARY_DAY.size
+            records = BINARY_DAY.iter_unpack(
+                self.map[self.days_offset + size * lo:self.days_offset + size * hi]
+            ) if hi > lo else ()
+            versions = {
+                date.fromordinal(ordinal).isoformat(): record[6]
+                for ordinal, record in zip(self.dates[lo:hi], records)
+            }
+            versions.update(
+                (date_str, payload["version"]) for date_str, payload in self.overlay.items()
+                if start_date_str <= date_str <= end_date_str
+            )
+        return versions
+
+    def stored_version(self, date_str):
+        if date_str in self.overlay:
+            return self.overlay[date_str]["version"]
+        lo, hi = self.bounds(date_str, date_str)
+        return self.day_record(lo)[6] if hi > lo else 0
+
+    def save_days(self, days, bases=None):
+        # Returns the dates not written because another process saved them first
+        with self.file_lock:
+            self.sync()
+            with self.lock:
+                days, conflicts = check_versions(days, bases, self.stored_version)
+                self.overlay.update(days)
+            if days:
+                self.append_journal(
+                    [{"date": date_str, "day": serialize_day(payload)} for date_str, payload in days.items()]
+                )
+        return conflicts
+
+    def append_journal(self, records):
+        # Called under the file lock, right after sync, so the journal ends where we last read it
+        with self.journal_path.open("a", encoding="utf-8") as journal_file:
+            journal_file.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
+        self.journal_offset = self.journal_path.stat().st_size
+        if self.journal_offset > JOURNAL_COMPACT_BYTES:
+            self.compact()
+
+    @profiled("binary_store.compact")
+    def compact(self):
+        # Folds the overlay into a fresh snapshot; the journal is only dropped once the new file is in place
+        with self.file_lock, self.lock:
+            self.sync()
+            days = self.load_days("0000-00-00", "9999-12-31")
+            self.close_snapshot()
+            write_binary_ledger(self.binary_path, self.accounts, sorted(days.items()))
+            self.journal_path.unlink(missing_ok=True)
+            self.overlay = {}
+            self.journal_offset = 0
+            self.open_snapshot()
+
+    def close(self):
+        with self.lock:
+            self.close_snapshot()
+
+
+def migrate_json_to_binary(json_path=DATA_PATH, binary_path=BINARY_PATH):
+    source = JsonStore(json_path)
+    return write_binary_ledger(binary_path, source.accounts, sorted(source.days.items()))
+
+
+def migrate_store_to_json(source, json_path=DATA_PATH):
+    # The way back from any backend; the JSON journal is dropped so it cannot replay older days on top
+    json_path = Path(json_path)
+    days = source.load_days("0000-00-00", "9999-12-31")
+    labels, financial_data = serialize_days(days)
+    write_json_atomic(json_path, {"accounts": source.load_accounts(), "labels": labels, "financial_data": financial_data})
+    json_path.with_name(json_path.stem + ".journal").unlink(missing_ok=True)
+    return len(days)
+
+
+class DeltaStore(MemoryStore):
+    # Everything lives in memory, like JsonStore. Disk holds gzip base snapshots, each followed by small
+    # gzip deltas with the days saved since the file before; files share one numbering, oldest first.
+    # Other processes may add files too: writes read theirs first, under a file lock.
+
+    def __init__(self, snapshot_dir, progress=None):
+        self.snapshot_dir = Path(snapshot_dir)
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        self.accounts = {}
+        self.days = {}
+        self.lock = threading.Lock()  # Guards self.days against the persistence writer thread
+        self.file_lock = FileLock(self.snapshot_dir / ".lock")  # Keeps file numbers in the order changes were made
+        self.sequence = 0  # Number of the newest file
+        self.chain_length = 0  # Deltas since the newest base snapshot
+        with self.file_lock:
+            self.load(progress)
+
+    def points(self):
+        # [(number, "base" or "delta", path)], oldest first
+        points = []
+        for path in self.snapshot_dir.glob("*.json.gz"):
+            kind, _, number = path.name[:-len(".json.gz")].partition("-")
+            if kind in ("base", "delta") and number.isdigit():
+                points.append((int(number), kind, path))
+        return sorted(points)
+
+    def state_at(self, sequence=None, after=None, accounts=None, days=None, progress=None):
+        # Accounts and days as of file number sequence: the last base at or before it, then its deltas.
+        # With after, only the deltas past that number are applied on top of accounts and days.
+        points = [point for point in self.points() if sequence is None or point[0] <= sequence]
+        bases = [position for position, point in enumerate(points) if point[1] == "base"]
+        if after is None or any(points[position][0] > after for position in bases):
+            accounts = {}
+            days = {}
+            points = points[bases[-1] if bases else 0:]
+        else:
+            points = [point for point in points if point[0] > after]
+        for number, kind, path in points:
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as snapshot_file:
+                    raw = json.load(snapshot_file)
+            except (OSError, EOFError, json.JSONDecodeError):
+                # A damaged file only loses its own changes; later deltas still apply
+                continue
+            accounts.update(raw.get("accounts", {}))
+            parse_days(raw.get("days", {}), raw.get("labels"), days, progress)
+        return accounts, days
+
+    @profiled("delta_store.load")
+    def load(self, progress=None):
+        with self.lock:
+            self.accounts, self.days = self.state_at(progress=progress)
+        self.count_chain()
+
+    def count_chain(self):
+        points = self.points()
+        bases = [position for position, point in enumerate(points) if point[1] == "base"]
+        self.sequence = points[-1][0] if points else 0
+        self.chain_length = len(points) - 1 - bases[-1] if bases else len(points)
+
+    def sync(self):
+        # Called under the file lock: applies the files other processes added since ours
+        points = self.points()
+        if not points or points[-1][0] == self.sequence:
+            return
+        with self.lock:
+            self.accounts, self.days = self.state_at(
+                after=self.sequence, accounts=dict(self.accounts), days=dict(self.days))
+        self.count_chain()
+
+    def write_file(self, kind, data):
+        with self.file_lock:
+            self.sequence += 1
+            write_json_atomic(self.snapshot_dir / f"{kind}-{self.sequence:06d}.json.gz", data, compress=True)
+            if kind == "base":
+                self.chain_length = 0
+                self.prune()
+            else:
+                self.chain_length += 1
+
+    def prune(self):
+        # Drops everything older than the oldest base snapshot that is kept
+        bases = [number for number, kind, _ in self.points() if kind == "base"]
+        if len(bases) <= SNAPSHOT_KEEP:
+            return
+        oldest_kept = bases[-SNAPSHOT_KEEP]
+        for number, _, path in self.points():
+            if number < oldest_kept:
+                path.unlink(missing_ok=True)
+
+    @profiled("delta_store.rebase")
+    def rebase(self):
+        with self.file_lock:
+            with self.lock:
+                accounts_copy = dict(self.accounts)
+                days_copy = dict(self.days)
+            labels, encoded = serialize_days(days_copy)
+            self.write_file("base", {"accounts": accounts_copy, "labels": labels, "days": encoded})
+
+    def reset(self, accounts, days):
+        # Makes accounts and days the whole ledger, written as a new base snapshot
+        with self.file_lock:
+            self.sync()
+            with self.lock:
+                self.accounts = dict(accounts)
+                self.days = dict(days)
+            self.rebase()
+
+    def restore(self, sequence):
+        # The restored state goes on top of the history, so the restore itself can be undone the same way
+        points = self.points()
+        bases = [number for number, kind, _ in points if kind == "base"]
+        if not bases or sequence < bases[0] or sequence not in {number for number, _, _ in points}:
+            raise ValueError(f"point {sequence} is not kept")
+        with self.file_lock:
+            self.reset(*self.state_at(sequence))
+
+    def write_account(self, username, password):
+        self.write_file("delta", {"accounts": {username: password}})
+
+    def write_days(self, days):
+        if self.chain_length >= SNAPSHOT_CHAIN_LIMIT:
+            self.rebase()
+        else:
+            labels, encoded = serialize_days(days)
+            self.write_file("delta", {"labels": labels, "days": encoded})
+
+    def close(self):
+        pass
+
+
+def migrate_json_to_deltas(json_path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    source = JsonStore(json_path)
+    DeltaStore(snapshot_dir).reset(source.accounts, source.days)
+    return len(source.days)
+
+
+def migrate_json_to_shards(json_path=DATA_PATH, shard_dir=SHARD_DIR):
+    source = JsonStore(json_path)
+    target = ShardedStore(shard_dir)
+    by_month = {}
+    for date_str, payload in source.days.items():
+        by_month.setdefault(date_str[:7], {})[date_str] = payload
+    for month_key, days in by_month.items():
+        target.write_shard(month_key, days)
+    write_json_atomic(target.accounts_path, source.accounts)
+    return len(source.days)
+
+
+def migrate_json_to_sqlite(json_path=DATA_PATH, db_path=SQLITE_PATH):
+    source = JsonStore(json_path)
+    target = SQLiteStore(db_path)
+    try:
+        with target.conn:
+            for username, password in source.accounts.items():
+                target.conn.execute(
+                    "INSERT OR REPLACE INTO accounts (username, password) VALUES (?, ?)",
+                    (username, password),
+                )
+            new_ids = {}
+            for date_str, payload in source.days.items():
+                target.write_day(date_str, payload, new_ids)
+    finally:
+        target.close()
+    return len(source.days)
+
+
+class PersistenceWriter:
+    # Background thread that takes saves off the Tk event loop and coalesces bursts into one write
+    def __init__(self, target_store):
+        self.store = target_store
+        self.pending_days = {}
+        self.pending_bases = {}  # Stored version each pending day was edited from, kept across coalesced saves
+        self.pending_accounts = {}
+        self.failed_days = {}  # Writes that raised; retried with the next save, or on close
+        self.failed_bases = {}
+        self.failed_accounts = {}
+        self.in_flight_days = {}
+        self.writing = False
+        self.stopped = False
+        self.errors = queue.Queue()  # Drained on the UI thread by watch_persistence
+        self.conflicts = queue.Queue()  # Dates another process saved first; drained by Ledger.take_conflicts
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name="persistence-writer", daemon=True)
+        self.thread.start()
+
+    def save_day(self, date_str, payload):
+        with self.condition:
+            self.pending_bases.setdefault(date_str, payload["version"] - 1)
+            self.pending_days[date_str] = payload
+            self.condition.notify_all()
+
+    def save_account(self, username, password):
+        with self.condition:
+            self.pending_accounts[username] = password
+            self.condition.notify_all()
+
+    def unsaved_days(self):
+        with self.condition:
+            days = dict(self.failed_days)
+            days.update(self.in_flight_days)
+            days.update(self.pending_days)
+            return days
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not (self.pending_days or self.pending_accounts or self.stopped):
+                    self.condition.wait()
+                stopping = self.stopped
+                if stopping and not (self.pending_days or self.pending_accounts
+                                     or self.failed_days or self.failed_accounts):
+                    return
+            if not stopping:
+                # Let a burst of saves pile up so they go out as one write
+                time.sleep(WRITE_COALESCE_SECONDS)
+            with self.condition:
+                days, self.pending_days = self.pending_days, {}
+                bases, self.pending_bases = self.pending_bases, {}
+                failed_days, self.failed_days = self.failed_days, {}
+                failed_bases, self.failed_bases = self.failed_bases, {}
+                accounts, self.failed_accounts = self.failed_accounts, {}
+                accounts.update(self.pending_accounts)
+                self.pending_accounts = {}
+                # A newer save replaces a failed day but keeps its base: the failed write never landed
+                for date_str in days:
+                    if date_str in failed_bases:
+                        bases[date_str] = failed_bases[date_str]
+                retries = {date_str: payload for date_str, payload in failed_days.items() if date_str not in days}
+                bases.update((date_str, failed_bases[date_str]) for date_str in retries)
+                self.in_flight_days = {**retries, **days}
+                self.writing = True
+            try:
+                with profiler.span("persist_state"):
+                    for username, password in accounts.items():
+                        try:
+                            self.store.save_account(username, password)
+                        except Exception as exc:  # Retried with the next save, like a failed day
+                            self.errors.put(f"Failed to save data to disk: {exc}")
+                            with self.condition:
+                                self.failed_accounts.setdefault(username, password)
+                    if days:
+                        self.write_days(days, bases)
+                    # Each retry goes in a call of its own, so a day that keeps failing holds back only itself
+                    for date_str, payload in retries.items():
+                        self.write_days({date_str: payload}, bases)
+            finally:
+                with self.condition:
+                    self.in_flight_days = {}
+                    self.writing = False
+                    self.condition.notify_all()
+            if stopping and not (self.pending_days or self.pending_accounts):
+                return  # The last try on close; what still failed was reported
+
+    def write_days(self, days, bases):
+        try:
+            conflicts = self.store.save_days(days, bases)
+        except Exception as exc:  # Anything escaping would end the thread and leave flush() waiting forever
+            if len(days) > 1:
+                # Written again a day at a time, so the days that can be saved still are
+                for date_str, payload in days.items():
+                    self.write_days({date_str: payload}, bases)
+                return
+            self.errors.put(f"Failed to save data to disk: {exc}")
+            with self.condition:
+                for date_str, payload in days.items():
+                    if date_str in self.pending_days:
+                        self.pending_bases[date_str] = bases[date_str]
+                    else:
+                        self.failed_days[date_str] = payload
+                        self.failed_bases[date_str] = bases[date_str]
+            return
+        for date_str in conflicts:
+            self.conflicts.put(date_str)
+
+    def flush(self):
+        with self.condition:
+            while self.pending_days or self.pending_accounts or self.writing:
+                self.condition.wait()
+
+    def close(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+
+
+def json_data_exists(json_path=DATA_PATH):
+    return json_path.exists() or json_path.with_name(json_path.stem + ".journal").exists()
+
+
+def read_accounts(data_path=DATA_PATH):
+    # The accounts file is small, so a login screen can use it before a large history is read.
+    # None when it has not been written yet.
+    try:
+        with Path(data_path).with_suffix(".accounts.json").open("r", encoding="utf-8") as accounts_file:
+            return json.load(accounts_file)["accounts"]
+    except (OSError, json.JSONDecodeError, KeyError):
+        return None
+
+
+def open_store(backend=None, data_path=DATA_PATH, progress=None):
+    # progress(done, total) follows the days being parsed by the backends that read everything up front
+    backend = backend or STORAGE_BACKEND
+    data_path = Path(data_path)
+    sqlite_path = data_path.with_suffix(".sqlite3")
+    shard_dir = data_path.with_suffix("")
+    binary_path = data_path.with_suffix(".mrb")
+    snapshot_dir = data_path.with_suffix(".snapshots")
+    # The first run on another backend picks up whatever the JSON backend had saved
+    if backend == "sqlite":
+        if not sqlite_path.exists() and json_data_exists(data_path):
+            migrate_json_to_sqlite(data_path, sqlite_path)
+        return SQLiteStore(sqlite_path)
+    if backend == "sharded":
+        if not shard_dir.exists() and json_data_exists(data_path):
+            migrate_json_to_shards(data_path, shard_dir)
+        return ShardedStore(shard_dir)
+    if backend == "binary":
+        if not binary_path.exists() and json_data_exists(data_path):
+            migrate_json_to_binary(data_path, binary_path)
+        return BinaryStore(binary_path)
+    if backend == "snapshots":
+        if not snapshot_dir.exists() and json_data_exists(data_path):
+            migrate_json_to_deltas(data_path, snapshot_dir)
+        return DeltaStore(snapshot_dir, progress)
+    return JsonStore(data_path, progress)
+
+
+class RangeIndex:
+    # Sorted dates with running income/expense sums; a range total is two bisects and a subtraction
+    def __init__(self, rows=()):
+        rows = list(rows)
+        self.dates = [row[0] for row in rows]
+        self.income_sums = running_sums([row[1] for row in rows])
+        self.expense_sums = running_sums([row[2] for row in rows])
+
+    def update(self, date_str, income, expenses):
+        pos = bisect.bisect_left(self.dates, date_str)
+        if pos == len(self.dates):
+            # New latest day, the usual case for a rider logging today
+            self.dates.append(date_str)
+            self.income_sums.append(self.income_sums[-1] + income)
+            self.expense_sums.append(self.expense_sums[-1] + expenses)
+            return
+        if self.dates[pos] == date_str:
+            income_delta = income - (self.income_sums[pos + 1] - self.income_sums[pos])
+            expense_delta = expenses - (self.expense_sums[pos + 1] - self.expense_sums[pos])
+        else:
+            self.dates.insert(pos, date_str)
+            self.income_sums.insert(pos + 1, self.income_sums[pos])
+            self.expense_sums.insert(pos + 1, self.expense_sums[pos])
+            income_delta = income
+            expense_delta = expenses
+        add_from(self.income_sums, pos + 1, income_delta)
+        add_from(self.expense_sums, pos + 1, expense_delta)
+
+    def bounds(self, start_date_str, end_date_str):
+        return (
+            bisect.bisect_left(self.dates, start_date_str),
+            bisect.bisect_right(self.dates, end_date_str),
+        )
+
+    def totals(self, start_date_str, end_date_str):
+        lo, hi = self.bounds(start_date_str, end_date_str)
+        if lo >= hi:
+            return 0, 0, 0
+        return (
+            self.income_sums[hi] - self.income_sums[lo],
+            self.expense_sums[hi] - self.expense_sums[lo],
+            hi - lo,
+        )
+
+    def dates_between(self, start_date_str, end_date_str):
+        lo, hi = self.bounds(start_date_str, end_date_str)
+        return self.dates[lo:hi]
+
+    def rows(self, start_date_str, end_date_str):
+        # (date, income, expenses) of each day in the range, in date order
+        lo, hi = self.bounds(start_date_str, end_date_str)
+        return [
+            (self.dates[pos], self.income_sums[pos + 1] - self.income_sums[pos],
+             self.expense_sums[pos + 1] - self.expense_sums[pos])
+            for pos in range(lo, hi)
+        ]
+
+
+class Rollups:
+    # Totals, day counts and best/worst days per month ("YYYY-MM") and year ("YYYY"), updated by deltas
+    def __init__(self, rows=()):
+        self.month_days = {}  # Month -> {date: (income, expenses)}, at most 31 entries each
+        self.months = {}
+        self.years = {}
+        for date_str, income, expenses in rows:
+            self.month_days.setdefault(date_str[:7], {})[date_str] = (income, expenses)
+        for month_key, days in self.month_days.items():
+            month = self.months[month_key] = self.empty_summary()
+            for income, expenses in days.values():
+                self.add_to(month, income, expenses, 1)
+            self.refresh_extremes(month_key)
+            year = self.years.setdefault(month_key[:4], self.empty_summary())
+            self.add_to(year, month["income"], month["expenses"], month["days"])
+        for year_key in self.years:
+            self.refresh_year_extremes(year_key)
+
+    @staticmethod
+    def empty_summary():
+        return {"income": 0, "expenses": 0, "net": 0, "days": 0, "min_day": None, "max_day": None}
+
+    @staticmethod
+    def add_to(summary, income, expenses, days):
+        summary["income"] += income
+        summary["expenses"] += expenses
+        summary["net"] = summary["income"] - summary["expenses"]
+        summary["days"] += days
+
+    def refresh_extremes(self, month_key):
+        # (date, net) of the lowest and highest day; a month is small enough to rescan
+        days = self.month_days[month_key]
+        month = self.months[month_key]
+        nets = [(income - expenses, date_str) for date_str, (income, expenses) in days.items()]
+        month["min_day"] = min(nets)[::-1] if nets else None
+        month["max_day"] = max(nets)[::-1] if nets else None
+
+    def refresh_year_extremes(self, year_key):
+        keys = (f"{year_key}-{month:02d}" for month in range(1, 13))
+        months = [self.months[key] for key in keys if key in self.months and self.months[key]["days"]]
+        year = self.years[year_key]
+        year["min_day"] = min((month["min_day"] for month in months), key=lambda day: day[1], default=None)
+        year["max_day"] = max((month["max_day"] for month in months), key=lambda day: day[1], default=None)
+
+    def update(self, date_str, income, expenses):
+        month_key = date_str[:7]
+        year_key = date_str[:4]
+        days = self.month_days.setdefault(month_key, {})
+        old_income, old_expenses = days.get(date_str, (0, 0))
+        new_days = 0 if date_str in days else 1
+        days[date_str] = (income, expenses)
+        month = self.months.setdefault(month_key, self.empty_summary())
+        year = self.years.setdefault(year_key, self.empty_summary())
+        for summary in (month, year):
+            self.add_to(summary, income - old_income, expenses - old_expenses, new_days)
+        self.refresh_extremes(month_key)
+        self.refresh_year_extremes(year_key)
+
+    def month(self, year, month):
+        return self.months.get(f"{year}-{month:02d}") or self.empty_summary()
+
+    def month_rows(self, year, month):
+        days = self.month_days.get(f"{year}-{month:02d}", {})
+        return [(date_str, income, expenses) for date_str, (income, expenses) in sorted(days.items())]
+
+    def year(self, year):
+        return self.years.get(str(year)) or self.empty_summary()
+
+
+class LabelIndex:
+    # Inverted index from lowercased label words to the dates and positions of the entries using them.
+    # A posting is the entry's position in "entries", or -1 - position in "expense_entries".
+    # Positions only hold for the version of the day they were read from, so that is kept too.
+    def __init__(self, postings=None, versions=None):
+        self.postings = postings or {}  # Token -> {date: [posting, ...]}
+        self.versions = versions or {}  # Date -> version of the day indexed
+        self.tokens = sorted(self.postings)  # Sorted, so a prefix is a bisect away
+        self.day_tokens = None  # Date -> tokens it is posted under; built on the first update
+
+    @staticmethod
+    def tokenize(text):
+        return re.findall(r"\w+", str(text).lower())
+
+    def update_day(self, date_str, payload):
+        # payload None drops the day
+        if self.day_tokens is None:
+            self.day_tokens = {}
+            for token, dates in self.postings.items():
+                for day_str in dates:
+                    self.day_tokens.setdefault(day_str, set()).add(token)
+        for token in self.day_tokens.pop(date_str, ()):
+            dates = self.postings[token]
+            del dates[date_str]
+            if not dates:
+                del self.postings[token]
+                del self.tokens[bisect.bisect_left(self.tokens, token)]
+        if payload is None:
+            self.versions.pop(date_str, None)
+            return
+        self.versions[date_str] = payload.get("version", 0)
+        day_tokens = set()
+        for field, encode in (("entries", lambda position: position),
+                              ("expense_entries", lambda position: -1 - position)):
+            for position, entry in enumerate(payload[field]):
+                for token in set(self.tokenize(entry[0])):
+                    dates = self.postings.get(token)
+                    if dates is None:
+                        dates = self.postings[token] = {}
+                        bisect.insort(self.tokens, token)
+                    dates.setdefault(date_str, []).append(encode(position))
+                    day_tokens.add(token)
+        if day_tokens:
+            self.day_tokens[date_str] = day_tokens
+
+    def prefix_tokens(self, word):
+        lo = bisect.bisect_left(self.tokens, word)
+        return self.tokens[lo:bisect.bisect_left(self.tokens, word + "\uffff", lo)]
+
+    def search(self, query, limit=None):
+        # Each query word is a prefix; an entry matches when every word matches one of its tokens.
+        # Dates are intersected first so common words like "customer" only cost a set of dates.
+        words = [[self.postings[token] for token in self.prefix_tokens(word)] for word in set(self.tokenize(query))]
+        if not words:
+            return []
+        words.sort(key=lambda word: sum(len(dates) for dates in word))
+        candidates = None
+        for word in words:
+            word_dates = set().union(*word)
+            candidates = word_dates if candidates is None else candidates & word_dates
+        hits = []
+        for date_str in sorted(candidates, reverse=True):
+            matched = None
+            for word in words:
+                postings = set()
+                for dates in word:
+                    postings.update(dates.get(date_str, ()))
+                matched = postings if matched is None else matched & postings
+            # Newest day first, income before expenses, each in list order
+            for posting in sorted(matched, key=lambda posting: (posting < 0, abs(posting))):
+                hits.append((date_str, "income", posting) if posting >= 0 else (date_str, "expense", -1 - posting))
+            if limit is not None and len(hits) >= limit:
+                return hits[:limit]
+        return hits
+
+
+def entry_total(entries):
+    return sum(entry[1] for entry in entries)
+
+
+def make_day(entries, expense_entries, version=1):
+    # version counts the saves a day has had; a day's first save is version 1
+    return {
+        "income": entry_total(entries),
+        "expenses": entry_total(expense_entries),
+        "entries": [(intern_label(entry[0]), entry[1]) for entry in entries],
+        "expense_entries": [(intern_label(entry[0]), entry[1]) for entry in expense_entries],
+        "version": version,
+    }
+
+
+class CommandLog:
+    # Undo/redo for one list of entry rows; commands are (action, index, entry, previous)
+    def __init__(self, limit=UNDO_HISTORY_LIMIT, undo=(), redo=()):
+        self.undo_log = deque((self.command_from_json(command) for command in undo), maxlen=limit)
+        self.redo_log = deque((self.command_from_json(command) for command in redo), maxlen=limit)
+
+    @staticmethod
+    def command_from_json(command):
+        action, index, entry, previous = command
+        entry = (entry[0], stored_centavos(entry[1]))
+        if previous is not None:
+            previous = (previous[0], stored_centavos(previous[1]))
+        return action, index, entry, previous
+
+    def to_json(self):
+        return {"undo": list(self.undo_log), "redo": list(self.redo_log)}
+
+    def add(self, rows, entry, index=0):
+        self.do(rows, ("add", index, tuple(entry), None))
+
+    def delete(self, rows, index):
+        self.do(rows, ("delete", index, tuple(rows[index]), None))
+
+    def edit(self, rows, index, entry):
+        self.do(rows, ("edit", index, tuple(entry), tuple(rows[index])))
+
+    def do(self, rows, command):
+        self.apply(rows, command)
+        self.undo_log.append(command)
+        self.redo_log.clear()
+
+    @staticmethod
+    def apply(rows, command):
+        action, index, entry, previous = command
+        if action == "add":
+            rows.insert(index, entry)
+        elif action == "delete":
+            del rows[index]
+        else:
+            rows[index] = entry
+
+    @staticmethod
+    def revert(rows, command):
+        action, index, entry, previous = command
+        if action == "add":
+            del rows[index]
+        elif action == "delete":
+            rows.insert(index, entry)
+        else:
+            rows[index] = previous
+
+    @staticmethod
+    def fits(rows, command, undoing):
+        # False when the rows changed behind the log's back, e.g. edits that were never saved
+        action, index, entry, previous = command
+        if (action == "add") != undoing and action != "edit":
+            return 0 <= index <= len(rows)
+        expected = previous if action == "edit" and not undoing else entry
+        return 0 <= index < len(rows) and tuple(rows[index]) == expected
+
+    def undo(self, rows):
+        if not self.undo_log:
+            return False
+        command = self.undo_log.pop()
+        if not self.fits(rows, command, True):
+            self.clear()
+            return False
+        self.revert(rows, command)
+        self.redo_log.append(command)
+        return True
+
+    def redo(self, rows):
+        if not self.redo_log:
+            return False
+        command = self.redo_log.pop()
+        if not self.fits(rows, command, False):
+            self.clear()
+            return False
+        self.apply(rows, command)
+        self.undo_log.append(command)
+        return True
+
+    def clear(self):
+        self.undo_log.clear()
+        self.redo_log.clear()
+
+
+class RecurrenceRule:
+    # A fixed income or expense entry repeating every interval days, weeks or months from start, through
+    # end if given. Rules are stored once; occurrences are counted arithmetically or generated on demand.
+    # Monthly rules keep start's day of the month, moved back to the last day in shorter months.
+    def __init__(self, kind, label, amount, start, every="month", interval=1, end=None):
+        if kind not in ("income", "expenses"):
+            raise ValueError(f"not an entry kind: {kind!r}")
+        if every not in RECURRENCE_UNITS:
+            raise ValueError(f"not a recurrence unit: {every!r}")
+        if interval < 1:
+            raise ValueError("interval must be at least 1")
+        self.kind = kind
+        self.label = intern_label(label)
+        self.amount = amount
+        self.start = date.fromisoformat(start)
+        self.every = every
+        self.interval = interval
+        self.end = date.fromisoformat(end) if end else None
+
+    @classmethod
+    def from_json(cls, raw):
+        return cls(raw["kind"], raw["label"], stored_centavos(raw["amount"]), raw["start"],
+                   raw.get("every", "month"), raw.get("interval", 1), raw.get("end"))
+
+    def to_json(self):
+        return {"kind": self.kind, "label": self.label, "amount": self.amount, "start": self.start.isoformat(),
+                "every": self.every, "interval": self.interval, "end": self.end.isoformat() if self.end else None}
+
+    def occurrence(self, number):
+        # Date of occurrence number, counting from 0 at start
+        if self.every == "month":
+            year, month = divmod(self.start.year * 12 + self.start.month - 1 + number * self.interval, 12)
+            return date(year, month + 1, min(self.start.day, calendar.monthrange(year, month + 1)[1]))
+        step = self.interval * (7 if self.every == "week" else 1)
+        return date.fromordinal(self.start.toordinal() + number * step)
+
+    def numbers(self, start_date_str, end_date_str):
+        # range() of the occurrence numbers falling between the dates, found without walking the occurrences
+        first_day = max(date.fromisoformat(start_date_str), self.start)
+        last_day = date.fromisoformat(end_date_str)
+        if self.end is not None:
+            last_day = min(last_day, self.end)
+        if first_day > last_day:
+            return range(0)
+        if self.every == "month":
+            start_month = self.start.year * 12 + self.start.month
+            first = -(-(first_day.year * 12 + first_day.month - start_month) // self.interval)
+            if self.occurrence(first) < first_day:
+                first += 1
+            last = (last_day.year * 12 + last_day.month - start_month) // self.interval
+            if self.occurrence(last) > last_day:
+                last -= 1
+        else:
+            step = self.interval * (7 if self.every == "week" else 1)
+            first = -(-(first_day.toordinal() - self.start.toordinal()) // step)
+            last = (last_day.toordinal() - self.start.toordinal()) // step
+        return range(first, last + 1)
+
+    def count(self, start_date_str, end_date_str):
+        return len(self.numbers(start_date_str, end_date_str))
+
+    def dates(self, start_date_str, end_date_str):
+        for number in self.numbers(start_date_str, end_date_str):
+            yield self.occurrence(number).isoformat()
+
+    def occurrences(self, start_date_str, end_date_str):
+        for date_str in self.dates(start_date_str, end_date_str):
+            yield date_str, self.kind, self.label, self.amount
+
+
+class Ledger:
+    # Accounts and per-day income/expense entries, independent of any UI
+    def __init__(self, backend=None, data_path=DATA_PATH, progress=None):
+        self.data_path = Path(data_path)
+        self.store = open_store(backend, data_path, progress)
+        self.writer = PersistenceWriter(self.store)
+        self.accounts_path = self.data_path.with_suffix(".accounts.json")
+        self.accounts = self.store.load_accounts()
+        self.update_accounts_file({})
+        self.days = {}  # Days already fetched from the store, keyed by "YYYY-MM-DD"
+        self.range_index = None
+        self.rollups = None
+        self.history_path = Path(data_path).with_suffix(".history.json")
+        self.command_logs = None  # "YYYY-MM-DD/kind" -> CommandLog, least recently edited first
+        self.labels_path = Path(data_path).with_suffix(".labels.json")
+        self.label_index = None
+        self.labels_on_disk = True  # Whether the labels file holds everything in label_index
+        self.rules_path = Path(data_path).with_suffix(".rules.json")
+        self.rules = None  # Recurring entries; read on first use
+        self.rules_identity = None  # file_identity of the rules file when rules was read
+
+    def add_account(self, username, password):
+        self.writer.save_account(username, password)
+        self.update_accounts_file({username: password})
+
+    def update_accounts_file(self, changes):
+        # Re-read under the store's lock so accounts other processes added meanwhile are kept.
+        # The file is written before the store catches up, so where the two differ the file is newer.
+        with self.store.file_lock:
+            on_disk = read_accounts(self.data_path)
+            accounts = {**self.accounts, **(on_disk or {}), **changes}
+            if accounts != on_disk:
+                write_json_atomic(self.accounts_path, {"accounts": accounts})
+        self.accounts = accounts
+
+    def check_login(self, username, password):
+        return username in self.accounts and self.accounts[username] == password
+
+    def get_day(self, date_str):
+        if date_str not in self.days:
+            payload = self.store.load_day(date_str)
+            if payload is None:
+                return None
+            self.days[date_str] = payload
+        return self.days[date_str]
+
+    def build_totals(self):
+        # The range index and the rollups both come from one scan of the whole history.
+        # Queued days are taken first: one the writer finishes mid-scan would otherwise be in neither.
+        unsaved = self.writer.unsaved_days()
+        with profiler.span("totals.build"):
+            rows = self.store.day_totals("0000-00-00", "9999-12-31")
+            range_index = RangeIndex(rows)
+            rollups = Rollups(rows)
+        for date_str, payload in unsaved.items():
+            range_index.update(date_str, payload["income"], payload["expenses"])
+            rollups.update(date_str, payload["income"], payload["expenses"])
+        self.range_index = range_index
+        self.rollups = rollups
+
+    def get_range_index(self):
+        # Built on first use so startup does not pay for it
+        if self.range_index is None:
+            self.build_totals()
+        return self.range_index
+
+    def get_rollups(self):
+        if self.rollups is None:
+            self.build_totals()
+        return self.rollups
+
+    def month_dates(self, year, month):
+        start_date_str, end_date_str = month_bounds(year, month)
+        # Lazy backends answer one month without touching the rest of the history
+        if self.range_index is None and not self.store.loads_everything:
+            dates = {row[0] for row in self.store.day_totals(start_date_str, end_date_str)}
+            # Days saved this session may still be queued in the writer
+            dates.update(date_str for date_str in self.days if start_date_str <= date_str <= end_date_str)
+            return dates
+        return set(self.get_range_index().dates_between(start_date_str, end_date_str))
+
+    def month_totals(self, year, month):
+        # The month's summary, recurring entries included; lazy backends add up just this month until the
+        # rollups are built
+        start_date_str, end_date_str = month_bounds(year, month)
+        if self.rollups is None and not self.store.loads_everything:
+            rows = {row[0]: row for row in self.store.day_totals(start_date_str, end_date_str)}
+            # Days saved this session may still be queued in the writer
+            rows.update((date_str, (date_str, payload["income"], payload["expenses"]))
+                        for date_str, payload in self.days.items() if start_date_str <= date_str <= end_date_str)
+            rows = sorted(rows.values())
+        else:
+            rows = self.get_rollups().month_rows(year, month)
+        return Rollups(self.with_recurring(rows, start_date_str, end_date_str)).month(year, month)
+
+    def year_rollups(self, year):
+        # Rollups of one year's days, recurring entries included: month(year, m) and year(year) as usual
+        rollups = self.get_rollups()
+        rows = [row for month in range(1, 13) for row in rollups.month_rows(year, month)]
+        return Rollups(self.with_recurring(rows, f"{year}-01-01", f"{year}-12-31"))
+
+    def range_totals(self, start_date_str, end_date_str):
+        # Saved days come from the range index; recurring entries are added as amount times occurrence count.
+        # Days with data include the days that only have recurring entries.
+        index = self.get_range_index()
+        total_income, total_expenses, days_with_data = index.totals(start_date_str, end_date_str)
+        recurring_income, recurring_expenses = self.recurring_totals(start_date_str, end_date_str)
+        recurring_dates = {occurrence[0] for occurrence in self.iter_recurring(start_date_str, end_date_str)}
+        days_with_data += len(recurring_dates.difference(index.dates_between(start_date_str, end_date_str)))
+        return total_income + recurring_income, total_expenses + recurring_expenses, days_with_data
+
+    def get_rules(self):
+        # Read again whenever another process has rewritten the file
+        if self.rules is None or file_identity(self.rules_path) != self.rules_identity:
+            self.rules = self.read_rules()
+        return self.rules
+
+    def read_rules(self):
+        self.rules_identity = file_identity(self.rules_path)
+        if self.rules_identity is None:
+            return []
+        with self.rules_path.open("r", encoding="utf-8") as rules_file:
+            return [RecurrenceRule.from_json(raw) for raw in json.load(rules_file)["rules"]]
+
+    def add_rule(self, rule):
+        # Rules are re-read under the store's lock so changes other processes made meanwhile are kept
+        with self.store.file_lock:
+            self.save_rules(self.read_rules() + [rule])
+
+    def remove_rule(self, rule):
+        # Matched by content, since the list the rule was picked from may be out of date
+        with self.store.file_lock:
+            rules = self.read_rules()
+            matches = [position for position, saved in enumerate(rules) if saved.to_json() == rule.to_json()]
+            if matches:
+                del rules[matches[0]]
+                self.save_rules(rules)
+
+    def save_rules(self, rules):
+        write_json_atomic(self.rules_path, {"rules": [rule.to_json() for rule in rules]})
+        self.rules = rules
+        self.rules_identity = file_identity(self.rules_path)
+
+    def recurring_totals(self, start_date_str, end_date_str):
+        # (income, expenses) of the recurring entries between the dates
+        totals = {"income": 0, "expenses": 0}
+        for rule in self.get_rules():
+            totals[rule.kind] += rule.amount * rule.count(start_date_str, end_date_str)
+        return totals["income"], totals["expenses"]
+
+    def iter_recurring(self, start_date_str, end_date_str):
+        # Yields (date, kind, label, amount) for every recurring entry between the dates, in date order
+        return heapq.merge(*(rule.occurrences(start_date_str, end_date_str) for rule in self.get_rules()),
+                           key=lambda occurrence: occurrence[0])
+
+    def with_recurring(self, rows, start_date_str, end_date_str):
+        # (date, income, expenses) rows of saved days, in date order, with the recurring entries between the
+        # dates added to the days they fall on. Every per-day total that shows recurring entries comes from here.
+        days = {date_str: [income, expenses] for date_str, income, expenses in rows}
+        for date_str, kind, _, amount in self.iter_recurring(start_date_str, end_date_str):
+            totals = days.setdefault(date_str, [0, 0])
+            totals[0 if kind == "income" else 1] += amount
+        return [(date_str, income, expenses) for date_str, (income, expenses) in sorted(days.items())]
+
+    def load_label_index(self):
+        # The saved index may be older than the days: any other process, or a session that ended without
+        # saving it, can have changed them since. Days whose version differs are indexed again.
+        try:
+            with self.labels_path.open("r", encoding="utf-8") as labels_file:
+                raw = json.load(labels_file)
+            index = LabelIndex(raw["postings"], raw["versions"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None  # Missing or damaged; rebuilt instead
+        versions = self.store.day_versions("0000-00-00", "9999-12-31")
+        versions.update((date_str, payload["version"]) for date_str, payload in self.days.items())
+        stale = [date_str for date_str, version in versions.items() if index.versions.get(date_str) != version]
+        stale.extend(date_str for date_str in index.versions if date_str not in versions)
+        for date_str in stale:
+            index.update_day(date_str, self.get_day(date_str))
+        self.labels_on_disk = not stale
+        return index
+
+    def get_label_index(self):
+        if self.label_index is None:
+            self.label_index = self.load_label_index()
+        if self.label_index is None:
+            with profiler.span("label_index.build"):
+                self.label_index = LabelIndex()
+                for date_str, payload in iter_days(self, "0000-00-00", "9999-12-31"):
+                    self.label_index.update_day(date_str, payload)
+            self.labels_on_disk = False
+        return self.label_index
+
+    def index_labels(self, days):
+        # Until the first search reads it, the saved index is left alone; its versions show what it missed
+        if self.label_index is None:
+            return
+        self.labels_on_disk = False
+        for date_str, payload in days.items():
+            self.label_index.update_day(date_str, payload)
+
+    def save_label_index(self):
+        if self.label_index is not None and not self.labels_on_disk:
+            write_json_atomic(self.labels_path, {"postings": self.label_index.postings,
+                                                 "versions": self.label_index.versions})
+            self.labels_on_disk = True
+
+    @profiled("search")
+    def search(self, query, limit=None):
+        # (date, type, label, amount) for entries whose labels match query, newest first.
+        # A hit on a day that changed since it was indexed re-indexes that day and searches again.
+        index = self.get_label_index()
+        while True:
+            hits = index.search(query, limit)
+            days = {date_str: self.get_day(date_str) for date_str, _, _ in hits}
+            stale = [date_str for date_str, payload in days.items()
+                     if payload is None or index.versions.get(date_str) != payload["version"]]
+            if not stale:
+                break
+            for date_str in stale:
+                index.update_day(date_str, days[date_str])
+            self.labels_on_disk = False
+        rows = []
+        for date_str, kind, position in hits:
+            entries = days[date_str]["entries"] if kind == "income" else days[date_str]["expense_entries"]
+            if position < len(entries):
+                label, amount = entries[position]
+                rows.append((date_str, kind, label, amount))
+        return rows
+
+    def update_totals(self, days):
+        for date_str, payload in days.items():
+            if self.range_index is not None:
+                self.range_index.update(date_str, payload["income"], payload["expenses"])
+            if self.rollups is not None:
+                self.rollups.update(date_str, payload["income"], payload["expenses"])
+
+    def save_day(self, date_str, entries, expense_entries):
+        previous = self.get_day(date_str)
+        payload = make_day(entries, expense_entries, (previous["version"] if previous is not None else 0) + 1)
+        self.days[date_str] = payload
+        self.update_totals({date_str: payload})
+        self.index_labels({date_str: payload})
+        self.writer.save_day(date_str, payload)
+        return payload
+
+    def save_days_now(self, days):
+        # Synchronous bulk write used by imports; queued saves go first so they cannot overwrite it.
+        # Returns the dates another process saved first; those are reloaded instead.
+        self.writer.flush()
+        conflicts = self.store.save_days(days)
+        days = {date_str: payload for date_str, payload in days.items() if date_str not in conflicts}
+        for date_str, payload in days.items():
+            if date_str in self.days:
+                self.days[date_str] = payload
+        self.update_totals(days)
+        self.index_labels(days)
+        self.reload_days(conflicts)
+        return conflicts
+
+    def reload_days(self, dates):
+        # Replaces this ledger's copy of days another process saved first with what is on disk
+        days = {}
+        for date_str in dates:
+            payload = self.store.load_day(date_str)
+            days[date_str] = payload if payload is not None else make_day([], [], 0)
+            self.days[date_str] = days[date_str]
+            if self.command_logs is not None:
+                # Undo steps refer to rows of the version that lost
+                for kind in ("income", "expenses"):
+                    if f"{date_str}/{kind}" in self.command_logs:
+                        self.command_logs[f"{date_str}/{kind}"].clear()
+        self.update_totals(days)
+        self.index_labels(days)
+
+    def take_conflicts(self):
+        # Dates whose queued save lost to another process since the last call, now showing the winner
+        dates = []
+        try:
+            while True:
+                dates.append(self.writer.conflicts.get_nowait())
+        except queue.Empty:
+            pass
+        # A later save of the same day may still be queued; it is checked again when it is written
+        self.reload_days([date_str for date_str in dates if date_str not in self.writer.unsaved_days()])
+        return sorted(set(dates))
+
+    def command_log(self, date_str, kind):
+        if self.command_logs is None:
+            self.command_logs = OrderedDict()
+            if self.history_path.exists():
+                with self.history_path.open("r", encoding="utf-8") as history_file:
+                    for key, log in json.load(history_file).items():
+                        self.command_logs[key] = CommandLog(undo=log["undo"], redo=log["redo"])
+        key = f"{date_str}/{kind}"
+        log = self.command_logs.pop(key, None) or CommandLog()
+        self.command_logs[key] = log
+        while len(self.command_logs) > UNDO_HISTORY_DAYS * 2:
+            self.command_logs.popitem(last=False)
+        return log
+
+    def save_command_logs(self):
+        if self.command_logs is not None:
+            write_json_atomic(self.history_path, {
+                key: log.to_json() for key, log in self.command_logs.items() if log.undo_log or log.redo_log
+            })
+
+    def persist(self):
+        self.writer.flush()
+        if isinstance(self.store, JsonStore):
+            self.store.write_full()
+        self.save_command_logs()
+        self.save_label_index()
+
+    def close(self):
+        self.writer.close()
+        self.store.close()
+        self.save_command_logs()
+        self.save_label_index()
+
+
+@profiled("range_analytics")
+def range_analytics(ledger, start_date_str, end_date_str):
+    # Statistics over a dense net series with one slot per calendar day; days without data count as 0.
+    # Amounts are centavos; averages and the trend (least-squares slope per day) are floats.
+    first = date.fromisoformat(start_date_str)
+    day_count = (date.fromisoformat(end_date_str) - first).days + 1
+    if day_count <= 0:
+        raise ValueError("start date must not be after end date")
+    rows = ledger.with_recurring(ledger.get_range_index().rows(start_date_str, end_date_str),
+                                 start_date_str, end_date_str)
+    dates = [row[0] for row in rows]
+    offsets = [date.fromisoformat(date_str).toordinal() - first.toordinal() for date_str in dates]
+    logged_net = [income - expenses for _, income, expenses in rows]
+
+    if numpy is not None:
+        net = numpy.zeros(day_count, dtype=numpy.int64)
+        net[offsets] = logged_net
+        sums = numpy.concatenate(([0], numpy.cumsum(net)))
+        ends = numpy.arange(1, day_count + 1)
+        moving_averages = {
+            window: ((sums[ends] - sums[numpy.maximum(ends - window, 0)]) / numpy.minimum(ends, window)).tolist()
+            for window in MOVING_AVERAGE_WINDOWS
+        }
+        logged = numpy.asarray(offsets, dtype=numpy.int64)
+        weekdays = (first.weekday() + logged) % 7
+        weekday_counts = numpy.bincount(weekdays, minlength=7)
+        weekday_sums = numpy.bincount(weekdays, weights=numpy.asarray(logged_net, dtype=numpy.int64), minlength=7)
+        weekday_means = numpy.divide(weekday_sums, weekday_counts, out=numpy.zeros(7),
+                                     where=weekday_counts > 0).tolist()
+        trend = float(numpy.polyfit(logged, logged_net, 1)[0]) if len(logged) > 1 else 0.0
+        net = net.tolist()
+    else:
+        net = array("q", bytes(8 * day_count))
+        for offset, value in zip(offsets, logged_net):
+            net[offset] = value
+        sums = running_sums(net)
+        moving_averages = {
+            window: [(sums[end] - sums[max(end - window, 0)]) / min(end, window) for end in range(1, day_count + 1)]
+            for window in MOVING_AVERAGE_WINDOWS
+        }
+        weekday_sums = [0] * 7
+        weekday_counts = [0] * 7
+        for offset, value in zip(offsets, logged_net):
+            weekday = (first.weekday() + offset) % 7
+            weekday_sums[weekday] += value
+            weekday_counts[weekday] += 1
+        weekday_means = [total / count if count else 0.0 for total, count in zip(weekday_sums, weekday_counts)]
+        trend = 0.0
+        if len(offsets) > 1:
+            mean_x = sum(offsets) / len(offsets)
+            mean_y = sum(logged_net) / len(logged_net)
+            spread = sum((x - mean_x) ** 2 for x in offsets)
+            trend = sum((x - mean_x) * (y - mean_y) for x, y in zip(offsets, logged_net)) / spread
+        net = net.tolist()
+
+    best = max(range(len(dates)), key=logged_net.__getitem__, default=None)
+    worst = min(range(len(dates)), key=logged_net.__getitem__, default=None)
+    return {
+        "start": start_date_str,
+        "end": end_date_str,
+        "days": day_count,
+        "days_with_data": len(dates),
+        "total_net": sum(logged_net),
+        "net": net,
+        "moving_averages": moving_averages,
+        "weekday_means": weekday_means,
+        "best_day": (dates[best], logged_net[best]) if best is not None else None,
+        "worst_day": (dates[worst], logged_net[worst]) if worst is not None else None,
+        "trend_per_day": trend,
+    }
+
+
+@profiled("daily_totals")
+def daily_totals(ledger, start_date_str, end_date_str):
+    # Dense columns with one slot per calendar day from start to end, filled in one pass over the range
+    # index: income and expenses in centavos, recurring entries included, and logged[i] set to 1 where
+    # day i has saved or recurring entries
+    first = date.fromisoformat(start_date_str)
+    day_count = (date.fromisoformat(end_date_str) - first).days + 1
+    if day_count <= 0:
+        raise ValueError("start date must not be after end date")
+    rows = ledger.with_recurring(ledger.get_range_index().rows(start_date_str, end_date_str),
+                                 start_date_str, end_date_str)
+    income = array("q", bytes(8 * day_count))
+    expenses = array("q", bytes(8 * day_count))
+    logged = bytearray(day_count)
+    base = first.toordinal()
+    for date_str, day_income, day_expenses in rows:
+        offset = date.fromisoformat(date_str).toordinal() - base
+        income[offset] = day_income
+        expenses[offset] = day_expenses
+        logged[offset] = 1
+    return {"start": start_date_str, "days": day_count, "income": income, "expenses": expenses, "logged": logged}
+
+
+def iter_days(ledger, start_date_str, end_date_str):
+    # Yields (date, day) in date order, loading one month of days at a time
+    ledger.writer.flush()
+    index = ledger.get_range_index()
+    lo, hi = index.bounds(start_date_str, end_date_str)
+    pos = lo
+    while pos < hi:
+        month_key = index.dates[pos][:7]
+        month_end = bisect.bisect_right(index.dates, month_key + "-99", pos, hi)
+        days = ledger.store.load_days(index.dates[pos], index.dates[month_end - 1])
+        for date_str in index.dates[pos:month_end]:
+            payload = ledger.days.get(date_str) or days.get(date_str)
+            if payload is not None:
+                yield date_str, payload
+        pos = month_end
+
+
+def iter_entries(ledger, start_date_str, end_date_str):
+    # Yields one (date, type, label, amount) row per income or expense entry, in date order; a day's
+    # recurring entries follow its saved ones
+    def saved():
+        for date_str, payload in iter_days(ledger, start_date_str, end_date_str):
+            for label, amount in payload["entries"]:
+                yield date_str, "income", label, pesos(amount)
+            for label, amount in payload["expense_entries"]:
+                yield date_str, "expense", label, pesos(amount)
+
+    recurring = ((date_str, "income" if kind == "income" else "expense", label, pesos(amount))
+                 for date_str, kind, label, amount in ledger.iter_recurring(start_date_str, end_date_str))
+    return heapq.merge(saved(), recurring, key=lambda row: row[0])
+
+
+def export_rows(rows, path, file_format=None, compress=None):
+    # Streams rows to CSV or JSON lines; a ".gz" path (or compress=True) writes gzip
+    path = Path(path)
+    if compress is None:
+        compress = path.suffix.lower() == ".gz"
+    if file_format is None:
+        # Only a real ".gz" hides the format suffix; "out.csv" with compress=True is still CSV
+        plain_suffix = Path(path.stem).suffix if path.suffix.lower() == ".gz" else path.suffix
+        file_format = "csv" if plain_suffix.lower() == ".csv" else "jsonl"
+    opener = gzip.open if compress else open
+    count = 0
+    with opener(path, "wt", encoding="utf-8", newline="") as target:
+        if file_format == "csv":
+            csv_writer = csv.writer(target)
+            csv_writer.writerow(EXPORT_FIELDS)
+            for row in rows:
+                csv_writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                target.write(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+
+def read_rows(path, file_format=None):
+    # Yields (date, type, label, amount) rows one at a time from a CSV or JSON-lines file
+    path = Path(path)
+    file_format = file_format or ("csv" if path.suffix.lower() == ".csv" else "jsonl")
+    with path.open("r", encoding="utf-8", newline="") as source:
+        if file_format == "csv":
+            for row in csv.DictReader(source):
+                yield row.get("date"), row.get("type"), row.get("label"), row.get("amount")
+        else:
+            for line in source:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    yield None, None, None, None
+                    continue
+                yield row.get("date"), row.get("type"), row.get("label"), row.get("amount")
+
+
+def import_rows(ledger, rows, batch_rows=IMPORT_BATCH_ROWS):
+    # Streams rows into the ledger, holding at most batch_rows new entries in memory at a time
+    batch = {}
+    buffered = 0
+    imported = 0
+    skipped = 0
+
+    def commit():
+        days = {}
+        for date_str, (entries, expense_entries) in batch.items():
+            existing = ledger.get_day(date_str) if date_str in ledger.days else ledger.store.load_day(date_str)
+            version = 1
+            if existing is not None:
+                entries = existing["entries"] + entries
+                expense_entries = existing["expense_entries"] + expense_entries
+                version = existing["version"] + 1
+            days[date_str] = make_day(entries, expense_entries, version)
+        # Days another process saved meanwhile come back reloaded and are merged again
+        conflicts = ledger.save_days_now(days)
+        for date_str in list(batch):
+            if date_str not in conflicts:
+                del batch[date_str]
+        if batch:
+            commit()
+
+    for date_str, kind, label, amount in rows:
+        try:
+            date_str = date.fromisoformat(str(date_str).strip()).isoformat()
+            amount = to_centavos(amount)
+        except (TypeError, ValueError):
+            skipped += 1
+            continue
+        kind = str(kind).strip().lower()
+        if kind == "income":
+            slot = 0
+        elif kind in ("expense", "expenses"):
+            slot = 1
+        else:
+            skipped += 1
+            continue
+        batch.setdefault(date_str, ([], []))[slot].append((str(label or "").strip(), amount))
+        buffered += 1
+        imported += 1
+        if buffered >= batch_rows:
+            commit()
+            buffered = 0
+    if batch:
+        commit()
+    return imported, skipped
+
+
+def iso_date(text):
+    # argparse type for dates; the normalized string compares in date order
+    return date.fromisoformat(text).isoformat()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="money_rider", description="Money Rider ledger tools")
+    parser.add_argument("--backend", choices=("json", "sqlite", "sharded", "binary", "snapshots"), default=None,
+                        help="storage backend (defaults to $MONEY_RIDER_STORAGE or json)")
+    parser.add_argument("--data", type=Path, default=DATA_PATH, help="path of money_rider_data.json")
+    parser.add_argument("--profile", type=Path, metavar="TRACE_JSON",
+                        help="record timing spans and write a Chrome trace here on exit")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="stream income/expense rows into the ledger")
+    import_parser.add_argument("file", type=Path, help="CSV or JSON-lines file with date,type,label,amount")
+    import_parser.add_argument("--format", choices=("csv", "jsonl"), default=None)
+    import_parser.add_argument("--batch-rows", type=int, default=IMPORT_BATCH_ROWS)
+
+    totals_parser = commands.add_parser("totals", help="income, expenses and net for a date range")
+    totals_parser.add_argument("start", type=iso_date, help="first date, YYYY-MM-DD")
+    totals_parser.add_argument("end", type=iso_date, help="last date, YYYY-MM-DD")
+
+    export_parser = commands.add_parser("export", help="stream every entry in a date range to a file")
+    export_parser.add_argument("start", type=iso_date, help="first date, YYYY-MM-DD")
+    export_parser.add_argument("end", type=iso_date, help="last date, YYYY-MM-DD")
+    export_parser.add_argument("output", type=Path, help="output file; a .gz suffix compresses it")
+    export_parser.add_argument("--format", choices=("csv", "jsonl"), default=None)
+    export_parser.add_argument("--gzip", action="store_true", default=None, help="gzip the output")
+
+    analytics_parser = commands.add_parser("analytics", help="moving averages, weekday means and trend for a range")
+    analytics_parser.add_argument("start", type=iso_date, help="first date, YYYY-MM-DD")
+    analytics_parser.add_argument("end", type=iso_date, help="last date, YYYY-MM-DD")
+
+    summary_parser = commands.add_parser("summary", help="month by month totals for a year")
+    summary_parser.add_argument("year", type=int)
+
+    search_parser = commands.add_parser("search", help="find entries by customer name or expense label")
+    search_parser.add_argument("query", help="words to match; each one may be a prefix")
+    search_parser.add_argument("--limit", type=int, default=50)
+
+    migrate_parser = commands.add_parser("migrate", help="copy the JSON data file into another backend")
+    migrate_parser.add_argument("target", choices=("sqlite", "sharded", "binary", "snapshots", "json"))
+    migrate_parser.add_argument("--source", choices=("sqlite", "sharded", "binary", "snapshots"),
+                                help="backend to copy back into the JSON file (for target json)")
+
+    restore_parser = commands.add_parser("restore", help="list or go back to a saved point of the snapshots backend")
+    restore_parser.add_argument("point", type=int, nargs="?", help="point to restore; lists the kept points if left out")
+
+    args = parser.parse_args(argv)
+    if getattr(args, "start", None) is not None and args.start > args.end:
+        parser.error(f"start date {args.start} is after end date {args.end}")
+    if args.profile:
+        profiler.enable(args.profile)
+
+    if args.command == "migrate":
+        if args.target == "json":
+            if args.source is None:
+                parser.error("migrate json needs --source")
+            # open_store without auto-migration: the source must already exist
+            source = {"sqlite": lambda: SQLiteStore(args.data.with_suffix(".sqlite3")),
+                      "sharded": lambda: ShardedStore(args.data.with_suffix("")),
+                      "binary": lambda: BinaryStore(args.data.with_suffix(".mrb")),
+                      "snapshots": lambda: DeltaStore(args.data.with_suffix(".snapshots"))}[args.source]()
+            try:
+                migrated = migrate_store_to_json(source, args.data)
+            finally:
+                source.close()
+            print(f"Migrated {migrated} days from the {args.source} backend to {args.data}")
+            return 0
+        if args.target == "sqlite":
+            target = args.data.with_suffix(".sqlite3")
+            migrated = migrate_json_to_sqlite(args.data, target)
+        elif args.target == "binary":
+            target = args.data.with_suffix(".mrb")
+            migrated = migrate_json_to_binary(args.data, target)
+        elif args.target == "snapshots":
+            target = args.data.with_suffix(".snapshots")
+            migrated = migrate_json_to_deltas(args.data, target)
+        else:
+            target = args.data.with_suffix("")
+            migrated = migrate_json_to_shards(args.data, target)
+        print(f"Migrated {migrated} days from {args.data} to {target}")
+        return 0
+
+    if args.command == "restore":
+        store = DeltaStore(args.data.with_suffix(".snapshots"))
+        try:
+            if args.point is None:
+                for number, kind, path in store.points():
+                    stat = path.stat()
+                    saved = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stat.st_mtime))
+                    print(f"{number:6d}  {kind:<5}  {saved}  {stat.st_size:10,d} bytes")
+                return 0
+            try:
+                store.restore(args.point)
+            except ValueError as exc:
+                parser.error(str(exc))
+            print(f"Restored point {args.point} as point {store.sequence} ({len(store.days)} days)")
+        finally:
+            store.close()
+        return 0
+
+    ledger = Ledger(args.backend, args.data)
+    try:
+        if args.command == "import":
+            started = time.perf_counter()
+            imported, skipped = import_rows(ledger, read_rows(args.file, args.format), args.batch_rows)
+            elapsed = time.perf_counter() - started
+            print(f"Imported {imported} rows in {elapsed:.2f}s ({skipped} skipped)")
+        elif args.command == "totals":
+            total_income, total_expenses, days_with_data = ledger.range_totals(args.start, args.end)
+            print(f"Days with data: {days_with_data}")
+            print(f"Total Income: {pesos(total_income):,.2f}")
+            print(f"Total Expenses: {pesos(total_expenses):,.2f}")
+            print(f"Net Total: {pesos(total_income - total_expenses):,.2f}")
+        elif args.command == "export":
+            count = export_rows(iter_entries(ledger, args.start, args.end), args.output, args.format, args.gzip)
+            print(f"Exported {count} rows to {args.output}")
+        elif args.command == "analytics":
+            stats = range_analytics(ledger, args.start, args.end)
+            print(f"Days: {stats['days']} ({stats['days_with_data']} with data)")
+            print(f"Net Total: {pesos(stats['total_net']):,.2f}")
+            print(f"Trend: {pesos(stats['trend_per_day']):+,.2f} per day")
+            for window, averages in stats["moving_averages"].items():
+                print(f"{window}-day average at {args.end}: {pesos(averages[-1]):,.2f}")
+            for weekday, mean in enumerate(stats["weekday_means"]):
+                print(f"{calendar.day_name[weekday]:<10} {pesos(mean):12,.2f}")
+            for label, day in (("Best day", stats["best_day"]), ("Worst day", stats["worst_day"])):
+                if day is not None:
+                    print(f"{label}: {day[0]} ({pesos(day[1]):,.2f})")
+        elif args.command == "summary":
+            rollups = ledger.year_rollups(args.year)
+            for month in range(1, 13):
+                totals = rollups.month(args.year, month)
+                print(f"{calendar.month_name[month]:<10} {totals['days']:3d} days  "
+                      f"{pesos(totals['income']):14,.2f} {pesos(totals['expenses']):14,.2f} "
+                      f"{pesos(totals['net']):14,.2f}")
+            totals = rollups.year(args.year)
+            print(f"{args.year:<10} {totals['days']:3d} days  "
+                  f"{pesos(totals['income']):14,.2f} {pesos(totals['expenses']):14,.2f} "
+                  f"{pesos(totals['net']):14,.2f}")
+            for label, day in (("Best day", totals["max_day"]), ("Worst day", totals["min_day"])):
+                if day is not None:
+                    print(f"{label}: {day[0]} ({pesos(day[1]):,.2f})")
+        elif args.command == "search":
+            for date_str, kind, label, amount in ledger.search(args.query, args.limit):
+                print(f"{date_str}  {kind:<8} {label:<30} {pesos(amount):12,.2f}")
+    finally:
+        ledger.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+import argparse
+import asyncio
+import bisect
+import hmac
+import json
+import os
+import sys
+import uuid
+from datetime import date
+from pathlib import Path
+
+from money_rider import DATA_PATH, MAX_CENTAVOS, Ledger, make_day, open_store, parse_day, serialize_day, write_json_atomic
+
+SYNC_PORT = 8765
+SYNC_BATCH_DAYS = 500  # Days pushed, or pulled, per message
+SYNC_MAX_MESSAGE_BYTES = 64 * 1024 * 1024  # Longest JSON line either side will read
+SYNC_SERVER = os.environ.get("MONEY_RIDER_SYNC_SERVER", f"127.0.0.1:{SYNC_PORT}")
+SYNC_TOKEN = os.environ.get("MONEY_RIDER_SYNC_TOKEN")  # Shared secret; unset means no check
+
+
+def is_date(date_str):
+    try:
+        return date.fromisoformat(date_str).isoformat() == date_str
+    except (TypeError, ValueError):
+        return False
+
+
+def is_entry_list(entries):
+    # [label, centavos] pairs, with amounts in the range to_centavos accepts
+    return isinstance(entries, list) and all(
+        isinstance(entry, list) and len(entry) == 2 and isinstance(entry[0], str)
+        and type(entry[1]) is int and abs(entry[1]) < MAX_CENTAVOS
+        for entry in entries
+    )
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return (host or "127.0.0.1"), int(port or SYNC_PORT)
+
+
+async def send(reader, writer, message):
+    # One JSON line out, one JSON line back
+    writer.write(json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n")
+    await writer.drain()
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("sync server closed the connection")
+    response = json.loads(line)
+    if "error" in response:
+        raise ConnectionError(f"sync server: {response['error']}")
+    return response
+
+
+class SyncServer:
+    # Holds the shared ledger. Every day it accepts gets the next change number, so a device asks for
+    # "everything after the last number I saw" instead of the whole history.
+    def __init__(self, store, state_path, token=None):
+        self.store = store
+        self.state_path = Path(state_path)
+        self.token = token
+        self.lock = asyncio.Lock()  # One push or pull touches the store at a time
+        self.server_id = None
+        self.cursor = 0  # Newest change number handed out
+        self.changes = {}  # date -> change number of its latest accepted version
+        self.log = []  # (change number, date), oldest first; may hold superseded entries until compacted
+        self.load_state()
+
+    def load_state(self):
+        try:
+            raw = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            raw = {}
+        self.server_id = raw.get("server_id") or uuid.uuid4().hex
+        self.cursor = raw.get("cursor", 0)
+        self.changes = raw.get("changes", {})
+        # Days the server has never handed out, e.g. its own data from before it started serving
+        for date_str, _, _ in self.store.day_totals("0000-00-00", "9999-12-31"):
+            if date_str not in self.changes:
+                self.cursor += 1
+                self.changes[date_str] = self.cursor
+        self.log = sorted((number, date_str) for date_str, number in self.changes.items())
+        self.save_state()
+
+    def save_state(self):
+        write_json_atomic(self.state_path, {"server_id": self.server_id, "cursor": self.cursor, "changes": self.changes})
+
+    def push(self, pushed):
+        # pushed maps date -> {"base": server version the device edited from, "day": payload}.
+        # Returns the accepted dates with their new versions, and the server's copy of the rest.
+        # Keys become file names on some backends and totals are recomputed, so nothing is taken on trust.
+        days = {}
+        bases = {}
+        for date_str, item in pushed.items():
+            if not is_date(date_str):
+                raise ValueError(f"not a date: {date_str!r}")
+            day = item["day"]
+            if not (isinstance(day, dict) and is_entry_list(day.get("entries", []))
+                    and is_entry_list(day.get("expense_entries", []))):
+                raise ValueError(f"bad entries for {date_str}")
+            bases[date_str] = int(item["base"])
+            payload = parse_day(day)
+            days[date_str] = make_day(payload["entries"], payload["expense_entries"], bases[date_str] + 1)
+        conflicts = self.store.save_days(days, bases) if days else []
+        accepted = {date_str: payload["version"] for date_str, payload in days.items() if date_str not in conflicts}
+        for date_str in accepted:
+            self.cursor += 1
+            self.changes[date_str] = self.cursor
+            self.log.append((self.cursor, date_str))
+        if accepted:
+            if len(self.log) > 2 * len(self.changes):
+                self.log = sorted((number, date_str) for date_str, number in self.changes.items())
+            self.save_state()
+        return accepted, {date_str: serialize_day(self.server_day(date_str)) for date_str in conflicts}
+
+    def server_day(self, date_str):
+        payload = self.store.load_day(date_str)
+        return payload if payload is not None else make_day([], [], 0)
+
+    def pull(self, cursor, limit):
+        # Latest versions of the days changed after cursor, at most limit of them, and the cursor to ask from next
+        days = {}
+        start = bisect.bisect_right(self.log, cursor, key=lambda change: change[0])
+        for number, date_str in self.log[start:]:
+            if len(days) == limit:
+                break
+            cursor = number
+            if self.changes.get(date_str) == number:
+                days[date_str] = serialize_day(self.server_day(date_str))
+        return days, cursor, cursor < self.cursor
+
+    async def respond(self, request):
+        if self.token is not None and not hmac.compare_digest(str(request.get("token", "")), self.token):
+            return {"error": "bad token"}
+        if request.get("op") == "hello":
+            return {"server_id": self.server_id, "cursor": self.cursor}
+        if request.get("op") != "sync":
+            return {"error": f"unknown op {request.get('op')!r}"}
+        async with self.lock:
+            # Disk work runs off the event loop so other devices' connections keep being served
+            accepted, conflicts = await asyncio.to_thread(self.push, request.get("days", {}))
+            days, cursor, more = await asyncio.to_thread(
+                self.pull, request.get("cursor", 0), request.get("limit", SYNC_BATCH_DAYS))
+        return {"accepted": accepted, "conflicts": conflicts, "days": days, "cursor": cursor, "more": more}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than SYNC_MAX_MESSAGE_BYTES; the stream cannot be resynchronised
+                    writer.write(b'{"error":"message too long"}\n')
+                    break
+                if not line:
+                    break
+                try:
+                    response = await self.respond(json.loads(line))
+                except (ValueError, KeyError, TypeError, AttributeError) as exc:
+                    response = {"error": f"bad request: {exc}"}
+                writer.write(json.dumps(response, separators=(",", ":")).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host, port):
+        return await asyncio.start_server(self.handle, host, port, limit=SYNC_MAX_MESSAGE_BYTES)
+
+
+def sync_state_path(data_path):
+    return Path(data_path).with_suffix(".sync.json")
+
+
+def load_sync_state(data_path):
+    try:
+        return json.loads(sync_state_path(data_path).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+async def sync_store(store, data_path, address, token=None):
+    # Pushes the days edited here since the last sync and pulls those changed on the server.
+    # The sync state file remembers, per day, (local version, server version) as of the last sync.
+    # Conflicts keep the server's version; the local one is appended to <data>.conflicts.jsonl.
+    host, port = parse_address(address)
+    state_path = sync_state_path(data_path)
+    conflicts_path = Path(data_path).with_suffix(".conflicts.jsonl")
+    result = {"pushed": [], "pulled": [], "conflicts": []}
+    reader, writer = await asyncio.open_connection(host, port, limit=SYNC_MAX_MESSAGE_BYTES)
+    try:
+        hello = await send(reader, writer, {"op": "hello", "token": token})
+        state = load_sync_state(data_path)
+        if state.get("server_id") != hello["server_id"]:
+            # Another server: nothing about the old one's versions or cursor carries over
+            state = {"server_id": hello["server_id"], "cursor": 0, "days": {}}
+        known = state["days"]
+
+        # Versions alone tell which days changed here; only those days' entries are read
+        versions = store.day_versions("0000-00-00", "9999-12-31")
+        dirty = sorted(date_str for date_str, version in versions.items()
+                       if date_str not in known or known[date_str][0] != version)
+        while True:
+            batch, dirty = dirty[:SYNC_BATCH_DAYS], dirty[SYNC_BATCH_DAYS:]
+            local = {date_str: store.load_day(date_str) for date_str in batch}
+            response = await send(reader, writer, {
+                "op": "sync",
+                "token": token,
+                "cursor": state["cursor"],
+                "days": {
+                    date_str: {"base": known[date_str][1] if date_str in known else 0,
+                               "day": serialize_day(payload)}
+                    for date_str, payload in local.items()
+                },
+            })
+            for date_str, version in response["accepted"].items():
+                known[date_str] = [local[date_str]["version"], version]
+                result["pushed"].append(date_str)
+
+            incoming = dict(response["days"])
+            lost = dict(response["conflicts"])
+            for date_str, payload in response["days"].items():
+                if date_str in known and known[date_str][1] == payload.get("version", 0):
+                    del incoming[date_str]  # Our own push coming back
+                elif date_str in dirty:
+                    # Edited here and changed on the server since we last saw it
+                    dirty.remove(date_str)
+                    lost[date_str] = payload
+            if lost:
+                with conflicts_path.open("a", encoding="utf-8") as conflicts_file:
+                    for date_str, payload in lost.items():
+                        local_day = local.get(date_str) or store.load_day(date_str)
+                        if local_day is not None:
+                            conflicts_file.write(json.dumps(
+                                {"date": date_str, "local": serialize_day(local_day), "server": payload},
+                                separators=(",", ":")) + "\n")
+                result["conflicts"].extend(sorted(lost))
+                incoming.update(lost)
+
+            # Local versions keep counting up on their own; a day edited here meanwhile stays dirty
+            bases = {date_str: versions.get(date_str, 0) for date_str in incoming}
+            days = {}
+            for date_str, payload in incoming.items():
+                days[date_str] = parse_day(payload)
+                days[date_str]["version"] = bases[date_str] + 1
+            skipped = await asyncio.to_thread(store.save_days, days, bases) if days else []
+            for date_str, payload in days.items():
+                if date_str not in skipped:
+                    known[date_str] = [payload["version"], incoming[date_str].get("version", 0)]
+                    versions[date_str] = payload["version"]
+                    result["pulled"].append(date_str)
+
+            state["cursor"] = response["cursor"]
+            write_json_atomic(state_path, state)
+            if not dirty and not response["more"]:
+                break
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return result
+
+
+def sync_ledger(ledger, address=SYNC_SERVER, token=SYNC_TOKEN):
+    # Runs one sync to completion. Only the store is touched, so it can run off the UI thread;
+    # afterwards call ledger.reload_days(result["pulled"] + result["conflicts"]) where the ledger lives.
+    ledger.writer.flush()
+    return asyncio.run(sync_store(ledger.store, ledger.data_path, address, token))
+
+
+async def serve(store, data_path, host, port, token=None):
+    server = await SyncServer(store, Path(data_path).with_suffix(".server.json"), token).start(host, port)
+    addresses = ", ".join("%s:%d" % sock.getsockname()[:2] for sock in server.sockets)
+    print(f"Serving {data_path} on {addresses}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="money_rider_sync", description="Share one ledger between devices")
+    parser.add_argument("--backend", choices=("json", "sqlite", "sharded", "binary", "snapshots"), default=None,
+                        help="storage backend (defaults to $MONEY_RIDER_STORAGE or json)")
+    parser.add_argument("--data", type=Path, default=DATA_PATH, help="path of money_rider_data.json")
+    parser.add_argument("--token", default=SYNC_TOKEN, help="shared secret (defaults to $MONEY_RIDER_SYNC_TOKEN)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the sync server on --data")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="0.0.0.0 to accept devices on the LAN")
+    serve_parser.add_argument("--port", type=int, default=SYNC_PORT)
+
+    sync_parser = commands.add_parser("sync", help="push local changes to a server and pull everyone else's")
+    sync_parser.add_argument("server", nargs="?", default=SYNC_SERVER, help="HOST:PORT")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        if args.token is None and args.host not in ("127.0.0.1", "localhost", "::1"):
+            parser.error("serving beyond this machine needs --token or $MONEY_RIDER_SYNC_TOKEN")
+        store = open_store(args.backend, args.data)
+        try:
+            asyncio.run(serve(store, args.data, args.host, args.port, args.token))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            store.close()
+        return 0
+
+    ledger = Ledger(args.backend, args.data)
+    try:
+        result = sync_ledger(ledger, args.server, args.token)
+    except (OSError, ConnectionError) as exc:
+        print(f"Sync failed: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        ledger.close()
+    print(f"Pushed {len(result['pushed'])} days, pulled {len(result['pulled'])}, "
+          f"{len(result['conflicts'])} conflicts kept the server's version")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,404 @@
+import json
+import multiprocessing
+import random
+import tempfile
+import unittest
+from datetime import date
+from pathlib import Path
+
+from money_rider import (MAX_CENTAVOS, CommandLog, LabelIndex, Ledger, PersistenceWriter, RangeIndex, RecurrenceRule,
+                         Rollups, daily_totals, iter_entries, make_day, open_store, range_analytics, to_centavos)
+
+BACKENDS = ("json", "sqlite", "sharded", "binary", "snapshots")
+
+
+class AmountTest(unittest.TestCase):
+    def test_rounds_half_up_to_centavos(self):
+        self.assertEqual(to_centavos("1.005"), 101)
+        self.assertEqual(to_centavos(0.285), 29)
+        self.assertEqual(to_centavos(" -12.5 "), -1250)
+
+    def test_rejects_what_cannot_be_stored(self):
+        for amount in ("1e30", "nan", "NaN", "inf", "-Infinity", "snan", "1e999999999", "abc", "",
+                       "46116860184273879.04", "-46116860184273879.04"):
+            with self.subTest(amount=amount):
+                with self.assertRaises(ValueError):
+                    to_centavos(amount)
+        self.assertEqual(to_centavos("46116860184273879.03"), MAX_CENTAVOS - 1)
+
+
+class StoreTest(unittest.TestCase):
+    def test_every_backend_reads_back_what_it_saved(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend), tempfile.TemporaryDirectory() as temp_dir:
+                data_path = Path(temp_dir) / "data.json"
+                store = open_store(backend, data_path)
+                try:
+                    store.save_account("rider", "secret")
+                    self.assertEqual(store.save_days({"2024-03-02": make_day([("Fare", 15050)], [("Gas", 4000)]),
+                                                      "2024-02-28": make_day([("Tip", 500)], [])}), [])
+                    self.assertEqual(store.save_day("2024-03-02", make_day([("Fare", 20000)], [("Gas", 4000)], 2)), [])
+                finally:
+                    store.close()
+
+                store = open_store(backend, data_path)
+                try:
+                    self.assertEqual(store.load_accounts(), {"rider": "secret"})
+                    self.assertEqual(store.load_day("2024-03-02"), make_day([("Fare", 20000)], [("Gas", 4000)], 2))
+                    self.assertIsNone(store.load_day("2024-03-01"))
+                    self.assertEqual(list(store.load_days("2024-03-01", "2024-03-31")), ["2024-03-02"])
+                    self.assertEqual(store.day_totals("2024-01-01", "2024-12-31"),
+                                     [("2024-02-28", 500, 0), ("2024-03-02", 20000, 4000)])
+                    self.assertEqual(store.day_versions("2024-01-01", "2024-12-31"), {"2024-02-28": 1, "2024-03-02": 2})
+                    self.assertEqual(store.stored_version("2024-03-02"), 2)
+                    self.assertEqual(store.stored_version("2024-03-01"), 0)
+                finally:
+                    store.close()
+
+
+class MigrationTest(unittest.TestCase):
+    def test_float_pesos_load_as_centavos(self):
+        # The data file as the app wrote it before amounts were kept in centavos
+        raw = {"accounts": {"rider": "secret"}, "financial_data": {"2023-05-01": {
+            "income": 150.5, "expenses": 0.1 + 0.2,
+            "entries": [["Fare", 150.5]], "expense_entries": [["Gas", 0.1], ["Oil", 0.2]],
+        }}}
+        for backend in BACKENDS:
+            with self.subTest(backend=backend), tempfile.TemporaryDirectory() as temp_dir:
+                data_path = Path(temp_dir) / "data.json"
+                data_path.write_text(json.dumps(raw), encoding="utf-8")
+                store = open_store(backend, data_path)
+                try:
+                    self.assertEqual(store.load_accounts(), {"rider": "secret"})
+                    self.assertEqual(store.load_day("2023-05-01"), {
+                        "income": 15050, "expenses": 30, "entries": [("Fare", 15050)],
+                        "expense_entries": [("Gas", 10), ("Oil", 20)], "version": 0,
+                    })
+                    # A migrated day is at version 0, so the first edit of it saves cleanly
+                    self.assertEqual(store.save_day("2023-05-01", make_day([("Fare", 15000)], [])), [])
+                finally:
+                    store.close()
+
+
+def save_in_process(backend, data_path, year, barrier, results):
+    # Runs in a child process. Both processes first save the same day from the same base, then a day
+    # at a time into their own year, so their writes interleave.
+    store = open_store(backend, data_path)
+    try:
+        barrier.wait()
+        conflicts = store.save_days({"2023-12-31": make_day([(str(year), 100)], [])}, {"2023-12-31": 0})
+        first = date(year, 1, 1).toordinal()
+        for offset in range(40):
+            store.save_days({date.fromordinal(first + offset).isoformat(): make_day([(str(year), offset)], [])})
+        results.put((year, conflicts))
+    finally:
+        store.close()
+
+
+class PersistenceWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = open_store("json", Path(self.temp_dir.name) / "data.json")
+        self.broken = {"2024-01-01"}  # Dates the store refuses to write
+        save_days = self.store.save_days
+
+        def failing_save_days(days, bases=None):
+            if self.broken & set(days):
+                raise OverflowError("Python int too large to convert to C long")
+            return save_days(days, bases)
+
+        self.store.save_days = failing_save_days
+        self.writer = PersistenceWriter(self.store)
+
+    def tearDown(self):
+        self.writer.close()
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def stored(self):
+        return sorted(self.store.load_days("0000-00-00", "9999-12-31"))
+
+    def test_a_failing_day_does_not_hold_back_later_saves(self):
+        self.writer.save_day("2024-01-01", make_day([("Bad", 100)], []))
+        self.writer.save_day("2024-01-02", make_day([("Good", 100)], []))
+        self.writer.flush()
+        self.assertEqual(self.stored(), ["2024-01-02"])
+
+        self.writer.save_day("2024-01-03", make_day([("Later", 100)], []))
+        self.writer.flush()
+        self.assertEqual(self.stored(), ["2024-01-02", "2024-01-03"])
+        self.assertEqual(list(self.writer.unsaved_days()), ["2024-01-01"])
+        self.assertFalse(self.writer.errors.empty())
+
+        # Once the store accepts it, the failed day goes out with the next save
+        self.broken.clear()
+        self.writer.save_day("2024-01-04", make_day([("Fixed", 100)], []))
+        self.writer.flush()
+        self.assertEqual(self.stored(), ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04"])
+        self.assertEqual(self.writer.unsaved_days(), {})
+
+    def test_saves_of_one_day_end_at_the_latest(self):
+        self.writer.save_day("2024-02-01", make_day([("First", 100)], []))
+        self.writer.save_day("2024-02-01", make_day([("Second", 200)], [], 2))
+        self.writer.flush()
+        self.assertEqual(self.store.load_day("2024-02-01"), make_day([("Second", 200)], [], 2))
+        self.assertEqual(self.writer.unsaved_days(), {})
+        self.assertTrue(self.writer.conflicts.empty())
+
+    def test_close_retries_failed_days(self):
+        self.writer.save_day("2024-01-01", make_day([("Bad", 100)], []))
+        self.writer.flush()
+        self.broken.clear()
+        self.writer.close()
+        self.assertEqual(self.stored(), ["2024-01-01"])
+        self.assertTrue(self.writer.conflicts.empty())
+
+
+class SharedStoreTest(unittest.TestCase):
+    def test_stale_save_is_a_conflict(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend), tempfile.TemporaryDirectory() as temp_dir:
+                first = open_store(backend, Path(temp_dir) / "data.json")
+                second = open_store(backend, Path(temp_dir) / "data.json")
+                try:
+                    self.assertEqual(first.save_days({"2024-03-01": make_day([("First", 100)], [])}), [])
+                    # second never saw version 1, so its edit from version 0 must not overwrite it
+                    self.assertEqual(second.save_days({"2024-03-01": make_day([("Second", 200)], [])}),
+                                     ["2024-03-01"])
+                    self.assertEqual(second.save_days({"2024-03-01": make_day([("Second", 200)], [], 2)}), [])
+                    self.assertEqual(first.save_days({"2024-03-01": make_day([("First", 300)], [], 2)}),
+                                     ["2024-03-01"])
+                    reopened = open_store(backend, Path(temp_dir) / "data.json")
+                    self.assertEqual(reopened.load_day("2024-03-01")["entries"], [("Second", 200)])
+                    reopened.close()
+                finally:
+                    first.close()
+                    second.close()
+
+    def test_two_processes_saving_at_once(self):
+        context = multiprocessing.get_context("spawn")
+        for backend in BACKENDS:
+            with self.subTest(backend=backend), tempfile.TemporaryDirectory() as temp_dir:
+                data_path = Path(temp_dir) / "data.json"
+                open_store(backend, data_path).close()
+                barrier = context.Barrier(2)
+                results = context.Queue()
+                processes = [context.Process(target=save_in_process, args=(backend, data_path, year, barrier, results))
+                             for year in (2024, 2025)]
+                for process in processes:
+                    process.start()
+                conflicts = dict(results.get(timeout=60) for _ in processes)
+                for process in processes:
+                    process.join(60)
+                    self.assertEqual(process.exitcode, 0)
+
+                # Exactly one process won the shared day; every other day from both landed
+                self.assertEqual(sorted(len(dates) for dates in conflicts.values()), [0, 1])
+                store = open_store(backend, data_path)
+                try:
+                    days = store.load_days("0000-00-00", "9999-12-31")
+                    self.assertEqual(len(days), 81)
+                    winner = next(year for year, dates in conflicts.items() if not dates)
+                    self.assertEqual(days["2023-12-31"]["entries"], [(str(winner), 100)])
+                finally:
+                    store.close()
+
+
+class RangeIndexTest(unittest.TestCase):
+    def test_updates_match_a_rebuilt_index(self):
+        rng = random.Random(7)
+        days = {f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}": (rng.randint(0, 5000), rng.randint(0, 5000))
+                for _ in range(50)}
+        index = RangeIndex((date_str, *days[date_str]) for date_str in sorted(days))
+        rollups = Rollups((date_str, *days[date_str]) for date_str in sorted(days))
+        # Appends, edits of existing days and inserts before them
+        for date_str in ("2025-01-01", "2023-12-31", *sorted(days)[::7], "2024-06-15"):
+            days[date_str] = (rng.randint(0, 5000), rng.randint(0, 5000))
+            index.update(date_str, *days[date_str])
+            rollups.update(date_str, *days[date_str])
+
+        rows = [(date_str, *days[date_str]) for date_str in sorted(days)]
+        rebuilt = RangeIndex(rows)
+        rebuilt_rollups = Rollups(rows)
+        self.assertEqual(index.rows("0000-00-00", "9999-12-31"), rows)
+        for _ in range(200):
+            start, end = sorted(rng.sample(sorted(days) + ["2024-07-04", "2026-01-01"], 2))
+            self.assertEqual(index.totals(start, end), rebuilt.totals(start, end))
+        self.assertEqual(rollups.months, rebuilt_rollups.months)
+        self.assertEqual(rollups.years, rebuilt_rollups.years)
+
+    def test_totals_and_extremes(self):
+        index = RangeIndex([("2024-01-05", 100, 10), ("2024-01-10", 200, 20), ("2024-02-01", 300, 30)])
+        self.assertEqual(index.totals("2024-01-06", "2024-01-31"), (200, 20, 1))
+        self.assertEqual(index.totals("2024-01-01", "2024-12-31"), (600, 60, 3))
+        self.assertEqual(index.totals("2024-03-01", "2024-03-31"), (0, 0, 0))
+
+        rollups = Rollups([("2024-01-05", 100, 10), ("2024-01-10", 200, 500), ("2024-02-01", 300, 30)])
+        self.assertEqual(rollups.month(2024, 1), {"income": 300, "expenses": 510, "net": -210, "days": 2,
+                                                  "min_day": ("2024-01-10", -300), "max_day": ("2024-01-05", 90)})
+        self.assertEqual(rollups.year(2024)["max_day"], ("2024-02-01", 270))
+        self.assertEqual(rollups.month(2024, 3)["days"], 0)
+        rollups.update("2024-01-10", 200, 0)
+        self.assertEqual(rollups.year(2024)["min_day"], ("2024-01-05", 90))
+
+
+class RecurrenceRuleTest(unittest.TestCase):
+    def test_monthly_rules_keep_the_day_or_end_of_month(self):
+        rule = RecurrenceRule("expenses", "Rent", 500000, "2024-01-31")
+        self.assertEqual(list(rule.dates("2024-01-01", "2024-05-31")),
+                         ["2024-01-31", "2024-02-29", "2024-03-31", "2024-04-30", "2024-05-31"])
+
+    def test_counts_match_the_occurrences(self):
+        rules = [
+            RecurrenceRule("income", "Salary", 100, "2024-01-15", "month", 2, "2025-03-01"),
+            RecurrenceRule("expenses", "Gas", 100, "2024-02-29", "month", 12),
+            RecurrenceRule("expenses", "Parking", 100, "2024-01-03", "week", 2),
+            RecurrenceRule("expenses", "Load", 100, "2024-01-01", "day", 3, "2024-06-30"),
+        ]
+        rng = random.Random(11)
+        first = date(2023, 11, 1).toordinal()
+        for rule in rules:
+            walked = []
+            number = 0
+            last_day = min(date(2030, 1, 1), rule.end or date.max)
+            while rule.occurrence(number) <= last_day:
+                walked.append(rule.occurrence(number).isoformat())
+                number += 1
+            for _ in range(100):
+                start, end = sorted(date.fromordinal(first + rng.randint(0, 800)).isoformat() for _ in range(2))
+                with self.subTest(rule=rule.label, start=start, end=end):
+                    expected = [date_str for date_str in walked if start <= date_str <= end]
+                    self.assertEqual(list(rule.dates(start, end)), expected)
+                    self.assertEqual(rule.count(start, end), len(expected))
+
+    def test_round_trips_and_rejects_bad_rules(self):
+        rule = RecurrenceRule("income", "Allowance", 25050, "2024-03-01", "week", 2, "2024-12-31")
+        copy = RecurrenceRule.from_json(json.loads(json.dumps(rule.to_json())))
+        self.assertEqual(copy.to_json(), rule.to_json())
+        for args in (("savings", "x", 1, "2024-01-01"), ("income", "x", 1, "2024-01-01", "year"),
+                     ("income", "x", 1, "2024-01-01", "day", 0)):
+            with self.assertRaises(ValueError):
+                RecurrenceRule(*args)
+
+
+class LabelIndexTest(unittest.TestCase):
+    def test_search_matches_every_word_as_a_prefix(self):
+        index = LabelIndex()
+        index.update_day("2024-01-01", make_day([("Juan Dela Cruz", 100), ("Ana", 50)], [("Gas station", 50)]))
+        index.update_day("2024-01-02", make_day([("Juana", 200)], []))
+        self.assertEqual(index.search("jua"), [("2024-01-02", "income", 0), ("2024-01-01", "income", 0)])
+        self.assertEqual(index.search("CRUZ juan"), [("2024-01-01", "income", 0)])
+        self.assertEqual(index.search("gas"), [("2024-01-01", "expense", 0)])
+        self.assertEqual(index.search("jua", limit=1), [("2024-01-02", "income", 0)])
+        self.assertEqual(index.search("nobody"), [])
+
+        index.update_day("2024-01-01", make_day([("Pedro", 100)], [], 2))
+        self.assertEqual(index.search("cruz"), [])
+        self.assertEqual(index.search("pedro"), [("2024-01-01", "income", 0)])
+        index.update_day("2024-01-02", None)
+        self.assertEqual(index.search("jua"), [])
+        self.assertEqual(index.versions, {"2024-01-01": 2})
+
+    def test_saved_index_catches_up_with_days_changed_elsewhere(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend), tempfile.TemporaryDirectory() as temp_dir:
+                data_path = Path(temp_dir) / "data.json"
+                ledger = Ledger(backend, data_path)
+                ledger.save_day("2024-01-01", [("Juan", 100)], [])
+                ledger.save_day("2024-01-02", [("Juan", 300)], [])
+                self.assertEqual(len(ledger.search("juan")), 2)
+                ledger.close()
+
+                # Another process edits a day after the index was saved
+                store = open_store(backend, data_path)
+                store.save_day("2024-01-01", make_day([("Pedro", 100)], [], 2))
+                store.close()
+
+                ledger = Ledger(backend, data_path)
+                try:
+                    self.assertEqual(ledger.search("juan"), [("2024-01-02", "income", "Juan", 300)])
+                    self.assertEqual(ledger.search("pedro"), [("2024-01-01", "income", "Pedro", 100)])
+                finally:
+                    ledger.close()
+
+
+class CommandLogTest(unittest.TestCase):
+    def test_undo_and_redo(self):
+        rows = [("A", 100)]
+        log = CommandLog()
+        log.add(rows, ("B", 200), 1)
+        log.edit(rows, 0, ("A", 150))
+        log.delete(rows, 1)
+        self.assertEqual(rows, [("A", 150)])
+        self.assertTrue(log.undo(rows))
+        self.assertTrue(log.undo(rows))
+        self.assertEqual(rows, [("A", 100), ("B", 200)])
+        self.assertTrue(log.redo(rows))
+        self.assertEqual(rows, [("A", 150), ("B", 200)])
+
+        # The log survives a round trip through the history file
+        saved = json.loads(json.dumps(log.to_json()))
+        log = CommandLog(undo=saved["undo"], redo=saved["redo"])
+        self.assertTrue(log.redo(rows))
+        self.assertEqual(rows, [("A", 150)])
+        self.assertFalse(log.redo(rows))
+        while log.undo(rows):
+            pass
+        self.assertEqual(rows, [("A", 100)])
+
+        # A new change drops what could have been redone
+        log.add(rows, ("C", 1))
+        self.assertFalse(log.redo(rows))
+        self.assertEqual(rows, [("C", 1), ("A", 100)])
+
+    def test_rows_changed_behind_the_log_clear_it(self):
+        rows = [("A", 100)]
+        log = CommandLog()
+        log.edit(rows, 0, ("A", 150))
+        rows[0] = ("A", 175)
+        self.assertFalse(log.undo(rows))
+        self.assertEqual(rows, [("A", 175)])
+        self.assertEqual((len(log.undo_log), len(log.redo_log)), (0, 0))
+
+    def test_history_is_bounded(self):
+        rows = []
+        log = CommandLog(limit=3)
+        for number in range(5):
+            log.add(rows, (str(number), number))
+        while log.undo(rows):
+            pass
+        self.assertEqual(rows, [("1", 1), ("0", 0)])
+
+
+class RecurringTotalsTest(unittest.TestCase):
+    def test_every_query_counts_recurring_entries(self):
+        # One ₱100 sale on March 5 and a weekly ₱50 rent from March 1: five rent days in March
+        for backend in BACKENDS:
+            with self.subTest(backend=backend), tempfile.TemporaryDirectory() as temp_dir:
+                ledger = Ledger(backend, Path(temp_dir) / "data.json")
+                try:
+                    ledger.save_day("2024-03-05", [("Sale", 10000)], [])
+                    ledger.add_rule(RecurrenceRule("expenses", "Rent", 5000, "2024-03-01", "week"))
+                    start, end = "2024-03-01", "2024-03-31"
+
+                    self.assertEqual(ledger.range_totals(start, end), (10000, 25000, 6))
+                    month = ledger.month_totals(2024, 3)
+                    self.assertEqual((month["income"], month["expenses"], month["net"], month["days"]),
+                                     (10000, 25000, -15000, 6))
+                    self.assertEqual(ledger.year_rollups(2024).month(2024, 3), month)
+                    self.assertEqual(ledger.year_rollups(2024).year(2024)["expenses"], 5000 * 44)
+                    self.assertEqual(range_analytics(ledger, start, end)["total_net"], -15000)
+                    heatmap = daily_totals(ledger, start, end)
+                    self.assertEqual((sum(heatmap["income"]), sum(heatmap["expenses"]), sum(heatmap["logged"])),
+                                     (10000, 25000, 6))
+                    self.assertEqual(heatmap["expenses"][0], 5000)
+                    rows = list(iter_entries(ledger, start, end))
+                    self.assertEqual(len(rows), 6)
+                    self.assertEqual(sum(amount if kind == "income" else -amount for _, kind, _, amount in rows), -150)
+                    self.assertEqual(rows[0], ("2024-03-01", "expense", "Rent", 50.0))
+                finally:
+                    ledger.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from money_rider import make_day, open_store
+from money_rider_sync import SyncServer, send, sync_store
+
+TOKEN = "secret"
+
+
+class SyncServerTest(unittest.IsolatedAsyncioTestCase):
+    # Runs a real server on a free local port against throwaway data files
+
+    async def asyncSetUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.stores = []
+        self.paths = {}  # store -> its data file, which names the sync state next to it
+        self.server_store = self.open("server")
+        self.server = await SyncServer(self.server_store, self.root / "server.server.json", TOKEN).start("127.0.0.1", 0)
+        self.address = "127.0.0.1:%d" % self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for store in self.stores:
+            store.close()
+        self.temp_dir.cleanup()
+
+    def open(self, name, backend="json"):
+        (self.root / name).mkdir()
+        store = open_store(backend, self.root / name / "data.json")
+        self.stores.append(store)
+        self.paths[store] = self.root / name / "data.json"
+        return store
+
+    async def sync(self, store):
+        return await sync_store(store, self.paths[store], self.address, TOKEN)
+
+    async def request(self, message):
+        reader, writer = await asyncio.open_connection(*self.address.split(":"))
+        try:
+            return await send(reader, writer, {"token": TOKEN, **message})
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def test_push_pull_and_idle_resync(self):
+        phone = self.open("phone")
+        phone.save_days({
+            "2024-03-01": make_day([("Customer 1", 50000)], [("Gas", 10000)]),
+            "2024-03-02": make_day([("Customer 2", 25000)], []),
+        })
+        result = await self.sync(phone)
+        self.assertEqual(sorted(result["pushed"]), ["2024-03-01", "2024-03-02"])
+
+        for backend in ("json", "sqlite", "sharded", "binary", "snapshots"):
+            with self.subTest(backend=backend):
+                laptop = self.open(f"laptop-{backend}", backend)
+                result = await self.sync(laptop)
+                self.assertEqual(sorted(result["pulled"]), ["2024-03-01", "2024-03-02"])
+                self.assertEqual(laptop.load_day("2024-03-01")["entries"], [("Customer 1", 50000)])
+                self.assertEqual(await self.sync(laptop), {"pushed": [], "pulled": [], "conflicts": []})
+        self.assertEqual(await self.sync(phone), {"pushed": [], "pulled": [], "conflicts": []})
+
+    async def test_conflict_keeps_the_server_version(self):
+        phone = self.open("phone")
+        laptop = self.open("laptop")
+        phone.save_days({"2024-03-01": make_day([("Customer 1", 50000)], [])})
+        await self.sync(phone)
+        await self.sync(laptop)
+
+        # Both edit the same day; the laptop reaches the server first
+        laptop.save_days({"2024-03-01": make_day([("Customer 1", 50000), ("Laptop", 100)], [], 2)})
+        phone.save_days({"2024-03-01": make_day([("Phone", 200)], [], 2)})
+        await self.sync(laptop)
+        result = await self.sync(phone)
+
+        self.assertEqual(result["conflicts"], ["2024-03-01"])
+        self.assertEqual(phone.load_day("2024-03-01")["entries"], [("Customer 1", 50000), ("Laptop", 100)])
+        lost = json.loads(self.paths[phone].with_suffix(".conflicts.jsonl").read_text(encoding="utf-8"))
+        self.assertEqual(lost["local"]["entries"], [["Phone", 200]])
+        self.assertEqual(await self.sync(phone), {"pushed": [], "pulled": [], "conflicts": []})
+
+    async def test_rejects_bad_requests(self):
+        day = {"income": 999999, "expenses": 0, "entries": [["Customer 1", 500]], "expense_entries": []}
+        for key in ("../../pwned-x", "garbage", "2024-02-30"):
+            with self.assertRaises(ConnectionError):
+                await self.request({"op": "sync", "days": {key: {"base": 0, "day": day}}})
+        for entries in ([[1, 500]], [["Customer 1", 10 ** 30]], [["Customer 1", 5.5]], [["Customer 1", True]],
+                        [["Customer 1"]], [["Customer 1", 500, "extra"]], "Customer 1", [None]):
+            with self.subTest(entries=entries), self.assertRaises(ConnectionError):
+                await self.request({"op": "sync", "days": {"2024-03-01": {"base": 0, "day": {**day, "entries": entries}}}})
+        with self.assertRaises(ConnectionError):
+            await self.request({"op": "sync", "days": {"2024-03-01": {"base": 0, "day": []}}})
+        with self.assertRaises(ConnectionError):
+            await self.request({"op": "hello", "token": "wrong"})
+        self.assertEqual(self.server_store.load_days("0000-00-00", "9999-12-31"), {})
+
+        # Totals are recomputed from the entries rather than taken from the device
+        await self.request({"op": "sync", "days": {"2024-03-01": {"base": 0, "day": day}}})
+        self.assertEqual(self.server_store.load_day("2024-03-01")["income"], 500)
+
+
+if __name__ == "__main__":
+    unittest.main()